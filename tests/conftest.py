@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Le cache (label) dei test finiscono nella cartella temporanea, non in ~/.cache."""
+    cache = tmp_path / "cache"
+    monkeypatch.setenv("VISUALEDIT_CACHE_DIR", str(cache))
+    monkeypatch.delenv("VISUALEDIT_ENCODER_PROFILE", raising=False)
+    return cache
+
+
+def make_image(path, size=(64, 48), color=None, mode="RGB", **save_args):
+    """Scrive un'immagine di prova; senza color i pixel sono un gradiente (utile per confronti)."""
+    if color is None:
+        image = Image.linear_gradient("L").resize(size).convert(mode)
+    else:
+        image = Image.new(mode, size, color)
+    image.save(path, **save_args)
+    return str(path)
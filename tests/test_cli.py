@@ -0,0 +1,68 @@
+import atexit
+import json
+import os
+
+import pytest
+from PIL import Image
+
+import visualedit_cli
+from conftest import make_image
+from visualedit_cli import main
+from visualedit_engine import logger
+
+
+@pytest.fixture(autouse=True)
+def cli_logging(monkeypatch, capsys):
+    """main() configura il logging su uno stderr catturato: a fine test il QueueListener
+    viene fermato (svuotando la coda) prima che capsys chiuda lo stream."""
+    listeners = []
+    setup_logging = visualedit_cli.setup_logging
+    monkeypatch.setattr(visualedit_cli, "setup_logging",
+                        lambda level=None: listeners.append(setup_logging(level)))
+    handlers, level, propagate = logger.handlers[:], logger.level, logger.propagate
+    yield
+    for listener in listeners:
+        listener.stop()
+        atexit.unregister(listener.stop)
+    logger.handlers[:] = handlers
+    logger.setLevel(level)
+    logger.propagate = propagate
+
+
+def run_cli(capsys, *argv):
+    code = main(["--jobs", "1", *argv])
+    events = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    return code, events
+
+
+def test_halve_emits_json_lines(tmp_path, capsys):
+    make_image(tmp_path / "a.png", size=(40, 20))
+    code, events = run_cli(capsys, "halve", str(tmp_path))
+    assert code == 0
+    assert [e["event"] for e in events] == ["start", "item", "finish"]
+    assert events[1]["ok"] and events[1]["result"] == [20, 10]
+    with Image.open(tmp_path / "a.png") as img:
+        assert img.size == (20, 10)
+
+
+def test_failed_items_exit_with_1(tmp_path, capsys):
+    make_image(tmp_path / "a.png", size=(1, 1))
+    code, events = run_cli(capsys, "halve", str(tmp_path))
+    assert code == 1
+    assert events[-1]["failed"] == 1
+
+
+def test_tile_writes_tiles(tmp_path, capsys):
+    make_image(tmp_path / "a.png", size=(90, 50))
+    code, events = run_cli(capsys, "tile", "--size", "50", "--overlap", "10", str(tmp_path / "a.png"))
+    assert code == 0
+    assert sorted(os.listdir(tmp_path)) == ["a.png", "a_T50_001.png", "a_T50_002.png"]
+
+
+@pytest.mark.parametrize("overlap", ["50", "60", "-1"])
+def test_tile_rejects_invalid_overlap(tmp_path, capsys, overlap):
+    make_image(tmp_path / "a.png")
+    with pytest.raises(SystemExit) as exc:
+        main(["tile", "--size", "50", "--overlap", overlap, str(tmp_path)])
+    assert exc.value.code == 2
+    assert "--overlap" in capsys.readouterr().err
@@ -0,0 +1,247 @@
+import os
+import socket
+
+import pytest
+from PIL import Image
+
+from conftest import make_image
+from visualedit_engine import (
+    EditJournal, grayscale_image_file, halve_image_file, label_path_for, rename_image_files,
+    transform_image_file,
+)
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = EditJournal(str(tmp_path / ".visualedit_undo"))
+    yield journal
+    journal.close()
+
+
+def pixels(path):
+    with Image.open(path) as img:
+        return img.size, img.convert("RGB").tobytes()
+
+
+def rotate_with_labels(journal, img, label, new_label_text):
+    with journal.recording("rotate", img, label, 90):
+        transform_image_file(img, 90)
+        with open(label, "w") as f:
+            f.write(new_label_text)
+
+
+def test_png_rotation_is_undone_with_the_inverse_transform(tmp_path, journal):
+    img = make_image(tmp_path / "a.png", size=(30, 40))
+    label = str(tmp_path / "a.txt")
+    with open(label, "w") as f:
+        f.write("0 0.2 0.5 0.1 0.3\n")
+    before = pixels(img)
+    rotate_with_labels(journal, img, label, "0 0.5 0.2 0.3 0.1\n")
+    entry = journal.peek_undo()
+    assert entry.image_op == ("transform", 90)
+    assert entry.size == 0  # nessuna copia dell'immagine
+    assert os.listdir(journal.snapshot_dir) == []
+
+    assert journal.undo(entry) is entry
+    assert pixels(img) == before
+    assert open(label).read() == "0 0.2 0.5 0.1 0.3\n"
+
+    journal.redo()
+    assert pixels(img)[0] == (40, 30)
+    assert open(label).read() == "0 0.5 0.2 0.3 0.1\n"
+
+
+@pytest.mark.parametrize("operation", [halve_image_file, grayscale_image_file])
+def test_lossy_edits_are_restored_from_snapshots(tmp_path, journal, operation):
+    img = make_image(tmp_path / "a.jpg", size=(40, 30), color=(200, 30, 30))
+    before = open(img, "rb").read()
+    with journal.recording("edit", img):
+        operation(img)
+    after = open(img, "rb").read()
+    assert journal.peek_undo().image_op[0] == "snapshot"
+
+    journal.undo()
+    assert open(img, "rb").read() == before
+    journal.redo()
+    assert open(img, "rb").read() == after
+
+
+def test_label_edits_store_only_a_diff(tmp_path, journal):
+    label = tmp_path / "a.txt"
+    label.write_text("0 0.1 0.1 0.1 0.1\n1 0.2 0.2 0.2 0.2\n")
+    with journal.recording("delete", label_path=str(label)):
+        label.write_text("0 0.1 0.1 0.1 0.1\n")
+    entry = journal.peek_undo()
+    assert entry.image_op is None
+    journal.undo()
+    assert label.read_text() == "0 0.1 0.1 0.1 0.1\n1 0.2 0.2 0.2 0.2\n"
+
+
+def test_deleted_and_created_label_files(tmp_path, journal):
+    label = tmp_path / "a.txt"
+    label.write_text("0 0.1 0.1 0.1 0.1\n")
+    with journal.recording("delete all", label_path=str(label)):
+        label.unlink()
+    journal.undo()
+    assert label.read_text() == "0 0.1 0.1 0.1 0.1\n"
+
+    new_label = tmp_path / "b.txt"
+    with journal.recording("new", label_path=str(new_label)):
+        new_label.write_text("2 0.5 0.5 0.1 0.1\n")
+    journal.undo()
+    assert not new_label.exists()
+
+
+def test_unchanged_or_failed_operations_are_not_recorded(tmp_path, journal):
+    img = make_image(tmp_path / "a.jpg")
+    label = tmp_path / "a.txt"
+    label.write_text("0 0.1 0.1 0.1 0.1\n")
+    with journal.recording("noop", label_path=str(label)):
+        pass
+    with pytest.raises(RuntimeError):
+        with journal.recording("fail", img):
+            raise RuntimeError("boom")
+    assert not journal.can_undo()
+    assert os.listdir(journal.snapshot_dir) == []
+
+
+def test_new_edit_clears_redo(tmp_path, journal):
+    label = tmp_path / "a.txt"
+    label.write_text("a\n")
+    with journal.recording("1", label_path=str(label)):
+        label.write_text("b\n")
+    journal.undo()
+    assert journal.can_redo()
+    with journal.recording("2", label_path=str(label)):
+        label.write_text("c\n")
+    assert not journal.can_redo()
+
+
+def test_undo_is_all_or_nothing_when_the_labels_changed(tmp_path, journal):
+    img = make_image(tmp_path / "a.png", size=(30, 40))
+    label = str(tmp_path / "a.txt")
+    with open(label, "w") as f:
+        f.write("0 0.2 0.5 0.1 0.3\n")
+    rotate_with_labels(journal, img, label, "0 0.5 0.2 0.3 0.1\n")
+    with open(label, "w") as f:
+        f.write("1 0.1 0.1 0.1 0.1\n")  # modificato fuori dal journal
+    rotated = pixels(img)
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            journal.undo()
+        assert pixels(img) == rotated
+        assert journal.can_undo() and not journal.can_redo()
+
+
+def test_undo_with_a_stale_expected_entry_fails(tmp_path, journal):
+    label = tmp_path / "a.txt"
+    label.write_text("a\n")
+    with journal.recording("1", label_path=str(label)):
+        label.write_text("b\n")
+    stale = journal.peek_undo()
+    with journal.recording("2", label_path=str(label)):
+        label.write_text("c\n")
+    with pytest.raises(RuntimeError):
+        journal.undo(stale)
+    assert label.read_text() == "c\n"
+
+
+def test_snapshots_are_bounded_by_size(tmp_path):
+    img = make_image(tmp_path / "a.jpg", size=(40, 30))
+    journal = EditJournal(str(tmp_path / ".visualedit_undo"), max_bytes=3 * os.path.getsize(img))
+    try:
+        for _ in range(3):
+            with journal.recording("halve", img):
+                halve_image_file(img)
+        # Ogni operazione tiene due copie: entra solo la più recente (e le più piccole)
+        assert 0 < journal.bytes_used <= journal.max_bytes
+        assert journal.peek_undo().description == "halve"
+        assert len(os.listdir(journal.snapshot_dir)) == 2 * len(journal._undo)
+        assert len(journal._undo) < 3
+    finally:
+        journal.close()
+    assert not os.path.exists(journal.snapshot_dir)
+
+
+def test_entries_are_bounded_by_count(tmp_path):
+    journal = EditJournal(str(tmp_path / ".visualedit_undo"), max_entries=2)
+    label = tmp_path / "a.txt"
+    try:
+        for text in ("a\n", "b\n", "c\n", "d\n"):
+            with journal.recording(text, label_path=str(label)):
+                label.write_text(text)
+        assert [journal.undo().description for _ in range(2)] == ["d\n", "c\n"]
+        assert journal.undo() is None
+        assert label.read_text() == "b\n"
+    finally:
+        journal.close()
+
+
+def test_paths_lists_the_touched_files(tmp_path, journal):
+    img = make_image(tmp_path / "a.png")
+    label = tmp_path / "a.txt"
+    label.write_text("")
+    rotate_with_labels(journal, img, str(label), "0 0.5 0.5 0.1 0.1\n")
+    assert EditJournal.paths(journal.peek_undo()) == (img, str(label))
+
+
+def test_sessions_on_the_same_dataset_keep_their_own_snapshots(tmp_path):
+    first = EditJournal.for_dataset(str(tmp_path / "data.yaml"))
+    img = make_image(tmp_path / "a.jpg")
+    before = open(img, "rb").read()
+    with first.recording("gray", img):
+        grayscale_image_file(img)
+
+    second = EditJournal.for_dataset(str(tmp_path / "data.yaml"))
+    assert second.snapshot_dir != first.snapshot_dir
+    second.close()
+    assert os.listdir(first.snapshot_dir)
+
+    first.undo()
+    assert open(img, "rb").read() == before
+    first.close()
+    assert not os.path.exists(first.journal_dir)
+
+
+def test_snapshots_of_dead_processes_are_removed(tmp_path):
+    journal_dir = tmp_path / ".visualedit_undo"
+    stale = journal_dir / f"session-999999999@{socket.gethostname()}-abcd1234"
+    other_host = journal_dir / "session-999999999@some-other-host-abcd1234"
+    legacy = journal_dir / "00000001_a.png"
+    for folder in (stale, other_host):
+        folder.mkdir(parents=True)
+    legacy.write_bytes(b"x")
+    journal = EditJournal(str(journal_dir))
+    try:
+        if os.name == "posix":
+            assert not stale.exists()
+        assert other_host.exists()
+        assert not legacy.exists()
+    finally:
+        journal.close()
+
+
+def test_renamed_files_are_followed(tmp_path, journal):
+    labels = tmp_path / "labels"
+    labels.mkdir()
+    img = make_image(tmp_path / "a.png", size=(30, 40))
+    label = label_path_for(img, str(labels))
+    with open(label, "w") as f:
+        f.write("0 0.2 0.5 0.1 0.3\n")
+    rotate_with_labels(journal, img, label, "0 0.5 0.2 0.3 0.1\n")
+    edited = label_path_for(img, str(labels))
+    with journal.recording("label", label_path=edited):
+        with open(edited, "a") as f:
+            f.write("1 0.5 0.5 0.1 0.1\n")
+
+    new_img = str(tmp_path / "a_x.png")
+    rename_image_files(img, new_img, str(labels))
+    journal.rename_paths({img: new_img, label: label_path_for(new_img, str(labels))})
+
+    journal.undo()
+    journal.undo()
+    assert pixels(new_img)[0] == (30, 40)
+    with open(label_path_for(new_img, str(labels))) as f:
+        assert f.read() == "0 0.2 0.5 0.1 0.3\n"
+    assert not os.path.exists(img) and not os.path.exists(label)
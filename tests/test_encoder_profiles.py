@@ -0,0 +1,89 @@
+import io
+
+import pytest
+from PIL import Image
+
+from conftest import make_image
+from visualedit_engine import (
+    ENCODER_PROFILES, atomic_save, benchmark_encoder_profiles, encode_image, encoder_profile, save_params,
+)
+
+
+def test_encoder_profile_default_env_and_argument(monkeypatch):
+    assert encoder_profile() == "balanced"
+    monkeypatch.setenv("VISUALEDIT_ENCODER_PROFILE", "fast")
+    assert encoder_profile() == "fast"
+    assert encoder_profile("archival") == "archival"
+
+
+def test_encoder_profile_rejects_unknown_names():
+    with pytest.raises(ValueError):
+        encoder_profile("tiny")
+
+
+def test_save_params_returns_a_copy():
+    params = save_params("JPEG", "fast")
+    params["quality"] = 1
+    assert ENCODER_PROFILES["fast"]["JPEG"]["quality"] == 85
+    assert save_params("GIF", "fast") == {}
+
+
+@pytest.mark.parametrize("profile", list(ENCODER_PROFILES))
+@pytest.mark.parametrize("ext, image_format", [(".png", "PNG"), (".jpg", "JPEG"), (".webp", "WEBP")])
+def test_every_profile_writes_a_readable_image(tmp_path, profile, ext, image_format):
+    path = str(tmp_path / ("a" + ext))
+    atomic_save(Image.linear_gradient("L").convert("RGB"), path, profile=profile)
+    with Image.open(path) as img:
+        assert img.format == image_format
+        assert img.size == (256, 256)
+
+
+def test_png_profiles_are_lossless(tmp_path):
+    source = Image.linear_gradient("L").convert("RGB")
+    for profile in ENCODER_PROFILES:
+        path = str(tmp_path / f"{profile}.png")
+        atomic_save(source, path, profile=profile)
+        with Image.open(path) as img:
+            assert img.convert("RGB").tobytes() == source.tobytes()
+
+
+def test_archival_webp_is_lossless(tmp_path):
+    source = Image.effect_noise((64, 64), 50).convert("RGB")
+    path = str(tmp_path / "a.webp")
+    atomic_save(source, path, profile="archival")
+    with Image.open(path) as img:
+        assert img.convert("RGB").tobytes() == source.tobytes()
+
+
+def test_explicit_params_override_the_profile(tmp_path):
+    source = Image.effect_noise((128, 128), 80).convert("RGB")
+    low, high = str(tmp_path / "low.jpg"), str(tmp_path / "high.jpg")
+    atomic_save(source, low, profile="archival", quality=10)
+    atomic_save(source, high, profile="archival")
+    assert len(open(low, "rb").read()) < len(open(high, "rb").read())
+
+
+def test_encode_image_retries_jpeg_without_optimize(monkeypatch):
+    calls = []
+    real_save = Image.Image.save
+
+    def flaky_save(self, fp, format=None, **params):
+        calls.append(params.get("optimize"))
+        if params.get("optimize"):
+            raise OSError("broken data stream")
+        return real_save(self, fp, format=format, **params)
+
+    monkeypatch.setattr(Image.Image, "save", flaky_save)
+    buffer = io.BytesIO()
+    encode_image(Image.new("RGB", (8, 8)), buffer, "JPEG", save_params("JPEG", "archival"))
+    assert calls == [True, False]
+    assert buffer.getvalue().startswith(b"\xff\xd8")
+
+
+def test_benchmark_reports_every_profile_and_format(tmp_path):
+    paths = [make_image(tmp_path / f"{i}.png", size=(32, 32)) for i in range(2)]
+    rows = benchmark_encoder_profiles(paths, formats=("PNG", "JPEG"))
+    assert [(r["profile"], r["format"]) for r in rows] == [
+        (p, f) for p in ENCODER_PROFILES for f in ("PNG", "JPEG")]
+    assert all(r["images"] == 2 and r["ratio"] > 0 for r in rows)
+    assert benchmark_encoder_profiles([]) == []
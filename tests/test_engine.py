@@ -0,0 +1,359 @@
+import json
+import os
+import stat
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import visualedit_engine
+from conftest import make_image
+from visualedit_engine import (
+    DirectoryIndex, ImageMetadataIndex, LabelCache, YoloAnnotations, atomic_save, box_visibility,
+    detect_label_format, halve_image_file, parse_yolo_text, run_parallel, split_annotations, tile_grid,
+    tile_image_file,
+)
+
+
+def file_mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+# ------------------ tile_grid ------------------
+def test_tile_grid_without_overlap_is_the_classic_grid():
+    assert tile_grid(100, 60, 50) == [(0, 0, 50, 50), (50, 0, 100, 50), (0, 50, 50, 60), (50, 50, 100, 60)]
+
+
+def test_tile_grid_with_overlap_covers_the_image_once_per_stride():
+    tiles = tile_grid(90, 50, 50, overlap=10)
+    assert tiles == [(0, 0, 50, 50), (40, 0, 90, 50)]
+    assert tile_grid(100, 50, 50, overlap=10)[-1] == (80, 0, 100, 50)
+
+
+@pytest.mark.parametrize("tile_size, overlap", [(50, 50), (50, 60), (50, -1), (0, 0)])
+def test_tile_grid_rejects_invalid_overlap(tile_size, overlap):
+    with pytest.raises(ValueError):
+        tile_grid(100, 100, tile_size, overlap)
+
+
+def test_tile_image_file_writes_tiles_and_their_labels(tmp_path):
+    img = make_image(tmp_path / "a.png", size=(100, 50))
+    label = tmp_path / "a.txt"
+    label.write_text("0 0.25 0.5 0.2 0.4\n")
+    out_labels = tmp_path / "labels"
+    created, labels_written = tile_image_file(img, 50, 0, str(label), str(out_labels), skip_empty=True)
+    assert [os.path.basename(p) for p in created] == ["a_T50_001.png"]
+    assert labels_written == 1
+    with Image.open(created[0]) as tile:
+        assert tile.size == (50, 50)
+
+
+# ------------------ box_visibility / split_annotations ------------------
+def rows(annotations):
+    return np.array(list(annotations), dtype=np.float64).reshape(-1, 5)
+
+
+def test_box_straddling_two_tiles_is_split_and_renormalized():
+    # 100x50, box da x=40 a x=60 e da y=15 a y=35: metà in ogni tile
+    boxes = YoloAnnotations.from_tuples([(3, 0.5, 0.5, 0.2, 0.4)])
+    tiles = tile_grid(100, 50, 50)
+    np.testing.assert_allclose(box_visibility(boxes, (100, 50), tiles), [[0.5], [0.5]])
+    left, right = split_annotations(boxes, (100, 50), tiles)
+    np.testing.assert_allclose(rows(left), [[3, 0.9, 0.5, 0.2, 0.4]])
+    np.testing.assert_allclose(rows(right), [[3, 0.1, 0.5, 0.2, 0.4]])
+
+
+def test_boxes_below_min_visibility_are_dropped():
+    # Box da x=36 a x=56: 70% nel primo tile, 30% nel secondo
+    boxes = YoloAnnotations.from_tuples([(0, 0.46, 0.5, 0.2, 0.4), (1, 0.9, 0.5, 0.1, 0.1)])
+    tiles = tile_grid(100, 50, 50)
+    np.testing.assert_allclose(box_visibility(boxes, (100, 50), tiles), [[0.7, 0], [0.3, 1]])
+    left, right = split_annotations(boxes, (100, 50), tiles, min_visibility=0.5)
+    np.testing.assert_allclose(rows(left), [[0, 0.86, 0.5, 0.28, 0.4]])
+    np.testing.assert_allclose(rows(right), [[1, 0.8, 0.5, 0.2, 0.1]])
+
+
+def test_box_in_the_overlap_goes_to_both_tiles():
+    # Tile (0, 50) e (40, 90); box da x=42 a x=48, interamente nella sovrapposizione
+    boxes = YoloAnnotations.from_tuples([(2, 0.5, 0.5, 6 / 90, 0.2)])
+    tiles = tile_grid(90, 50, 50, overlap=10)
+    np.testing.assert_allclose(box_visibility(boxes, (90, 50), tiles), [[1], [1]])
+    first, second = split_annotations(boxes, (90, 50), tiles, min_visibility=1.0)
+    np.testing.assert_allclose(rows(first), [[2, 0.9, 0.5, 0.12, 0.2]])
+    np.testing.assert_allclose(rows(second), [[2, 0.1, 0.5, 0.12, 0.2]])
+
+
+def test_split_annotations_with_explicit_keep_and_no_boxes():
+    boxes = YoloAnnotations.from_tuples([(0, 0.5, 0.5, 0.2, 0.4)])
+    tiles = tile_grid(100, 50, 50)
+    left, right = split_annotations(boxes, (100, 50), tiles, keep=np.array([[False], [True]]))
+    assert len(left) == 0 and len(right) == 1
+    assert [len(a) for a in split_annotations(YoloAnnotations(), (100, 50), tiles)] == [0, 0]
+    assert box_visibility(YoloAnnotations(), (100, 50), tiles).shape == (2, 0)
+
+
+# ------------------ parse_yolo_text ------------------
+def test_parse_yolo_text_bulk():
+    rows = parse_yolo_text("0 0.5 0.5 0.1 0.2\n\n1 0.1 0.2 0.3 0.4\n")
+    np.testing.assert_allclose(rows, [[0, 0.5, 0.5, 0.1, 0.2], [1, 0.1, 0.2, 0.3, 0.4]])
+
+
+def test_parse_yolo_text_skips_lines_with_wrong_token_counts():
+    # 4 + 6 token = 2 righe da 5 in totale: non devono diventare due box
+    rows = parse_yolo_text("0 0.5 0.5 0.1 0.2\n1 0.1 0.2 0.3\n2 0.1 0.2 0.3 0.4 0.9\n")
+    np.testing.assert_allclose(rows, [[0, 0.5, 0.5, 0.1, 0.2]])
+
+
+def test_parse_yolo_text_empty():
+    assert parse_yolo_text("  \n").shape == (0, 5)
+
+
+# ------------------ LabelCache ------------------
+def test_label_cache_stays_out_of_the_labels_folder(tmp_path, isolated_cache):
+    labels = tmp_path / "labels"
+    labels.mkdir()
+    (labels / "a.txt").write_text("0 0.5 0.5 0.1 0.2\n")
+    cache = LabelCache(str(labels)).update()
+    assert os.listdir(labels) == ["a.txt"]
+    assert cache.cache_path.startswith(str(isolated_cache))
+    reloaded = LabelCache(str(labels)).load()
+    np.testing.assert_allclose(reloaded.get_rows("a.txt"), [[0, 0.5, 0.5, 0.1, 0.2]])
+
+
+# ------------------ ImageMetadataIndex ------------------
+def test_metadata_index_persists_and_survives_close(tmp_path):
+    path = make_image(tmp_path / "a.png", size=(30, 20))
+    index = ImageMetadataIndex.for_dataset(str(tmp_path / "data.yaml"))
+    assert index.db_path == ImageMetadataIndex.path_for(str(tmp_path / "data.yaml"))
+    assert index.size(path) == (30, 20)
+    index.close()
+    assert index.size(path) == (30, 20)  # servito dal dict, senza database
+    index.forget([path])
+    index.close()
+
+    reopened = ImageMetadataIndex(index.db_path)
+    assert os.path.abspath(path) in reopened._rows
+    reopened.close()
+
+
+# ------------------ detect_label_format ------------------
+def test_detect_label_format_yolo_folder(tmp_path):
+    (tmp_path / "a.txt").write_text("")
+    assert detect_label_format(str(tmp_path)) == "YOLO"
+
+
+def test_detect_label_format_coco_file_and_folder(tmp_path):
+    coco = tmp_path / "annotations.json"
+    coco.write_text(json.dumps({"images": [], "annotations": [], "categories": []}))
+    assert detect_label_format(str(coco)) == "COCO"
+    assert detect_label_format(str(tmp_path)) == "COCO"
+
+
+def test_detect_label_format_single_per_image_json_is_not_coco(tmp_path):
+    (tmp_path / "a.json").write_text(json.dumps(
+        {"image": "a.png", "width": 10, "height": 10,
+         "annotations": [{"class_id": 0, "class_name": "x", "bbox": [1, 1, 2, 2]}]}))
+    assert detect_label_format(str(tmp_path)) == "JSON"
+
+
+# ------------------ atomic_save ------------------
+def test_atomic_save_keeps_the_mode_of_the_replaced_file(tmp_path):
+    path = make_image(tmp_path / "a.png")
+    os.chmod(path, 0o644)
+    halve_image_file(path)
+    assert file_mode(path) == 0o644
+    os.chmod(path, 0o640)
+    atomic_save(Image.new("RGB", (4, 4)), path)
+    assert file_mode(path) == 0o640
+
+
+@pytest.mark.parametrize("umask, mode", [(0o022, 0o644), (0o027, 0o640), (0o077, 0o600)])
+def test_atomic_save_new_file_follows_umask(tmp_path, monkeypatch, umask, mode):
+    # L'umask viene letto una volta all'import (cambiarlo non è thread-safe)
+    monkeypatch.setattr(visualedit_engine, "_UMASK", umask)
+    path = str(tmp_path / "new.png")
+    atomic_save(Image.new("RGB", (4, 4)), path)
+    assert file_mode(path) == mode
+
+
+def test_atomic_save_failure_leaves_the_original_untouched(tmp_path):
+    path = make_image(tmp_path / "a.png", color="red")
+    before = open(path, "rb").read()
+    with pytest.raises(Exception):
+        atomic_save(Image.new("RGB", (4, 4)), path, format="NOPE")
+    assert open(path, "rb").read() == before
+    assert os.listdir(tmp_path) == ["a.png"]
+
+
+# ------------------ run_parallel ------------------
+def test_run_parallel_reports_results_and_errors():
+    def work(x):
+        if x == 3:
+            raise ValueError("three")
+        return x * 10
+
+    results = {item: (result, error) for item, result, error in
+               run_parallel(work, range(6), workers=2, process=False)}
+    assert {k: v[0] for k, v in results.items() if k != 3} == {0: 0, 1: 10, 2: 20, 4: 40, 5: 50}
+    assert isinstance(results[3][1], ValueError)
+
+
+def test_run_parallel_in_processes(tmp_path):
+    paths = [make_image(tmp_path / f"{i}.png", size=(20, 10)) for i in range(3)]
+    results = {item: result for item, result, error in
+               run_parallel(halve_image_file, paths, workers=2, process=True)}
+    assert results == {p: (10, 5) for p in paths}
+
+
+def test_run_parallel_stops_submitting_when_cancelled():
+    cancelled = threading.Event()
+    seen = []
+    for item, _, _ in run_parallel(lambda x: x, range(100), workers=1, process=False, cancelled=cancelled):
+        seen.append(item)
+        cancelled.set()
+    assert 1 <= len(seen) <= 2  # al più i job già in volo (2 per worker)
+
+
+# ------------------ SpatialGrid ------------------
+@pytest.fixture
+def spatial_grid():
+    # SpatialGrid sta nel modulo della GUI: serve solo che tkinter sia importabile
+    return pytest.importorskip("visualedit").SpatialGrid
+
+
+def test_query_point_prefers_the_smallest_then_the_topmost_box(spatial_grid):
+    grid = spatial_grid([(0, 0, 100, 100), (10, 10, 30, 30), (20, 20, 40, 40), (25, 25, 45, 45)], cell_size=16)
+    assert grid.query_point(5, 5) == 0
+    assert grid.query_point(15, 15) == 1
+    assert grid.query_point(28, 28) == 3  # 1, 2 e 3 hanno la stessa area: vince l'ultima disegnata
+    assert grid.query_point(150, 150) is None
+    assert grid.query_point(30, 30) == 3  # i bordi sono inclusi
+
+
+def test_query_rect_returns_only_contained_boxes(spatial_grid):
+    grid = spatial_grid([(10, 10, 20, 20), (30, 30, 50, 50), (15, 15, 60, 60), (80, 80, 90, 90)], cell_size=16)
+    assert grid.query_rect(0, 0, 55, 55) == [0, 1]
+    assert grid.query_rect(55, 55, 0, 0) == [0, 1]  # angoli in qualsiasi ordine
+    assert grid.query_rect(-1000, -1000, 1000, 1000) == [0, 1, 2, 3]  # più celle di quelle occupate
+    assert grid.query_rect(21, 21, 29, 29) == []
+
+
+def test_large_boxes_and_removal_keep_positions_in_sync(spatial_grid):
+    grid = spatial_grid(cell_size=1)
+    grid.insert((0, 0, 500, 500))  # oltre MAX_CELLS_PER_BOX: lista delle box grandi
+    grid.insert((40, 40, 30, 30))  # angoli invertiti
+    grid.insert((35, 35, 36, 36))
+    assert len(grid) == 3
+    assert grid.query_point(300, 300) == 0
+    assert grid.query_point(32, 32) == 1
+    grid.remove(1)
+    assert grid.query_point(32, 32) == 0
+    assert grid.query_point(35, 35) == 1
+    grid.remove(0)
+    assert grid.query_point(300, 300) is None
+    assert grid.query_rect(0, 0, 100, 100) == [0]
+
+
+def test_spatial_grid_matches_a_linear_scan(spatial_grid):
+    rng = np.random.default_rng(0)
+    corners = rng.integers(0, 400, size=(200, 2))
+    boxes = np.hstack([corners, corners + rng.integers(1, 80, size=(200, 2))]).tolist()
+    grid = spatial_grid(boxes)
+    for x, y in rng.integers(0, 480, size=(200, 2)).tolist():
+        inside = [i for i, (x1, y1, x2, y2) in enumerate(boxes) if x1 <= x <= x2 and y1 <= y <= y2]
+        expected = min(inside, key=lambda i: ((boxes[i][2] - boxes[i][0]) * (boxes[i][3] - boxes[i][1]), -i),
+                       default=None)
+        assert grid.query_point(x, y) == expected
+    x1, y1, x2, y2 = 100, 50, 300, 250
+    assert grid.query_rect(x1, y1, x2, y2) == [i for i, b in enumerate(boxes)
+                                               if x1 <= b[0] and y1 <= b[1] and b[2] <= x2 and b[3] <= y2]
+
+
+# ------------------ YoloAnnotations ------------------
+def test_rotation_moves_boxes_with_the_image():
+    boxes = YoloAnnotations.from_tuples([(1, 0.2, 0.3, 0.1, 0.4)])
+    np.testing.assert_allclose(rows(boxes.rotated(90)), [[1, 0.7, 0.2, 0.4, 0.1]])
+    np.testing.assert_allclose(rows(boxes.rotated(-90)), [[1, 0.3, 0.8, 0.4, 0.1]])
+    np.testing.assert_allclose(rows(boxes.rotated(90).rotated(-90)), rows(boxes))
+    np.testing.assert_allclose(rows(boxes.rotated(90).rotated(90).rotated(90).rotated(90)), rows(boxes))
+    with pytest.raises(ValueError):
+        boxes.rotated(180)
+
+
+def test_flip_mirrors_the_x_center():
+    boxes = YoloAnnotations.from_tuples([(0, 0.2, 0.3, 0.1, 0.4), (2, 0.5, 0.5, 1.0, 1.0)])
+    np.testing.assert_allclose(rows(boxes.flipped()), [[0, 0.8, 0.3, 0.1, 0.4], [2, 0.5, 0.5, 1.0, 1.0]])
+    np.testing.assert_allclose(rows(boxes.flipped().flipped()), rows(boxes))
+
+
+def test_clipped_trims_boxes_and_drops_those_outside():
+    boxes = YoloAnnotations.from_tuples([
+        (0, 0.5, 0.5, 0.2, 0.2),   # dentro: invariata
+        (1, 0.95, 0.5, 0.2, 0.2),  # esce a destra: x da 0.85 a 1.0
+        (2, 1.5, 0.5, 0.2, 0.2),   # fuori
+        (3, 0.5, 0.5, 0.0, 0.2),   # senza area
+    ])
+    np.testing.assert_allclose(rows(boxes.clipped()), [[0, 0.5, 0.5, 0.2, 0.2], [1, 0.925, 0.5, 0.15, 0.2]])
+    assert len(boxes) == 4  # i metodi restituiscono nuove annotazioni
+
+
+def test_annotations_text_and_pixel_round_trip(tmp_path):
+    boxes = YoloAnnotations.from_array([[0, 0.5, 0.5, 0.2, 0.4], [1, 0.25, 0.75, 0.1, 0.1]])
+    boxes.append(2, 0.1, 0.1, 0.2, 0.2)
+    boxes.delete([1])
+    assert [b[0] for b in boxes] == [0, 2]
+    np.testing.assert_array_equal(boxes.to_pixels(100, 50), [[40, 15, 60, 35], [0, 0, 20, 10]])
+    boxes.save(str(tmp_path / "a.txt"))
+    assert (tmp_path / "a.txt").read_text() == ("0 0.500000 0.500000 0.200000 0.400000\n"
+                                                "2 0.100000 0.100000 0.200000 0.200000\n")
+    np.testing.assert_allclose(rows(YoloAnnotations.load(str(tmp_path / "a.txt"))), rows(boxes))
+    assert YoloAnnotations().to_text() == ""
+    assert YoloAnnotations().to_pixels(10, 10).shape == (0, 4)
+
+
+# ------------------ DirectoryIndex ------------------
+def test_directory_index_scan_lists_only_images_sorted(tmp_path):
+    for name in ("b.png", "a.JPG", "c.webp"):
+        make_image(tmp_path / name, format="PNG")
+    (tmp_path / "notes.txt").write_text("")
+    (tmp_path / "sub.png").mkdir()
+    index = DirectoryIndex(str(tmp_path))
+    ops = index.scan()
+    expected = [str(tmp_path / n) for n in ("a.JPG", "b.png", "c.webp")]
+    assert index.paths == expected
+    assert [op[0] for op in ops] == ["insert"] * 3
+    assert index.scan() == []  # mtime della cartella invariato
+    assert index.position(expected[1]) == 1
+    assert index.position(str(tmp_path / "missing.png")) is None
+
+
+def test_directory_index_apply_returns_listbox_operations(tmp_path):
+    index = DirectoryIndex(str(tmp_path))
+    paths = [str(tmp_path / f"{name}.png") for name in "acef"]
+    index.apply(added=paths)
+    ops = index.apply(added=[str(tmp_path / "b.png"), str(tmp_path / "d.txt"), paths[0]],
+                      removed=[paths[1], paths[3], str(tmp_path / "missing.png")])
+    assert ops == [("remove", 3), ("remove", 1), ("insert", 1, str(tmp_path / "b.png"))]
+    assert index.paths == [paths[0], str(tmp_path / "b.png"), paths[2]]
+
+    # Ripetendo le operazioni su un elenco si ottiene lo stesso ordine dell'indice
+    listbox = [paths[0], paths[1], paths[2], paths[3]]
+    for op in ops:
+        if op[0] == "remove":
+            del listbox[op[1]]
+        else:
+            listbox.insert(op[1], op[2])
+    assert listbox == index.paths
+
+
+def test_directory_index_rescan_picks_up_changes(tmp_path):
+    make_image(tmp_path / "a.png")
+    make_image(tmp_path / "b.png")
+    index = DirectoryIndex(str(tmp_path))
+    index.scan()
+    os.rename(tmp_path / "a.png", tmp_path / "c.png")
+    ops = index.scan(force=True)
+    assert ops == [("remove", 0), ("insert", 1, str(tmp_path / "c.png"))]
+    assert index.paths == [str(tmp_path / "b.png"), str(tmp_path / "c.png")]
+    assert DirectoryIndex(str(tmp_path / "missing")).scan() == []
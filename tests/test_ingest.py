@@ -0,0 +1,87 @@
+import os
+
+import pytest
+from PIL import Image
+
+from conftest import make_image
+from visualedit_engine import ImageIngestor, ingest_image_file, is_up_to_date
+
+
+def jpeg_with_orientation(path, size, orientation):
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    return make_image(path, size=size, exif=exif.tobytes())
+
+
+def run(ingestor):
+    tasks = ingestor.plan()
+    done = []
+    ingestor.run(tasks, lambda *item: done.append(item))
+    return tasks, done
+
+
+def test_ingest_converts_every_image_and_skips_other_files(tmp_path):
+    source, output = tmp_path / "in", tmp_path / "out"
+    source.mkdir()
+    make_image(source / "a.jpg", size=(30, 20))
+    make_image(source / "b.webp", size=(30, 20))
+    (source / "notes.txt").write_text("x")
+    tasks, done = run(ImageIngestor(str(source), str(output), "PNG", workers=1))
+    assert len(tasks) == 2
+    assert all(error is None for _, _, error in done)
+    assert sorted(os.listdir(output)) == ["a.png", "b.png"]
+    with Image.open(output / "a.png") as img:
+        assert img.format == "PNG"
+
+
+def test_ingest_applies_exif_orientation(tmp_path):
+    source, output = tmp_path / "in", tmp_path / "out"
+    source.mkdir()
+    jpeg_with_orientation(source / "a.jpg", (30, 20), orientation=6)  # ruotata di 90°
+    run(ImageIngestor(str(source), str(output), "PNG", workers=1))
+    with Image.open(output / "a.png") as img:
+        assert img.size == (20, 30)
+
+
+def test_ingest_max_side_downscales(tmp_path):
+    source, output = tmp_path / "in", tmp_path / "out"
+    source.mkdir()
+    make_image(source / "a.png", size=(200, 100))
+    run(ImageIngestor(str(source), str(output), "JPEG", quality=80, max_side=50, workers=1))
+    with Image.open(output / "a.jpg") as img:
+        assert img.format == "JPEG"
+        assert max(img.size) == 50
+
+
+def test_ingest_skips_outputs_that_are_up_to_date(tmp_path):
+    source, output = tmp_path / "in", tmp_path / "out"
+    source.mkdir()
+    make_image(source / "a.png")
+    make_image(source / "b.png")
+    run(ImageIngestor(str(source), str(output), "WEBP", workers=1))
+
+    ingestor = ImageIngestor(str(source), str(output), "WEBP", workers=1)
+    assert ingestor.plan() == []
+    assert ingestor.skipped == 2
+
+    # Un originale più recente dell'output va riconvertito
+    stat = os.stat(output / "a.webp")
+    os.utime(source / "a.png", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert not is_up_to_date(str(source / "a.png"), str(output / "a.webp"))
+    tasks = ingestor.plan()
+    assert [os.path.basename(t[0]) for t in tasks] == ["a.png"]
+    assert ingestor.skipped == 1
+
+
+def test_ingest_reports_unreadable_files_as_errors(tmp_path):
+    broken = tmp_path / "broken.jpg"
+    broken.write_bytes(b"not an image")
+    input_file, output_file, error = ingest_image_file(
+        (str(broken), str(tmp_path / "broken.png"), "PNG", "fast", {}, None))
+    assert input_file == str(broken) and output_file is None and error
+    assert not (tmp_path / "broken.png").exists()
+
+
+def test_ingest_rejects_unknown_codecs(tmp_path):
+    with pytest.raises(ValueError):
+        ImageIngestor(str(tmp_path), str(tmp_path / "out"), "GIF")
@@ -0,0 +1,109 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from conftest import make_image
+from visualedit_engine import (
+    COCO_OUTPUT_NAME, CocoWriter, LabelConverter, detect_label_format, is_coco_file, read_yolo_file,
+)
+
+NAMES = {0: "cat", 1: "dog"}
+LABELS = {
+    "a": [[0, 0.5, 0.5, 0.2, 0.4], [1, 0.25, 0.75, 0.1, 0.1]],
+    "b": [[1, 0.1, 0.2, 0.05, 0.1]],
+    "c": [],  # immagine senza box
+}
+
+
+@pytest.fixture
+def yolo_dataset(tmp_path):
+    images, labels = tmp_path / "images", tmp_path / "labels"
+    images.mkdir()
+    labels.mkdir()
+    for stem, rows in LABELS.items():
+        make_image(images / f"{stem}.png", size=(200, 100))
+        (labels / f"{stem}.txt").write_text("".join("%d %f %f %f %f\n" % tuple(r) for r in rows))
+    return images, labels
+
+
+def convert(image_dir, label_path, output_dir, output_format, names=NAMES):
+    converter = LabelConverter(str(image_dir), str(label_path), str(output_dir), output_format, names, workers=1)
+    done = []
+    converter.run(converter.plan(), lambda *item: done.append(item))
+    assert all(error is None for _, error in done)
+    return converter, sorted(name for name, _ in done)
+
+
+def assert_same_labels(label_dir):
+    for stem, rows in LABELS.items():
+        # Le box in pixel vengono arrotondate a 2 decimali
+        np.testing.assert_allclose(read_yolo_file(str(label_dir / f"{stem}.txt")),
+                                   np.array(rows).reshape(-1, 5), atol=1e-4)
+
+
+def test_yolo_to_coco_to_yolo(tmp_path, yolo_dataset):
+    images, labels = yolo_dataset
+    converter, done = convert(images, labels, tmp_path / "coco", "COCO")
+    assert converter.input_format == "YOLO"
+    assert done == ["a.png", "b.png", "c.png"]
+
+    coco_file = tmp_path / "coco" / COCO_OUTPUT_NAME
+    with open(coco_file) as f:
+        data = json.load(f)  # lo streaming produce un JSON valido
+    assert is_coco_file(str(coco_file))
+    assert os.listdir(tmp_path / "coco") == [COCO_OUTPUT_NAME]
+    assert data["categories"] == [{"id": 0, "name": "cat", "supercategory": "none"},
+                                  {"id": 1, "name": "dog", "supercategory": "none"}]
+    assert sorted(img["file_name"] for img in data["images"]) == ["a.png", "b.png", "c.png"]
+    assert len(data["annotations"]) == 3
+    assert len({a["id"] for a in data["annotations"]}) == 3
+    by_name = {img["file_name"]: img for img in data["images"]}
+    box = next(a for a in data["annotations"] if a["image_id"] == by_name["a.png"]["id"] and a["category_id"] == 0)
+    assert box["bbox"] == [80, 30, 40, 40] and box["area"] == 1600
+
+    converter, done = convert(images, tmp_path / "coco", tmp_path / "back", "YOLO")
+    assert converter.input_format == "COCO"
+    assert done == ["a.png", "b.png", "c.png"]
+    assert_same_labels(tmp_path / "back")
+
+
+def test_coco_categories_are_mapped_by_name(tmp_path, yolo_dataset):
+    images, labels = yolo_dataset
+    convert(images, labels, tmp_path / "coco", "COCO")
+    # Nel dataset di destinazione gli stessi nomi hanno id scambiati
+    convert(images, tmp_path / "coco" / COCO_OUTPUT_NAME, tmp_path / "back", "YOLO", names={0: "dog", 1: "cat"})
+    np.testing.assert_array_equal(read_yolo_file(str(tmp_path / "back" / "a.txt"))[:, 0], [1, 0])
+
+
+def test_yolo_to_json_to_yolo(tmp_path, yolo_dataset):
+    images, labels = yolo_dataset
+    convert(images, labels, tmp_path / "json", "JSON")
+    assert detect_label_format(str(tmp_path / "json")) == "JSON"
+    with open(tmp_path / "json" / "a.json") as f:
+        data = json.load(f)
+    assert (data["image"], data["width"], data["height"]) == ("a.png", 200, 100)
+    assert data["annotations"][0] == {"class_id": 0, "class_name": "cat", "bbox": [80, 30, 40, 40]}
+
+    converter, done = convert(images, tmp_path / "json", tmp_path / "back", "YOLO")
+    assert converter.input_format == "JSON"
+    assert done == ["a.png", "b.png", "c.png"]
+    assert_same_labels(tmp_path / "back")
+
+
+def test_coco_writer_without_images_writes_valid_json(tmp_path):
+    writer = CocoWriter(str(tmp_path / COCO_OUTPUT_NAME), NAMES)
+    writer.close()
+    with open(tmp_path / COCO_OUTPUT_NAME) as f:
+        assert json.load(f)["images"] == []
+    assert os.listdir(tmp_path) == [COCO_OUTPUT_NAME]
+
+
+def test_cancelled_coco_conversion_leaves_no_files(tmp_path, yolo_dataset):
+    images, labels = yolo_dataset
+    converter = LabelConverter(str(images), str(labels), str(tmp_path / "coco"), "COCO", NAMES, workers=1)
+    jobs = converter.plan()
+    converter.cancel()
+    converter.run(jobs)
+    assert os.listdir(tmp_path / "coco") == []
@@ -0,0 +1,183 @@
+import os
+import random
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import visualedit_engine
+from visualedit_engine import SmartCropPipeline, decode_bgr_rows, merge_redundant_windows, plan_crop
+
+cv2 = pytest.importorskip("cv2")
+
+
+def make_color_png(path, size=(40, 30), **save_args):
+    """PNG con canali diversi, così un errore nell'ordine BGR non passa inosservato."""
+    gradient = Image.linear_gradient("L").resize(size)
+    Image.merge("RGB", (gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+                        Image.new("L", size, 80))).save(path, **save_args)
+    return str(path)
+
+
+# ------------------ decode_bgr_rows ------------------
+@pytest.mark.parametrize("bottom", [1, 17, 29])
+def test_partial_png_decode_matches_opencv(tmp_path, bottom):
+    path = make_color_png(tmp_path / "a.png")
+    rows = decode_bgr_rows(path, bottom)
+    np.testing.assert_array_equal(rows, cv2.imread(path)[:bottom])
+
+
+@pytest.mark.parametrize("name, save_args", [("a.png", {"interlace": 1}), ("a.jpg", {}), ("a.png", {})])
+def test_other_images_are_decoded_whole(tmp_path, name, save_args):
+    path = make_color_png(tmp_path / name, **save_args)
+    for bottom in (None, 30, 100):
+        np.testing.assert_array_equal(decode_bgr_rows(path, bottom), cv2.imread(path))
+
+
+def test_partial_decode_falls_back_to_opencv(tmp_path, monkeypatch):
+    path = make_color_png(tmp_path / "a.png")
+
+    def broken(img, bottom):
+        raise AttributeError("_size")
+
+    monkeypatch.setattr(visualedit_engine, "_decode_png_rows", broken)
+    np.testing.assert_array_equal(decode_bgr_rows(path, 10), cv2.imread(path))
+    monkeypatch.setattr(visualedit_engine, "_PARTIAL_PNG_DECODE", False)
+    np.testing.assert_array_equal(decode_bgr_rows(path, 10), cv2.imread(path))
+
+
+def test_unreadable_image_returns_none(tmp_path):
+    path = tmp_path / "a.png"
+    path.write_bytes(b"not an image")
+    assert decode_bgr_rows(str(path), 10) is None
+
+
+# ------------------ plan_crop ------------------
+def test_centered_crop_inside_the_image():
+    assert plan_crop(50, 40, 100, 80, 40, 30, "Centered", 0) == (30, 25, 70, 55)
+
+
+@pytest.mark.parametrize("x, y, margin, expected", [
+    (5, 5, 0, (0, 0, 40, 30)),
+    (98, 78, 0, (60, 50, 100, 80)),
+    (98, 78, 5, (55, 45, 95, 75)),
+])
+def test_centered_crop_is_clamped_to_the_border(x, y, margin, expected):
+    assert plan_crop(x, y, 100, 80, 40, 30, "Centered", margin) == expected
+
+
+def test_random_crop_stays_inside_the_margins():
+    random.seed(0)
+    for _ in range(50):
+        x1, y1, x2, y2 = plan_crop(50, 40, 100, 80, 40, 30, "Random", 5)
+        assert 5 <= x1 and x2 <= 95 and 5 <= y1 and y2 <= 75
+        assert (x2 - x1, y2 - y1) == (40, 30)
+
+
+# ------------------ merge_redundant_windows ------------------
+def test_merge_drops_windows_with_almost_the_same_boxes():
+    keep = np.array([[1, 1, 0], [1, 1, 0], [0, 1, 1], [1, 1, 1]], dtype=bool)
+    # Jaccard con la finestra 0: 1, 1/3, 2/3
+    assert merge_redundant_windows(keep, 0.6) == [0, 2]
+    assert merge_redundant_windows(keep, 1.0) == [0, 2, 3]
+
+
+def test_merge_keeps_windows_without_boxes():
+    keep = np.zeros((3, 2), dtype=bool)
+    assert merge_redundant_windows(keep, 0.5) == [0, 1, 2]
+
+
+# ------------------ SmartCropPipeline ------------------
+def make_dataset(tmp_path, labels, size=(100, 80)):
+    images, label_dir = tmp_path / "images", tmp_path / "labels"
+    images.mkdir()
+    label_dir.mkdir()
+    for stem, text in labels.items():
+        make_color_png(images / f"{stem}.png", size=size)
+        (label_dir / f"{stem}.txt").write_text(text)
+    return images, label_dir
+
+
+def run_pipeline(tmp_path, images, label_dir, **kwargs):
+    pipeline = SmartCropPipeline(str(images), str(label_dir), str(tmp_path / "out_images"),
+                                 str(tmp_path / "out_labels"), "Centered", 0, "40x30", **kwargs)
+    done = []
+    pipeline.run(pipeline.plan(), lambda *item: done.append(item))
+    return pipeline, done
+
+
+def read_rows(path):
+    return np.loadtxt(path, ndmin=2)
+
+
+def test_pipeline_writes_a_crop_and_a_label_per_box(tmp_path):
+    images, label_dir = make_dataset(tmp_path, {
+        "a": "0 0.5 0.5 0.1 0.1\n1 0.95 0.95 0.1 0.1\n",
+        "b": "2 0.2 0.2 0.1 0.1\n",
+    })
+    pipeline, done = run_pipeline(tmp_path, images, label_dir)
+    assert sorted(done) == [("a.txt", 2, None), ("b.txt", 1, None)]
+    assert sorted(os.listdir(tmp_path / "out_images")) == ["a_crop_0.png", "a_crop_1.png", "b_crop_0.png"]
+    assert all(stats['items'] == 2 for stats in pipeline.stage_stats.values())
+
+    source = cv2.imread(str(images / "a.png"))
+    np.testing.assert_array_equal(cv2.imread(str(tmp_path / "out_images" / "a_crop_0.png")), source[25:55, 30:70])
+    np.testing.assert_array_equal(cv2.imread(str(tmp_path / "out_images" / "a_crop_1.png")), source[50:80, 60:100])
+    np.testing.assert_allclose(read_rows(tmp_path / "out_labels" / "a_crop_0.txt"),
+                               [[0, 0.5, 0.5, 0.25, 8 / 30]], atol=1e-6)
+
+
+def test_labels_of_border_clamped_crops(tmp_path):
+    # Box da (90, 72) a (100, 80): la finestra è spinta a (60, 50, 100, 80)
+    images, label_dir = make_dataset(tmp_path, {"a": "1 0.95 0.95 0.1 0.1\n"})
+    run_pipeline(tmp_path, images, label_dir)
+    np.testing.assert_allclose(read_rows(tmp_path / "out_labels" / "a_crop_0.txt"),
+                               [[1, 35 / 40, 26 / 30, 10 / 40, 8 / 30]], atol=1e-6)
+
+
+def test_neighbouring_boxes_are_shared_and_merged(tmp_path):
+    # Due box vicine: ogni ritaglio contiene anche l'altra, per cui con merge ne resta uno
+    labels = {"a": "0 0.45 0.5 0.1 0.1\n1 0.55 0.5 0.1 0.1\n"}
+    images, label_dir = make_dataset(tmp_path, labels)
+    run_pipeline(tmp_path, images, label_dir)
+    assert len(read_rows(tmp_path / "out_labels" / "a_crop_0.txt")) == 2
+    assert len(os.listdir(tmp_path / "out_images")) == 2
+
+    merged = tmp_path / "merged"
+    merged.mkdir()
+    images, label_dir = make_dataset(merged, labels)
+    run_pipeline(merged, images, label_dir, merge_threshold=0.9)
+    assert os.listdir(merged / "out_images") == ["a_crop_0.png"]
+
+
+def test_cancelled_pipeline_writes_nothing(tmp_path):
+    images, label_dir = make_dataset(tmp_path, {f"{i:02d}": "0 0.5 0.5 0.1 0.1\n" for i in range(3)})
+    pipeline = SmartCropPipeline(str(images), str(label_dir), str(tmp_path / "out_images"),
+                                 str(tmp_path / "out_labels"), "Centered", 0, "40x30")
+    jobs = pipeline.plan()
+    pipeline.cancel()
+    pipeline.run(jobs, lambda *item: pytest.fail("cancelled pipeline reported an item"))
+    assert os.listdir(tmp_path / "out_images") == []
+
+
+def test_cancel_stops_the_running_pipeline(tmp_path):
+    images, label_dir = make_dataset(tmp_path, {f"{i:02d}": "0 0.5 0.5 0.1 0.1\n" for i in range(20)})
+    pipeline = SmartCropPipeline(str(images), str(label_dir), str(tmp_path / "out_images"),
+                                 str(tmp_path / "out_labels"), "Centered", 0, "40x30",
+                                 workers={'read': 1, 'crop': 1, 'write': 1}, queue_size=1)
+    done = []
+
+    def on_done(*item):
+        done.append(item)
+        pipeline.cancel()
+
+    pipeline.run(pipeline.plan(), on_done)  # ritorna: le code vengono svuotate
+    assert 1 <= len(done) < 20
+    assert len(os.listdir(tmp_path / "out_images")) == len(done)
+
+
+def test_unreadable_image_is_reported(tmp_path):
+    images, label_dir = make_dataset(tmp_path, {"a": "0 0.5 0.5 0.1 0.1\n"})
+    (images / "a.png").write_bytes(b"broken")
+    _, done = run_pipeline(tmp_path, images, label_dir)
+    assert len(done) == 1 and done[0][:2] == ("a.txt", 0) and done[0][2] is not None
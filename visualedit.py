@@ -1,13 +1,31 @@
+import time
+# Istante di avvio del processo, prima degli import pesanti (vedi StartupReport)
+STARTUP_STARTED = time.perf_counter()
 import os
-import glob
-import yaml
+import bisect
 import tkinter as tk
+import tkinter.font as tkfont
 from tkinter import messagebox, simpledialog, filedialog, ttk
-from PIL import Image, ImageTk, ImageDraw, ImageFont, ImageOps
+from PIL import Image, ImageTk, ImageOps
 import threading  # Per eseguire operazioni in background
+import contextlib
+import logging
+import queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import math
+from collections import OrderedDict
 import platform  # Per rilevare il sistema operativo
-import cv2
-import random
+import numpy as np
+
+from visualedit_engine import (
+    logger, setup_logging, enable_timings_export, timed, TIMINGS,
+    YoloAnnotations, IMAGE_EXTENSIONS, DirectoryIndex, ImageMetadataIndex,
+    tile_image_file, SmartCropPipeline, SMART_CROP_MIN_VISIBILITY,
+    atomic_save, halve_image_file, grayscale_image_file, delete_image_files,
+    rename_image_files, suffixed_path, label_path_for, load_class_names, LabelConverter,
+    ImageIngestor, INGEST_CODECS, TILE_FORMATS, ENCODER_PROFILES, encoder_profile,
+    EditJournal, transpose_image,
+)
 
 # ============================================================
 # Percorsi (modifica in base alle tue esigenze)
@@ -19,22 +37,850 @@ label_dir = os.path.join(default_base_dir, "labels")
 label_format_dir = os.path.join(default_base_dir, "label_format")
 # ============================================================
 
+# Margine (in pixel del canvas) renderizzato attorno all'area visibile,
+# così che piccoli scroll non richiedano un nuovo ricampionamento.
+VIEWPORT_MARGIN = 128
+
+# Lato (in pixel del canvas) dei tile mostrati e memoria massima per la cache dei tile
+TILE_SIZE = 256
+TILE_CACHE_BYTES = 192 * 1024 * 1024
+
+# Stile delle annotazioni disegnate come elementi vettoriali del canvas
+ANNOTATION_COLOR = "#00ff00"
+ANNOTATION_FONT = ("Arial", 12, "bold")
+
+
+class ImagePyramid:
+    """Piramide multi-risoluzione di un'immagine: livello k = immagine ridotta di 2**k.
+
+    I livelli vengono costruiti solo quando servono, ciascuno dimezzando il precedente,
+    così la vista a zoom basso ricampiona al massimo un fattore 2 invece dell'intera
+    immagine a piena risoluzione.
+    """
+
+    def __init__(self, image, full_size=None):
+        # `image` may be a reduced preview: coordinates always refer to full_size
+        self.width, self.height = full_size or image.size
+        self.scale = image.width / self.width
+        self.levels = [image]
+
+    def level_for_zoom(self, zoom):
+        """Returns the smallest level whose scale is still >= zoom."""
+        if zoom >= self.scale:
+            return 0
+        level = int(math.floor(math.log2(self.scale / zoom)))
+        # Never go below a 1-pixel level
+        max_level = int(math.floor(math.log2(max(1, min(self.levels[0].size)))))
+        return max(0, min(level, max_level))
+
+    def get_level(self, level):
+        """Restituisce il livello richiesto, costruendo quelli mancanti."""
+        while len(self.levels) <= level:
+            self.levels.append(self.levels[-1].reduce(2))
+        return self.levels[level]
+
+    def render(self, zoom, box):
+        """Renders the canvas box (x1, y1, x2, y2) at the given zoom from the closest level."""
+        x1, y1, x2, y2 = box
+        level_img = self.get_level(self.level_for_zoom(zoom))
+        # Scale from canvas coordinates to the chosen level
+        fx = level_img.width / (self.width * zoom)
+        fy = level_img.height / (self.height * zoom)
+        source_box = (x1 * fx, y1 * fy,
+                      min(level_img.width, x2 * fx), min(level_img.height, y2 * fy))
+        # Optimize image scaling by using a more efficient method for larger zoom factors
+        if zoom >= self.scale:
+            # For zooming in, NEAREST is faster and still looks good for most images
+            resample_method = Image.NEAREST
+        else:
+            # For zooming out, stick with LANCZOS for better quality
+            resample_method = Image.LANCZOS
+        return level_img.resize((x2 - x1, y2 - y1), resample_method, box=source_box)
+
+
+class TileCache:
+    """Cache LRU di PhotoImage dei tile, limitata dalla memoria occupata."""
+
+    def __init__(self, max_bytes=TILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._tiles = OrderedDict()  # key -> (PhotoImage, bytes)
+
+    def get(self, key):
+        entry = self._tiles.get(key)
+        if entry is None:
+            return None
+        self._tiles.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, photo, pinned=()):
+        """Inserisce un tile ed elimina i meno recenti, tranne quelli in `pinned` (visibili)."""
+        size = photo.width() * photo.height() * 4
+        self._tiles[key] = (photo, size)
+        self.current_bytes += size
+        if self.current_bytes > self.max_bytes:
+            for old_key in list(self._tiles):
+                if self.current_bytes <= self.max_bytes:
+                    break
+                if old_key == key or old_key in pinned:
+                    continue
+                self.current_bytes -= self._tiles.pop(old_key)[1]
+
+    def clear(self):
+        self._tiles.clear()
+        self.current_bytes = 0
+
+
+class SpatialGrid:
+    """Indice spaziale a griglia uniforme sulle bounding box in pixel di un'immagine.
+
+    Le box sono indicizzate per posizione (la stessa dell'elenco delle annotazioni);
+    inserimenti e rimozioni aggiornano solo le celle toccate dalla box.
+    """
+
+    # Box che coprono più celle di così finiscono in una lista controllata sempre
+    MAX_CELLS_PER_BOX = 64
+
+    def __init__(self, boxes=(), cell_size=None):
+        boxes = [self._normalize(box) for box in boxes]
+        self.cell_size = cell_size or self._auto_cell_size(boxes)
+        self._cells = {}  # (cx, cy) -> set di id
+        self._large = set()  # id delle box troppo grandi per la griglia
+        self._boxes = {}  # id -> (x1, y1, x2, y2)
+        self._ids = []  # posizione -> id
+        self._next_id = 0
+        for box in boxes:
+            self.insert(box)
+
+    @staticmethod
+    def _normalize(box):
+        x1, y1, x2, y2 = box
+        return min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+
+    @staticmethod
+    def _auto_cell_size(boxes):
+        """Uses the median box side, so a typical box touches at most four cells."""
+        if not boxes:
+            return 64
+        sides = sorted(max(x2 - x1, y2 - y1) for x1, y1, x2, y2 in boxes)
+        return int(min(512, max(16, sides[len(sides) // 2])))
+
+    def _cell_range(self, x1, y1, x2, y2):
+        c = self.cell_size
+        return int(x1 // c), int(y1 // c), int(x2 // c), int(y2 // c)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def insert(self, box):
+        """Appends a box at the end of the positional order."""
+        box = self._normalize(box)
+        box_id = self._next_id
+        self._next_id += 1
+        self._boxes[box_id] = box
+        self._ids.append(box_id)
+        cx1, cy1, cx2, cy2 = self._cell_range(*box)
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > self.MAX_CELLS_PER_BOX:
+            self._large.add(box_id)
+            return
+        for cy in range(cy1, cy2 + 1):
+            for cx in range(cx1, cx2 + 1):
+                self._cells.setdefault((cx, cy), set()).add(box_id)
+
+    def remove(self, position):
+        """Rimuove la box in `position`; le successive scalano di una posizione."""
+        box_id = self._ids.pop(position)
+        box = self._boxes.pop(box_id)
+        if box_id in self._large:
+            self._large.discard(box_id)
+            return
+        cx1, cy1, cx2, cy2 = self._cell_range(*box)
+        for cy in range(cy1, cy2 + 1):
+            for cx in range(cx1, cx2 + 1):
+                cell = self._cells.get((cx, cy))
+                if cell is not None:
+                    cell.discard(box_id)
+                    if not cell:
+                        del self._cells[(cx, cy)]
+
+    def query_point(self, x, y):
+        """Position of the smallest box containing (x, y), the topmost on ties; None if none."""
+        cx, cy = int(x // self.cell_size), int(y // self.cell_size)
+        best = None
+        for box_id in self._cells.get((cx, cy), set()) | self._large:
+            x1, y1, x2, y2 = self._boxes[box_id]
+            if x1 <= x <= x2 and y1 <= y <= y2:
+                # Later boxes are drawn on top, so they win ties
+                rank = ((x2 - x1) * (y2 - y1), -box_id)
+                if best is None or rank < best[0]:
+                    best = (rank, box_id)
+        return None if best is None else self._ids.index(best[1])
+
+    def query_rect(self, x1, y1, x2, y2):
+        """Posizioni (ordinate) delle box interamente contenute nel rettangolo."""
+        x1, y1, x2, y2 = self._normalize((x1, y1, x2, y2))
+        cx1, cy1, cx2, cy2 = self._cell_range(x1, y1, x2, y2)
+        candidates = set(self._large)
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(self._cells):
+            for cell in self._cells.values():
+                candidates |= cell
+        else:
+            for cy in range(cy1, cy2 + 1):
+                for cx in range(cx1, cx2 + 1):
+                    candidates |= self._cells.get((cx, cy), set())
+        hits = set()
+        for box_id in candidates:
+            bx1, by1, bx2, by2 = self._boxes[box_id]
+            if x1 <= bx1 and y1 <= by1 and bx2 <= x2 and by2 <= y2:
+                hits.add(box_id)
+        return [i for i, box_id in enumerate(self._ids) if box_id in hits]
+
+
+# Formati per cui è disponibile la decodifica ridotta (scalatura DCT di libjpeg)
+DRAFT_EXTENSIONS = ('.jpg', '.jpeg')
+
+
+def open_draft_image(img_path, scale):
+    """Decodifica un JPEG alla minima scala DCT (1/2, 1/4, 1/8) che copre `scale`.
+
+    Restituisce (immagine RGB, dimensione piena). Per gli altri formati, o quando la
+    scala necessaria è 1, l'immagine viene decodificata a piena risoluzione.
+    """
+    img = Image.open(img_path)
+    full_size = img.size
+    if scale < 1.0 and os.path.splitext(img_path)[1].lower() in DRAFT_EXTENSIONS:
+        img.draft("RGB", (max(1, math.ceil(full_size[0] * scale)),
+                          max(1, math.ceil(full_size[1] * scale))))
+    return img.convert("RGB"), full_size
+
+
+# Ogni quanto (ms) controllare se la cartella immagini è cambiata
+FILE_WATCH_INTERVAL_MS = 2000
+
+
+class VirtualListbox(tk.Frame):
+    """Elenco virtuale: disegna solo le righe visibili di una lista Python.
+
+    La lista (ad es. image_files) resta in memoria e non viene copiata nel widget, per
+    cui avvio e aggiornamento non dipendono dal numero di file. La selezione EXTENDED
+    (click, Shift+click, Ctrl+click, frecce con Shift, Ctrl+A) è un semplice insieme di
+    indici; digitando l'inizio di un nome file si salta alla prima voce corrispondente.
+    """
+
+    TYPEAHEAD_RESET_MS = 1000
+    SELECT_BACKGROUND = "#3399ff"
+
+    def __init__(self, master, text_for=str, on_activate=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.items = []
+        self.text_for = text_for
+        self.on_activate = on_activate
+        self.selection = set()
+        self.anchor = 0
+        self.active = 0
+        self.top = 0
+        self.font = tkfont.nametofont("TkDefaultFont")
+        self.row_height = self.font.metrics("linespace") + 2
+        self._redraw_pending = False
+        self._typeahead = ""
+        self._typeahead_job = None
+        self._sorted_names = None  # [(nome minuscolo, indice)] per il salto rapido
+
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas = tk.Canvas(self, background="white", highlightthickness=1, takefocus=1)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind("<Configure>", lambda event: self.redraw())
+        self.canvas.bind("<ButtonPress-1>", self._on_click)
+        self.canvas.bind("<Shift-ButtonPress-1>", self._on_shift_click)
+        self.canvas.bind("<Control-ButtonPress-1>", self._on_control_click)
+        self.canvas.bind("<Double-Button-1>", self._on_double_click)
+        self.canvas.bind("<B1-Motion>", self._on_drag)
+        self.canvas.bind("<KeyPress>", self._on_key)
+        self.canvas.bind("<Control-a>", lambda event: self._select_all())
+        if platform.system() in ('Windows', 'Darwin'):
+            self.canvas.bind("<MouseWheel>", lambda event: self.yview("scroll", -1 if event.delta > 0 else 1, "units"))
+        else:
+            self.canvas.bind("<Button-4>", lambda event: self.yview("scroll", -1, "units"))
+            self.canvas.bind("<Button-5>", lambda event: self.yview("scroll", 1, "units"))
+
+    # --- modello ---
+    def set_items(self, items):
+        """Mostra `items` (la lista viene referenziata, non copiata) e azzera la selezione."""
+        self.items = items
+        self.selection = set()
+        self.anchor = self.active = self.top = 0
+        self._sorted_names = None
+        self.redraw()
+
+    def apply_ops(self, ops):
+        """Riallinea selezione e cursore dopo le operazioni di DirectoryIndex.apply()."""
+        for op in ops:
+            pos = op[1]
+            if op[0] == 'remove':
+                self.selection = {i - (i > pos) for i in self.selection if i != pos}
+                self.anchor -= self.anchor > pos
+                self.active -= self.active > pos
+            else:
+                self.selection = {i + (i >= pos) for i in self.selection}
+                self.anchor += self.anchor >= pos
+                self.active += self.active >= pos
+        self._sorted_names = None
+        self.redraw()
+
+    def size(self):
+        return len(self.items)
+
+    # --- API compatibile con tk.Listbox ---
+    def curselection(self):
+        return tuple(sorted(self.selection))
+
+    def selection_clear(self, first=0, last=None):
+        self.selection = set()
+        self.redraw()
+
+    def selection_set(self, index):
+        if 0 <= index < len(self.items):
+            self.selection.add(index)
+            self.anchor = self.active = index
+        self.redraw()
+
+    def see(self, index):
+        rows = self._full_rows()
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + rows:
+            self.top = index - rows + 1
+        self.redraw()
+
+    def yview(self, *args):
+        """Comando della scrollbar ('moveto', f) / ('scroll', n, 'units'|'pages')."""
+        if args and args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.items))
+        elif args and args[0] == "scroll":
+            step = self._full_rows() if args[2] == "pages" else 1
+            self.top += int(args[1]) * step
+        self.redraw()
+
+    # --- disegno ---
+    def _full_rows(self):
+        return max(1, self.canvas.winfo_height() // self.row_height)
+
+    def redraw(self):
+        """Coalesce redraws into one per idle cycle."""
+        if not self._redraw_pending:
+            self._redraw_pending = True
+            self.after_idle(self._draw)
+
+    def _draw(self):
+        self._redraw_pending = False
+        n = len(self.items)
+        rows = self._full_rows()
+        self.top = max(0, min(self.top, n - rows))
+        width = self.canvas.winfo_width()
+        self.canvas.delete("all")
+        for r in range(rows + 1):
+            i = self.top + r
+            if i >= n:
+                break
+            y = r * self.row_height
+            selected = i in self.selection
+            if selected:
+                self.canvas.create_rectangle(0, y, width, y + self.row_height,
+                                             fill=self.SELECT_BACKGROUND, outline="")
+            if i == self.active:
+                self.canvas.create_rectangle(1, y, width - 1, y + self.row_height - 1,
+                                             outline="gray", dash=(1, 1))
+            self.canvas.create_text(4, y + 1, anchor=tk.NW, text=self.text_for(self.items[i]),
+                                    font=self.font, fill="white" if selected else "black")
+        if n:
+            self.scrollbar.set(self.top / n, min(1.0, (self.top + rows) / n))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    # --- mouse ---
+    def _index_at(self, y):
+        i = self.top + int(self.canvas.canvasy(y) // self.row_height)
+        return i if 0 <= i < len(self.items) else None
+
+    def _on_click(self, event):
+        self.canvas.focus_set()
+        i = self._index_at(event.y)
+        if i is not None:
+            self.selection = {i}
+            self.anchor = self.active = i
+            self.redraw()
+
+    def _on_shift_click(self, event):
+        i = self._index_at(event.y)
+        if i is not None:
+            self._select_range(i)
+
+    def _on_control_click(self, event):
+        i = self._index_at(event.y)
+        if i is not None:
+            self.selection ^= {i}
+            self.anchor = self.active = i
+            self.redraw()
+
+    def _on_drag(self, event):
+        i = self._index_at(min(max(event.y, 0), self.canvas.winfo_height() - 1))
+        if i is not None:
+            self._select_range(i)
+            self.see(i)
+
+    def _on_double_click(self, event):
+        i = self._index_at(event.y)
+        if i is not None and self.on_activate:
+            self.selection = {i}
+            self.anchor = self.active = i
+            self.redraw()
+            self.on_activate()
+
+    def _select_range(self, index):
+        low, high = sorted((self.anchor, index))
+        self.selection = set(range(low, high + 1))
+        self.active = index
+        self.redraw()
+
+    def _select_all(self):
+        self.selection = set(range(len(self.items)))
+        self.redraw()
+        return "break"
+
+    # --- tastiera ---
+    def _on_key(self, event):
+        n = len(self.items)
+        if not n:
+            return
+        moves = {"Up": -1, "Down": 1, "Prior": -self._full_rows(), "Next": self._full_rows(),
+                 "Home": -n, "End": n}
+        if event.keysym in moves:
+            index = max(0, min(n - 1, self.active + moves[event.keysym]))
+            if event.state & 0x1:  # Shift estende la selezione
+                self._select_range(index)
+            else:
+                self.selection = {index}
+                self.anchor = self.active = index
+            self.see(index)
+            return "break"
+        if event.keysym == "Return":
+            if self.on_activate:
+                self.selection = {self.active}
+                self.on_activate()
+            return "break"
+        if event.char and event.char.isprintable() and not event.state & 0x4:
+            self._jump_to_prefix(event.char)
+            return "break"
+
+    def _jump_to_prefix(self, char):
+        """Salta alla prima voce il cui nome inizia con quanto digitato nell'ultimo secondo."""
+        if self._typeahead_job is not None:
+            self.after_cancel(self._typeahead_job)
+        self._typeahead += char.lower()
+        self._typeahead_job = self.after(self.TYPEAHEAD_RESET_MS, self._reset_typeahead)
+        if self._sorted_names is None:
+            self._sorted_names = sorted((self.text_for(item).lower(), i) for i, item in enumerate(self.items))
+        pos = bisect.bisect_left(self._sorted_names, (self._typeahead, -1))
+        if pos < len(self._sorted_names) and self._sorted_names[pos][0].startswith(self._typeahead):
+            index = self._sorted_names[pos][1]
+            self.selection = {index}
+            self.anchor = self.active = index
+            self.see(index)
+
+    def _reset_typeahead(self):
+        self._typeahead = ""
+        self._typeahead_job = None
+
+
+# Numero di immagini precedenti/successive decodificate in anticipo
+PREFETCH_RADIUS = 2
+# Memoria massima delle immagini decodificate in cache (width * height * canali),
+# configurabile in MB con VISUALEDIT_PREFETCH_MB
+PREFETCH_BUDGET_ENV = "VISUALEDIT_PREFETCH_MB"
+PREFETCH_DEFAULT_MB = 512
+
+
+def prefetch_budget_bytes():
+    try:
+        return int(float(os.environ.get(PREFETCH_BUDGET_ENV, PREFETCH_DEFAULT_MB)) * 1024 * 1024)
+    except ValueError:
+        logger.warning("Invalid %s, using %s MB", PREFETCH_BUDGET_ENV, PREFETCH_DEFAULT_MB)
+        return PREFETCH_DEFAULT_MB * 1024 * 1024
+
+
+def image_nbytes(image):
+    """Memoria dei pixel decodificati di un'immagine PIL."""
+    return image.width * image.height * len(image.getbands())
+
+
+def file_key(path):
+    """Returns (path, mtime_ns, size) for an existing file, None otherwise."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (path, st.st_mtime_ns, st.st_size)
+
+
+class ImagePrefetcher:
+    """Decodifica in un thread di background le immagini vicine a quella corrente.
+
+    Le immagini decodificate e le relative annotazioni YOLO finiscono in una cache LRU
+    limitata a max_bytes di pixel (default: prefetch_budget_bytes()); ogni voce è valida
+    solo finché path, mtime e dimensione dell'immagine e del file di label coincidono con
+    quelli su disco.
+    """
+
+    def __init__(self, label_file_for, load_annotations, max_bytes=None):
+        self.label_file_for = label_file_for
+        self.load_annotations = load_annotations
+        self.max_bytes = prefetch_budget_bytes() if max_bytes is None else max_bytes
+        self.bytes_used = 0
+        self._cache = OrderedDict()  # path -> (image_key, label_key, image, annotations)
+        self._jobs = []
+        self._wanted = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def get(self, path):
+        """Returns (image, annotations) if a fresh entry is cached, None otherwise."""
+        image_key = file_key(path)
+        label_key = file_key(self.label_file_for(path))
+        with self._lock:
+            entry = self._cache.get(path)
+            if entry is None or entry[0] != image_key or entry[1] != label_key:
+                return None
+            self._cache.move_to_end(path)
+            return entry[2], entry[3].copy()
+
+    def put(self, path, image, annotations):
+        """Memorizza un'immagine già decodificata (ad es. caricata in modo sincrono)."""
+        entry = (file_key(path), file_key(self.label_file_for(path)), image, annotations.copy())
+        with self._lock:
+            self._store(path, entry)
+
+    def schedule(self, paths):
+        """Replaces the pending jobs with `paths`; jobs no longer wanted are dropped."""
+        with self._lock:
+            self._jobs = list(paths)
+            self._wanted = set(paths)
+            self._wakeup.notify()
+
+    def cancel(self):
+        """Annulla tutti i job in attesa (e scarta il risultato di quello in corso)."""
+        self.schedule([])
+
+    def _store(self, path, entry):
+        old = self._cache.pop(path, None)
+        if old is not None:
+            self.bytes_used -= image_nbytes(old[2])
+        self._cache[path] = entry
+        self.bytes_used += image_nbytes(entry[2])
+        # L'ultima voce resta anche se da sola supera il budget (è l'immagine corrente)
+        while self.bytes_used > self.max_bytes and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self.bytes_used -= image_nbytes(evicted[2])
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                while not self._jobs:
+                    self._wakeup.wait()
+                path = self._jobs.pop(0)
+            if self.get(path) is not None:
+                continue
+            try:
+                label_file = self.label_file_for(path)
+                image_key = file_key(path)
+                label_key = file_key(label_file)
+                image = Image.open(path).convert("RGB")
+                annotations = self.load_annotations(label_file)
+            except Exception as e:
+                logger.warning("Prefetch failed for %s: %s", path, e)
+                continue
+            with self._lock:
+                # The user may have jumped elsewhere while this image was decoding;
+                # a neighbour larger than the whole budget would only evict the others
+                if path in self._wanted and image_nbytes(image) <= self.max_bytes:
+                    self._store(path, (image_key, label_key, image, annotations))
+
+
+class ProgressDialog:
+    """Finestra di avanzamento per i lavori batch, con barra e pulsante Cancel.
+
+    I risultati arrivano da altri thread tramite `report()` (thread-safe) e vengono
+    consumati sul thread di Tk da un polling con master.after. Con total=None il numero
+    di elementi non è ancora noto (il job sta preparando il lavoro) e va indicato poi
+    con set_total().
+    """
+
+    POLL_MS = 100
+
+    def __init__(self, master, title, total, on_cancel=None, describe=None):
+        self.master = master
+        self.total = total
+        self.done = 0
+        self.cancelled = False
+        self.finished = False
+        self.error = None
+        self.on_cancel = on_cancel
+        self.describe = describe
+        self._results = queue.Queue()
+
+        self.window = tk.Toplevel(master)
+        self.window.title(title)
+        self.window.geometry("520x140" if describe else "420x120")
+        self.window.transient(master)
+        self.window.protocol("WM_DELETE_WINDOW", self.cancel)
+        self.label = tk.Label(self.window, text="Scanning..." if total is None else f"0 / {total}", anchor="w")
+        self.label.pack(fill=tk.X, padx=10, pady=(10, 5))
+        self.bar = ttk.Progressbar(self.window, maximum=max(total or 0, 1), mode="determinate")
+        self.bar.pack(fill=tk.X, padx=10)
+        if describe:
+            self.detail = tk.Label(self.window, text="", anchor="w", font=("Arial", 9))
+            self.detail.pack(fill=tk.X, padx=10, pady=(5, 0))
+        self.cancel_button = tk.Button(self.window, text="Cancel", command=self.cancel)
+        self.cancel_button.pack(pady=10)
+
+    def report(self, item):
+        """Accoda un risultato; può essere chiamato da qualsiasi thread."""
+        self._results.put(item)
+
+    def set_total(self, total):
+        """Numero di elementi, quando il job lo ha calcolato (sul thread di Tk)."""
+        self.total = total
+        if not self.finished:
+            self.bar["maximum"] = max(total, 1)
+
+    def fail(self, error):
+        """Segnala che il lavoro si è interrotto per un errore; può essere chiamato da qualsiasi thread."""
+        self.error = error
+
+    def _drain(self, on_item):
+        while True:
+            try:
+                item = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self.done += 1
+            on_item(item)
+
+    def poll(self, on_item, on_finish, running=None):
+        """Consuma i risultati accodati; chiama on_finish() quando sono arrivati tutti
+        o il lavoro è stato annullato. running(), se indicato, dice se ci sono ancora job
+        in corso: dopo un annullamento on_finish() aspetta che terminino, consumandone
+        i risultati."""
+        self._drain(on_item)
+        self.bar["value"] = self.done
+        if self.total is not None:
+            self.label.config(text=f"{self.done} / {self.total}")
+        if self.describe:
+            self.detail.config(text=self.describe())
+        stopped = (self.cancelled or self.error is not None) and not (running and running())
+        if (self.total is not None and self.done >= self.total) or stopped:
+            self._drain(on_item)  # Risultati arrivati mentre gli ultimi job terminavano
+            self.finished = True
+            self.window.destroy()
+            on_finish()
+        else:
+            self.master.after(self.POLL_MS, self.poll, on_item, on_finish)
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            self.cancel_button.config(state=tk.DISABLED, text="Cancelling...")
+            if self.on_cancel:
+                self.on_cancel()
+
+
+# Thread per i job interattivi (rotate/flip, un'immagine) e per il dispatch dei batch;
+# processi per il lavoro CPU-bound dei batch (None = uno per core)
+JOB_INTERACTIVE_THREADS = 2
+JOB_BATCH_THREADS = max(4, 2 * (os.cpu_count() or 2))
+JOB_PROCESSES = None
+
+
+class JobScheduler:
+    """Esecuzione in background di tutte le operazioni lunghe dell'ImageViewer.
+
+    I job girano in un pool di thread (o, con process=True, in un pool di processi
+    condiviso); i job interattivi hanno un pool a parte per non finire in coda ai batch.
+    Ogni job dichiara le immagini che tocca e ne prende i lock (in ordine, per evitare
+    deadlock), così due operazioni sulla stessa immagine non si sovrappongono mai.
+    Le callback vengono sempre eseguite sul thread di Tk, tramite una coda svuotata
+    con master.after.
+    """
+
+    POLL_MS = 50
+
+    def __init__(self, master, processes=JOB_PROCESSES):
+        self.master = master
+        self._interactive = ThreadPoolExecutor(max_workers=JOB_INTERACTIVE_THREADS)
+        self._batch = ThreadPoolExecutor(max_workers=JOB_BATCH_THREADS)
+        self._process_workers = processes
+        self._processes = None
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._callbacks = queue.Queue()
+        self.master.after(self.POLL_MS, self._drain)
+
+    def _process_pool(self):
+        with self._locks_guard:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self._process_workers)
+            return self._processes
+
+    def lock_for(self, path):
+        """Lock dell'immagine `path` (uno per percorso assoluto)."""
+        key = os.path.abspath(path)
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    @contextlib.contextmanager
+    def locked(self, paths):
+        """Context manager che tiene i lock di tutte le immagini in `paths`."""
+        with contextlib.ExitStack() as stack:
+            for key in sorted({os.path.abspath(p) for p in paths}):
+                stack.enter_context(self.lock_for(key))
+            yield
+
+    def call_in_ui(self, func, *args):
+        """Esegue func(*args) sul thread di Tk; può essere chiamato da qualsiasi thread."""
+        self._callbacks.put((func, args))
+
+    def _drain(self):
+        while True:
+            try:
+                func, args = self._callbacks.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error("Error in job callback: %s", e)
+        self.master.after(self.POLL_MS, self._drain)
+
+    def _execute(self, func, args, paths, process, record=None):
+        with self.locked(paths), record or contextlib.nullcontext():
+            if process:
+                return self._process_pool().submit(func, *args).result()
+            return func(*args)
+
+    def submit(self, func, *args, paths=(), process=False, batch=False, on_done=None, on_error=None, record=None):
+        """Esegue func(*args) in background; on_done(result) / on_error(exc) sul thread di Tk.
+
+        `record` è un context manager (ad es. EditJournal.recording) in cui il job viene
+        eseguito, dopo aver preso i lock.
+        """
+        def task():
+            try:
+                result = self._execute(func, args, paths, process, record)
+            except Exception as e:
+                logger.error("Error in background job %s: %s", getattr(func, '__name__', func), e)
+                if on_error:
+                    self.call_in_ui(on_error, e)
+                return
+            if on_done:
+                self.call_in_ui(on_done, result)
+
+        return (self._batch if batch else self._interactive).submit(task)
+
+    def run_batch(self, title, func, items, args_for=lambda item: (item,), paths_for=lambda item: (item,),
+                  process=True, on_item=None, on_finish=None, describe=None, record_for=None):
+        """Esegue func su ogni elemento con una finestra di avanzamento e Cancel.
+
+        on_item(item, result, error) viene chiamato sul thread di Tk per ogni elemento
+        completato, on_finish(dialog) alla fine (dialog.cancelled indica l'annullamento).
+        Gli argomenti vengono calcolati subito, sul thread di Tk. record_for(item), se
+        indicato, restituisce il context manager del journal per quell'elemento.
+        """
+        items = list(items)
+        cancelled = threading.Event()
+        dialog = ProgressDialog(self.master, title, len(items), on_cancel=cancelled.set, describe=describe)
+        futures = []
+        for item in items:
+            args, paths = args_for(item), paths_for(item)
+            record = record_for(item) if record_for else None
+
+            def task(item=item, args=args, paths=paths, record=record):
+                if cancelled.is_set():
+                    return
+                try:
+                    dialog.report((item, self._execute(func, args, paths, process, record), None))
+                except Exception as e:
+                    dialog.report((item, None, e))
+
+            futures.append(self._batch.submit(task))
+        # Dopo Cancel gli elementi non ancora avviati vengono saltati, quelli in corso
+        # terminano e i loro risultati arrivano a on_item prima di on_finish
+        dialog.poll(lambda entry: on_item and on_item(*entry), lambda: on_finish and on_finish(dialog),
+                    running=lambda: not all(f.done() for f in futures))
+        return dialog
+
+
+class StartupReport:
+    """Tempi delle fasi di avvio: import, finestra, scansione della cartella, prima immagine.
+
+    Ogni fase va nel log alla fine dell'avvio e in TIMINGS come "startup.<fase>",
+    così compare anche nel CSV esportato con VISUALEDIT_TIMINGS.
+    """
+
+    def __init__(self, started=STARTUP_STARTED):
+        self.started = started
+        self.last = started
+        self.phases = []
+
+    def mark(self, phase):
+        """Chiude la fase `phase` (il tempo trascorso dalla fase precedente)."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        TIMINGS.record("startup." + phase, now - self.last)
+        self.last = now
+
+    def report(self):
+        logger.info("Startup took %.0f ms (%s)", (self.last - self.started) * 1000,
+                    ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.phases))
+
+
 class ImageViewer:
-    def __init__(self, master):
+    def __init__(self, master, startup=None):
         self.master = master
         self.master.title("Visual Editor - No Image Loaded")
+        self.startup = startup  # StartupReport, None a avvio concluso
 
-        self.image_files = self.gather_image_files()
-        self.image_files = sorted(self.image_files)  # Ordinamento sincronizzato
+        self.names = {}  # Classi da data.yaml, lette in background da load_folder
+        self.dir_index = None  # DirectoryIndex di image_dir, creato da load_folder
+        self.loading_folder = None  # Cartella in corso di scansione
+        self.preloaded_display = None  # (path, anteprima, dimensioni) decodificata da load_folder
+        self.image_files = []  # Ordinamento sincronizzato (è dir_index.paths)
         self.index = 0
         self.show_annotations = tk.BooleanVar(value=True)
 
         self.current_image = None  # PIL Image
+        self.image_scale = 1.0  # < 1 se current_image è un'anteprima ridotta
+        self.full_image_size = None  # Dimensioni reali mentre è mostrata l'anteprima
+        self.full_decode_job = None  # Decodifica a piena risoluzione in background
         self.image_path = None
-        self.current_annotations = []
+        self.current_annotations = YoloAnnotations()
         self.zoom_factor = 1.0  # Initialize zoom factor
         self.is_cropping = False  # Initialize cropping flag
         self.rect_id = None  # Initialize rect_id for mouse drag rectangle
+        self.pyramid = None  # Piramide multi-risoluzione dell'immagine mostrata
+        self.tile_cache = TileCache()
+        self.tile_items = {}  # (zoom, tx, ty) -> id dell'item sul canvas
+        self.annotation_boxes = np.zeros((0, 4), dtype=np.int64)  # Box in pixel (x1, y1, x2, y2)
+        self.annotation_grid = SpatialGrid()  # Indice spaziale di annotation_boxes
+        self.annotation_items_key = None  # Annotazioni attualmente disegnate sul canvas
+        self.annotation_items_zoom = None
+        self.prefetcher = ImagePrefetcher(self.get_label_path, self.load_annotations)
+        self.metadata = None  # ImageMetadataIndex del dataset, creato da refresh_file_list
+        self.journal = None  # EditJournal (undo/redo) del dataset, creato con l'elenco file
+        self.jobs = JobScheduler(master)  # Tutte le operazioni lunghe passano da qui
+        # Profilo di codifica di tutte le immagini scritte (vedi ENCODER_PROFILES)
+        self.encoder_profile = tk.StringVar(value=encoder_profile())
 
         # Main container with weight configuration
         self.master.grid_rowconfigure(1, weight=1)  # Changed from 0 to 1 to make room for top controls
@@ -68,7 +914,7 @@ class ImageViewer:
         btn_next.pack(side=tk.LEFT, padx=2)
 
         chk_show = tk.Checkbutton(control_frame_1, text="Show Annotations",
-                                 variable=self.show_annotations, command=self.update_image)
+                                 variable=self.show_annotations, command=self.toggle_annotations)
         chk_show.pack(side=tk.LEFT, padx=2)
 
         btn_del_anno = tk.Button(control_frame_1, text="Delete Annotations",
@@ -91,6 +937,12 @@ class ImageViewer:
                              command=self.flip_image_horizontally)
         btn_flip.pack(side=tk.LEFT, padx=2)
 
+        btn_undo = tk.Button(control_frame_1, text="Undo", command=self.undo_edit)
+        btn_undo.pack(side=tk.LEFT, padx=2)
+
+        btn_redo = tk.Button(control_frame_1, text="Redo", command=self.redo_edit)
+        btn_redo.pack(side=tk.LEFT, padx=2)
+
         # Second row of controls
         control_frame_2 = tk.Frame(control_frame)
         control_frame_2.pack(fill=tk.X, pady=2)
@@ -140,6 +992,13 @@ class ImageViewer:
         btn_smart_crop = tk.Button(control_frame_2, text="Smart Crop", command=self.open_smart_crop)
         btn_smart_crop.pack(side=tk.LEFT, padx=2)
 
+        btn_import_images = tk.Button(control_frame_2, text="Import Images", command=self.open_image_import)
+        btn_import_images.pack(side=tk.LEFT, padx=2)
+
+        ttk.Label(control_frame_2, text="Encoder:").pack(side=tk.LEFT, padx=(8, 2))
+        ttk.Combobox(control_frame_2, textvariable=self.encoder_profile, values=list(ENCODER_PROFILES),
+                     state="readonly", width=9).pack(side=tk.LEFT, padx=2)
+
         # Create horizontal main pane
         main_pane = tk.PanedWindow(master, orient=tk.HORIZONTAL)
         main_pane.grid(row=1, column=0, sticky="nsew", padx=2, pady=2)
@@ -166,14 +1025,11 @@ class ImageViewer:
         listbox_frame = tk.Frame(left_panel)
         left_panel.add(listbox_frame)
 
-        self.file_listbox = tk.Listbox(listbox_frame, selectmode=tk.EXTENDED)
+        # Virtual list: only the visible rows exist as canvas items
+        self.file_listbox = VirtualListbox(listbox_frame, text_for=os.path.basename,
+                                           on_activate=self.on_listbox_double_click)
         self.file_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        scrollbar_list = tk.Scrollbar(listbox_frame, orient=tk.VERTICAL, command=self.file_listbox.yview)
-        scrollbar_list.pack(side=tk.RIGHT, fill=tk.Y)
-        self.file_listbox.config(yscrollcommand=scrollbar_list.set)
-        self.file_listbox.bind("<Double-Button-1>", self.on_listbox_double_click)
-
         # Information box
         info_frame = tk.Frame(left_panel)
         left_panel.add(info_frame)
@@ -198,8 +1054,8 @@ class ImageViewer:
         self.scroll_y = tk.Scrollbar(canvas_frame, orient=tk.VERTICAL)
         self.scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
 
-        self.canvas = tk.Canvas(canvas_frame, xscrollcommand=self.scroll_x.set,
-                              yscrollcommand=self.scroll_y.set, cursor="cross")
+        self.canvas = tk.Canvas(canvas_frame, xscrollcommand=self._on_canvas_xscroll,
+                              yscrollcommand=self._on_canvas_yscroll, cursor="cross")
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
         self.scroll_x.config(command=self.canvas.xview)
@@ -209,6 +1065,7 @@ class ImageViewer:
         self.canvas.bind("<ButtonPress-1>", self.on_mouse_down)
         self.canvas.bind("<B1-Motion>", self.on_mouse_drag)
         self.canvas.bind("<ButtonRelease-1>", self.on_mouse_up)
+        self.canvas.bind("<Configure>", lambda event: self._schedule_viewport_render())
         
         # Bind Ctrl + mousewheel for zoom
         self.canvas.bind("<Control-MouseWheel>", self.on_mousewheel_zoom)
@@ -216,17 +1073,17 @@ class ImageViewer:
         # Bind regular mousewheel for scrolling
         self._bind_mousewheel()
 
-        # Load class names from YAML
-        try:
-            with open(yaml_path, 'r', encoding='utf-8') as f:
-                data = yaml.safe_load(f)
-            self.names = {int(k): v for k, v in data.get('names', {}).items()}
-        except Exception as e:
-            messagebox.showerror("Error", f"Error loading YAML file:\n{e}")
-            self.names = {}
+        # Undo / redo delle modifiche
+        self.master.bind("<Control-z>", lambda event: self.undo_edit())
+        self.master.bind("<Control-y>", lambda event: self.redo_edit())
+        self.master.bind("<Control-Shift-Z>", lambda event: self.redo_edit())
 
-        self.refresh_file_list()
-        self.load_current_image()
+        # La finestra compare subito: classi, elenco file e prima immagine arrivano dal
+        # lavoro di background di load_folder
+        if self.startup:
+            self.startup.mark("window")
+        self.load_folder(load_names=True)
+        self.master.after(FILE_WATCH_INTERVAL_MS, self.watch_file_list)
 
     def on_mousewheel_zoom(self, event):
         """Handle Ctrl + mousewheel zoom"""
@@ -236,8 +1093,9 @@ class ImageViewer:
             y = self.canvas.canvasy(event.y)
             
             # Calculate the percentage of the way across the image
-            x_percent = x / (self.current_image.width * self.zoom_factor) if self.current_image else 0
-            y_percent = y / (self.current_image.height * self.zoom_factor) if self.current_image else 0
+            img_w, img_h = self.image_size if self.current_image else (1, 1)
+            x_percent = x / (img_w * self.zoom_factor) if self.current_image else 0
+            y_percent = y / (img_h * self.zoom_factor) if self.current_image else 0
             
             if event.delta > 0:
                 # Zoom in using a smoother factor
@@ -254,17 +1112,22 @@ class ImageViewer:
             
             # Adjust view to keep the position under the cursor
             if self.current_image:
-                new_x = x_percent * (self.current_image.width * self.zoom_factor)
-                new_y = y_percent * (self.current_image.height * self.zoom_factor)
-                self.canvas.xview_moveto(max(0, (new_x - event.x)) / self.scaled_image.width)
-                self.canvas.yview_moveto(max(0, (new_y - event.y)) / self.scaled_image.height)
+                new_x = x_percent * (img_w * self.zoom_factor)
+                new_y = y_percent * (img_h * self.zoom_factor)
+                self.canvas.xview_moveto(max(0, (new_x - event.x)) / self.display_width)
+                self.canvas.yview_moveto(max(0, (new_y - event.y)) / self.display_height)
 
+    @timed()
     def update_info_box(self):
         """Update the information box with current image details"""
         self.info_text.delete(1.0, tk.END)
         if self.current_image:
-            w, h = self.current_image.size
-            self.info_text.insert(tk.END, f"Image Size: {w} x {h}\n\n")
+            w, h = self.image_size
+            self.info_text.insert(tk.END, f"Image Size: {w} x {h}\n")
+            info = self.metadata.get(self.image_path) if self.metadata and self.image_path else None
+            if info is not None:
+                self.info_text.insert(tk.END, f"Mode: {info.mode}, EXIF orientation: {info.orientation}\n")
+            self.info_text.insert(tk.END, "\n")
             self.info_text.insert(tk.END, "Annotations:\n")
             for i, ann in enumerate(self.current_annotations):
                 cls_id, x_c, y_c, w_a, h_a = ann
@@ -273,6 +1136,7 @@ class ImageViewer:
                 self.info_text.insert(tk.END, f"   Center: ({x_c:.3f}, {y_c:.3f})\n")
                 self.info_text.insert(tk.END, f"   Size: {w_a:.3f} x {h_a:.3f}\n\n")
 
+    @timed()
     def load_current_image(self):
         img_path = self.get_current_image_path()
         if not img_path:
@@ -290,46 +1154,47 @@ class ImageViewer:
         try:
             # Only reload the image if the path has changed
             if not hasattr(self, 'image_path') or self.image_path != img_path:
-                self.current_image = Image.open(img_path).convert("RGB")
+                cached = self.prefetcher.get(img_path)
+                self.full_decode_job = None
+                if cached is not None:
+                    self.current_image, cached_annotations = cached
+                    self.image_scale = 1.0
+                    logger.debug("Loaded image from prefetch cache: %s", img_path)
+                else:
+                    self.load_display_image(img_path)
+                    cached_annotations = None
+                    logger.debug("Loaded image: %s (scale %.3f)", img_path, self.image_scale)
                 self.image_path = img_path
-                print(f"Loaded image: {img_path}")
 
                 # Reset these attributes to force regeneration
-                if hasattr(self, 'base_display_image'):
-                    del self.base_display_image
-                if hasattr(self, 'scaled_image'):
-                    del self.scaled_image
-                if hasattr(self, 'tk_image'):
-                    del self.tk_image
+                self.pyramid = None
+                self.display_source = None
+                self.tile_cache.clear()
                 
                 # Carica le annotazioni
                 base_name = os.path.splitext(os.path.basename(img_path))[0]
                 label_file = os.path.join(label_dir, base_name + ".txt")
-                if self.show_annotations.get():
-                    self.current_annotations = self.load_annotations(label_file)
-                    print(f"Loaded annotations for {base_name}: {self.current_annotations}")
+                # Always loaded: "Show Annotations" only hides the canvas overlay
+                if cached_annotations is not None:
+                    self.current_annotations = cached_annotations
                 else:
-                    self.current_annotations = []
+                    self.current_annotations = self.load_annotations(label_file)
+                    if self.image_scale == 1.0:
+                        self.prefetcher.put(img_path, self.current_image, self.current_annotations)
+                logger.debug("Loaded annotations for %s: %s", base_name, self.current_annotations)
 
                 # Calcola le annotazioni in pixel
-                self.current_annotations_pix = []
-                w, h = self.current_image.size
-                for ann in self.current_annotations:
-                    cls_id, x_c, y_c, w_a, h_a = ann
-                    x1 = int((x_c - w_a / 2) * w)
-                    y1 = int((y_c - h_a / 2) * h)
-                    x2 = int((x_c + w_a / 2) * w)
-                    y2 = int((y_c + h_a / 2) * h)
-                    self.current_annotations_pix.append((cls_id, x1, y1, x2, y2))
+                self.set_annotations(self.current_annotations)
+                w, h = self.image_size
 
                 # Debug: stampa delle annotazioni caricate
-                print(f"Loaded annotations (YOLO): {self.current_annotations}")
-                print(f"Loaded annotations (pixel): {self.current_annotations_pix}")
+                logger.debug("Loaded annotations (YOLO): %s", self.current_annotations)
+                logger.debug("Loaded annotations (pixel): %s", self.annotation_boxes)
 
                 # Aggiorna la label della dimensione dell'immagine
                 self.image_size_label.config(text=f"Image Size: {w} x {h}")
             else:
-                print(f"Using cached image: {img_path}")
+                logger.debug("Using cached image: %s", img_path)
         except Exception as e:
             messagebox.showerror("Error", f"Error loading the image:\n{e}")
             self.current_image = None
@@ -342,7 +1207,7 @@ class ImageViewer:
 
         # Aggiorna la barra del titolo con il nome del file corrente
         self.master.title(f"Visual Editor - {os.path.basename(img_path)}")
-        print(f"Window title updated to: Visual Editor - {os.path.basename(img_path)}")
+        logger.debug("Window title updated to: Visual Editor - %s", os.path.basename(img_path))
 
         # Force update image and restore the scroll position
         self.update_image()
@@ -352,6 +1217,108 @@ class ImageViewer:
         
         self.update_info_box()
 
+        # Decodifica in anticipo le immagini vicine per una navigazione immediata
+        self.prefetcher.schedule(self.get_neighbour_paths())
+
+    # ------------------ ANTEPRIMA / PIENA RISOLUZIONE ------------------
+    @property
+    def image_size(self):
+        """Full-resolution (width, height) of the current image, even while a preview is shown."""
+        if self.image_scale < 1.0:
+            return self.full_image_size
+        return self.current_image.size
+
+    @timed()
+    def load_display_image(self, img_path):
+        """Carica un'anteprima ridotta se basta per lo zoom attuale, e la piena risoluzione in background."""
+        preloaded, self.preloaded_display = self.preloaded_display, None
+        if preloaded is not None and preloaded[0] == img_path:
+            _, image, full_size = preloaded  # Già decodificata in background da load_folder
+        else:
+            image, full_size = open_draft_image(img_path, self.zoom_factor)
+        self.current_image = image
+        self.full_image_size = full_size
+        self.image_scale = image.width / full_size[0]
+        if self.image_scale < 1.0:
+            self.start_full_decode(img_path)
+
+    @staticmethod
+    def _decode_full_image(img_path):
+        """Gira in un thread del JobScheduler: decodifica l'immagine a piena risoluzione."""
+        with Image.open(img_path) as img:
+            return img.convert("RGB")
+
+    def start_full_decode(self, img_path):
+        """Avvia la decodifica a piena risoluzione come job del JobScheduler.
+
+        Lo stato del job (immagine, errore, done, waiters) viene aggiornato solo sul
+        thread di Tk, dalle callback di submit.
+        """
+        job = {'path': img_path, 'image': None, 'error': None, 'done': False, 'waiters': []}
+        self.full_decode_job = job
+
+        def on_done(image):
+            job['image'] = image
+            self.on_full_decode_done(job)
+
+        def on_error(e):
+            job['error'] = e
+            self.on_full_decode_done(job)
+
+        self.jobs.submit(self._decode_full_image, img_path, on_done=on_done, on_error=on_error)
+
+    def on_full_decode_done(self, job):
+        """Swap in the full image once the zoom exceeds the preview resolution or an edit is waiting for it."""
+        job['done'] = True
+        if job is not self.full_decode_job:
+            return
+        waiters, job['waiters'] = job['waiters'], []
+        if waiters or self.zoom_factor > self.image_scale:
+            applied = self.apply_full_image(job)
+            self.update_image()
+            if applied:
+                for then in waiters:
+                    then()
+
+    @timed()
+    def apply_full_image(self, job):
+        """Sostituisce l'anteprima con l'immagine a piena risoluzione decodificata."""
+        if job is not self.full_decode_job:
+            return False
+        self.full_decode_job = None
+        if job['error'] is not None:
+            messagebox.showerror("Error", f"Error loading the full resolution image:\n{job['error']}")
+            logger.error("Error loading the full resolution image: %s", job['error'])
+            return False
+        self.current_image = job['image']
+        self.image_scale = 1.0
+        logger.debug("Full resolution image loaded: %s", job['path'])
+        return True
+
+    def ensure_full_resolution(self, then):
+        """Chiama then() sul thread di Tk appena l'immagine corrente è a piena risoluzione:
+        da usare prima di modificare i pixel. Non blocca: se la decodifica è ancora in corso
+        then() viene chiamata al suo termine (e mai, se nel frattempo si cambia immagine)."""
+        job = self.full_decode_job
+        if job is None:
+            if self.image_scale == 1.0:
+                then()
+        elif job['done']:
+            if self.apply_full_image(job):
+                then()
+        else:
+            logger.debug("Waiting for the full resolution image: %s", job['path'])
+            job['waiters'].append(then)
+
+    def get_neighbour_paths(self):
+        """Paths of the next/previous PREFETCH_RADIUS images, nearest first."""
+        paths = []
+        for offset in range(1, PREFETCH_RADIUS + 1):
+            for i in (self.index + offset, self.index - offset):
+                if 0 <= i < len(self.image_files):
+                    paths.append(self.image_files[i])
+        return paths
+
     # Add a helper method to restore scroll position
     def restore_scroll_position(self, x_scroll, y_scroll):
         """Restore the previous scroll position"""
@@ -362,14 +1329,6 @@ class ImageViewer:
             pass  # Ignore errors if canvas isn't ready
 
     # ------------------ METODI DI GESTIONE FILE ------------------
-    def gather_image_files(self):
-        """Raccoglie tutti i file immagine (jpg, jpeg, png) in image_dir."""
-        img_extensions = ('*.jpg', '*.jpeg', '*.png')
-        result = []
-        for ext in img_extensions:
-            result.extend(glob.glob(os.path.join(image_dir, ext)))
-        return [os.path.abspath(f) for f in result]  # Percorsi assoluti
-
     def select_base_folder(self):
         """Opens a directory browser and updates the paths for yaml, images, labels, and label formats."""
         folder_selected = filedialog.askdirectory()
@@ -381,42 +1340,152 @@ class ImageViewer:
             label_format_dir = os.path.join(folder_selected, "label_format")
             messagebox.showinfo("Folder Selected", f"Base folder set to: {folder_selected}")
 
-    def refresh_file_list(self):
-        previous_image = self.image_path
-        self.image_files = sorted(self.gather_image_files())  # Ordinamento sincronizzato
-        self.file_listbox.delete(0, tk.END)
-        for f in self.image_files:
-            self.file_listbox.insert(tk.END, os.path.basename(f))
-        print(f"File list updated. Total images: {len(self.image_files)}")
-        print("Image list:")
-        for i, f in enumerate(self.image_files):
-            print(f"{i}: {f}")
-        if previous_image and previous_image in self.image_files:
-            self.index = self.image_files.index(previous_image)
-            print(f"Previous image found. Index updated to: {self.index}")
-        elif self.image_files:
-            self.index = 0
-            print(f"Previous image not found. Index set to: {self.index}")
+    def load_folder(self, load_names=False):
+        """Scansiona image_dir in background (e con load_names legge data.yaml).
+
+        Su cartelle di rete la scansione può richiedere secondi: la finestra resta
+        reattiva e on_folder_scanned installa elenco e prima immagine quando è pronta.
+        """
+        folder = os.path.abspath(image_dir)
+        if self.loading_folder == folder:
+            return
+        self.loading_folder = folder
+        self.master.title("Visual Editor - Loading...")
+        self.jobs.submit(self._scan_folder, folder, yaml_path if load_names else None, self.zoom_factor,
+                         self.image_path, batch=True, on_done=self.on_folder_scanned,
+                         on_error=lambda e: self.on_folder_scan_failed(folder, e))
+
+    @staticmethod
+    def _scan_folder(folder, yaml_file, zoom, current_path):
+        """Lavoro di background di load_folder: classi, elenco immagini e anteprima
+        dell'immagine da mostrare per prima."""
+        names = names_error = None
+        if yaml_file:
+            try:
+                names = load_class_names(yaml_file)
+            except Exception as e:
+                names_error = e
+        index = DirectoryIndex(folder)
+        index.scan(force=True)
+        preview = None
+        if index.paths:
+            position = index.position(current_path) if current_path else None
+            first = index.paths[position or 0]
+            try:
+                preview = (first,) + open_draft_image(first, zoom)
+            except Exception as e:
+                logger.warning("Could not preload %s: %s", first, e)
+        return index, names, names_error, preview
+
+    def on_folder_scan_failed(self, folder, error):
+        if self.loading_folder == folder:
+            self.loading_folder = None
+        messagebox.showerror("Error", f"Error reading the image folder:\n{error}")
+        self.master.title("Visual Editor - No Image Loaded")
+
+    def on_folder_scanned(self, result):
+        """Installa l'elenco scansionato da load_folder e mostra la prima immagine."""
+        index, names, names_error, preview = result
+        if self.loading_folder == index.directory:
+            self.loading_folder = None
+        if names_error is not None:
+            messagebox.showerror("Error", f"Error loading YAML file:\n{names_error}")
+        elif names is not None:
+            self.names = names
+        if index.directory != os.path.abspath(image_dir):
+            return  # La cartella è cambiata durante la scansione
+        if self.startup:
+            self.startup.mark("file scan")
+
+        self.dir_index = index
+        self.image_files = self.dir_index.paths
+        self.file_listbox.set_items(self.image_files)
+        # Header-only metadata for the whole folder, refreshed in the background; a rescan
+        # of the same dataset keeps the index (and its connection) already open
+        if self.metadata is None or self.metadata.db_path != ImageMetadataIndex.path_for(yaml_path):
+            if self.metadata is not None:
+                self.metadata.close()
+            self.metadata = ImageMetadataIndex.for_dataset(yaml_path)
+        self.jobs.submit(self.metadata.update, list(self.image_files), batch=True)
+        # Stesso dataset (ad es. una nuova scansione): la cronologia di undo resta valida
+        if self.journal is None or self.journal.journal_dir != EditJournal.dir_for(yaml_path):
+            if self.journal is not None:
+                self.journal.close()
+            self.journal = EditJournal.for_dataset(yaml_path)
+        position = self.dir_index.position(self.image_path) if self.image_path else None
+        self.index = position if position is not None else 0
+        logger.info("File list loaded. Total images: %s", len(self.image_files))
+        self.update_file_list_selection()
+
+        self.preloaded_display = preview
+        self.load_current_image()
+        self.preloaded_display = None
+        if self.startup:
+            self.startup.mark("first image")
+            self.startup.report()
+            self.startup = None
+
+    @timed()
+    def refresh_file_list(self, added=None, removed=None):
+        """Aggiorna l'elenco file: con added/removed applica solo quelle modifiche,
+        altrimenti confronta la cartella con l'indice."""
+        if self.dir_index is None or self.dir_index.directory != os.path.abspath(image_dir):
+            # New folder: scanned in the background, see load_folder
+            self.load_folder()
+            return
+        elif added is None and removed is None:
+            self.apply_file_list_changes(self.dir_index.scan(force=True))
         else:
+            self.apply_file_list_changes(self.dir_index.apply(added or (), removed or ()))
+        logger.info("File list updated. Total images: %s", len(self.image_files))
+        self.update_file_list_selection()
+
+    def update_file_list_selection(self):
+        """Seleziona nella lista l'immagine corrente e aggiorna il titolo della finestra."""
+        if not self.image_files:
             self.index = -1
-            print("No images available.")
+            logger.info("No images available.")
 
         if self.index >=0 and self.index < len(self.image_files):
             self.file_listbox.selection_clear(0, tk.END)
             self.file_listbox.selection_set(self.index)
             self.file_listbox.see(self.index)
             self.master.title(f"Visual Editor - {os.path.basename(self.image_files[self.index])}")
-            print(f"Window title updated to: Visual Editor - {os.path.basename(self.image_files[self.index])}")
+            logger.debug("Window title updated to: Visual Editor - %s", os.path.basename(self.image_files[self.index]))
         else:
             self.file_listbox.selection_clear(0, tk.END)
             self.master.title("Visual Editor - No Image Loaded")
-            print("No images available after updating the list.")
+            logger.info("No images available after updating the list.")
 
-    def on_listbox_double_click(self, event):
+    def apply_file_list_changes(self, ops):
+        """Ripete sulla lista le operazioni dell'indice e riallinea self.index."""
+        self.file_listbox.apply_ops(ops)
+        if not ops:
+            return
+        position = self.dir_index.position(self.image_path) if self.image_path else None
+        if position is not None:
+            self.index = position
+            logger.debug("Previous image found. Index updated to: %s", self.index)
+        elif self.image_files:
+            self.index = max(0, min(self.index, len(self.image_files) - 1))
+            logger.debug("Previous image not found. Index set to: %s", self.index)
+
+    def watch_file_list(self):
+        """Controlla periodicamente la cartella e aggiorna solo le righe cambiate."""
+        if self.dir_index is not None and self.dir_index.directory == os.path.abspath(image_dir):
+            ops = self.dir_index.scan()
+            if ops:
+                self.apply_file_list_changes(ops)
+                logger.info("Image folder changed on disk: %s rows updated.", len(ops))
+        self.master.after(FILE_WATCH_INTERVAL_MS, self.watch_file_list)
+
+    def on_listbox_double_click(self, event=None):
         selection = self.file_listbox.curselection()
         if selection:
             self.index = selection[0]
-            print(f"Listbox double click. New index: {self.index}")
+            logger.debug("Listbox double click. New index: %s", self.index)
+            # Jumping elsewhere makes the pending neighbour jobs useless
+            self.prefetcher.cancel()
             self.load_current_image()
 
     # ------------------ NAVIGAZIONE ------------------
@@ -425,7 +1494,7 @@ class ImageViewer:
             return
         if self.index > 0:
             self.index -= 1
-            print(f"Previous navigation. New index: {self.index}")
+            logger.debug("Previous navigation. New index: %s", self.index)
             self.load_current_image()
 
     def show_next(self):
@@ -433,10 +1502,15 @@ class ImageViewer:
             return
         if self.index < len(self.image_files) - 1:
             self.index += 1
-            print(f"Next navigation. New index: {self.index}")
+            logger.debug("Next navigation. New index: %s", self.index)
             self.load_current_image()
 
     # ------------------ METODI GENERALI ------------------
+    def get_label_path(self, img_path):
+        """Restituisce il percorso del file .txt YOLO associato a un'immagine."""
+        base_name = os.path.splitext(os.path.basename(img_path))[0]
+        return os.path.join(label_dir, base_name + ".txt")
+
     def get_current_image_path(self):
         if len(self.image_files) == 0:
             return None
@@ -446,50 +1520,114 @@ class ImageViewer:
             self.index = len(self.image_files) - 1
         return self.image_files[self.index]
 
+    @timed()
     def update_image(self):
         if self.current_image is None:
             return
 
-        # Create a new image only if annotations are toggled or first load
-        # Otherwise, we can just rescale the existing base image
-        if not hasattr(self, 'base_display_image') or self.show_annotations.get():
-            pil_img = self.current_image.copy()
-            if self.show_annotations.get() and self.current_annotations:
-                pil_img = self.draw_boxes_on_image(pil_img, self.current_annotations, self.names)
-            self.base_display_image = pil_img
-        else:
-            pil_img = self.base_display_image
+        # Zoomed past the preview: switch to full resolution if it is already decoded
+        job = self.full_decode_job
+        if job is not None and self.zoom_factor > self.image_scale and job['done']:
+            self.apply_full_image(job)
+
+        # Rebuild the pyramid only when the pixels changed; zooming, scrolling and
+        # annotation edits reuse the existing pyramid and tiles
+        if getattr(self, 'display_source', None) is not self.current_image:
+            self.pyramid = ImagePyramid(self.current_image, full_size=self.image_size)
+            self.tile_cache.clear()
+            self.display_source = self.current_image
 
         # Debug: stampa delle annotazioni prima del ridimensionamento
-        print(f"Annotations before scaling: {self.current_annotations_pix}")
+        logger.debug("Annotations before scaling: %s boxes", len(self.annotation_boxes))
 
-        # Optimize image scaling by using a more efficient method for larger zoom factors
-        if self.zoom_factor >= 1.0:
-            # For zooming in, NEAREST is faster and still looks good for most images
-            resample_method = Image.NEAREST
-        else:
-            # For zooming out, stick with LANCZOS for better quality
-            resample_method = Image.LANCZOS
+        # Only the scroll region is sized to the full zoomed image; the pixels
+        # themselves are drawn tile by tile for the visible area in _render_viewport
+        self.display_width = max(1, int(self.pyramid.width * self.zoom_factor))
+        self.display_height = max(1, int(self.pyramid.height * self.zoom_factor))
+
+        self.canvas.delete("tile")
+        self.canvas.config(scrollregion=(0, 0, self.display_width, self.display_height))
+        self.tile_items = {}
+        self._render_viewport()
+        self.update_annotation_items()
 
-        # Calculate new dimensions
-        new_width = int(pil_img.width * self.zoom_factor)
-        new_height = int(pil_img.height * self.zoom_factor)
-        
-        # Create a new scaled image and force canvas update
-        # Removed the conditional check to ensure the image is always displayed
-        self.scaled_image = pil_img.resize((new_width, new_height), resample_method)
-        self.tk_image = ImageTk.PhotoImage(self.scaled_image)
-        
-        self.canvas.delete("all")
-        self.canvas.config(scrollregion=(0, 0, new_width, new_height))
-        self.canvas.create_image(0, 0, anchor=tk.NW, image=self.tk_image)
-        
-        # Debug: conferma del ridimensionamento
-        print(f"Image scaled to: {self.scaled_image.size}")
-        
         # Ensure the canvas is updated immediately
         self.canvas.update_idletasks()
 
+    # ------------------ VIEWPORT ------------------
+    def _on_canvas_xscroll(self, first, last):
+        """Aggiorna la scrollbar orizzontale e ridisegna l'area visibile."""
+        self.scroll_x.set(first, last)
+        self._schedule_viewport_render()
+
+    def _on_canvas_yscroll(self, first, last):
+        """Aggiorna la scrollbar verticale e ridisegna l'area visibile."""
+        self.scroll_y.set(first, last)
+        self._schedule_viewport_render()
+
+    def _schedule_viewport_render(self):
+        """Coalesce scroll/resize events into a single render when Tk is idle."""
+        if getattr(self, '_viewport_render_pending', False):
+            return
+        self._viewport_render_pending = True
+        self.master.after_idle(self._render_viewport)
+
+    def _visible_canvas_box(self):
+        """Returns the visible area of the scroll region in canvas coordinates."""
+        x_first, x_last = self.canvas.xview()
+        y_first, y_last = self.canvas.yview()
+        x1 = max(0, int(x_first * self.display_width))
+        y1 = max(0, int(y_first * self.display_height))
+        x2 = min(self.display_width, int(x_last * self.display_width + 0.5))
+        y2 = min(self.display_height, int(y_last * self.display_height + 0.5))
+        return x1, y1, x2, y2
+
+    @timed()
+    def _render_viewport(self):
+        """Disegna i tile che coprono l'area visibile (più un margine) e rimuove gli altri."""
+        self._viewport_render_pending = False
+        if self.current_image is None or getattr(self, 'pyramid', None) is None:
+            return
+
+        vx1, vy1, vx2, vy2 = self._visible_canvas_box()
+        if vx2 <= vx1 or vy2 <= vy1:
+            return
+
+        x1 = max(0, vx1 - VIEWPORT_MARGIN)
+        y1 = max(0, vy1 - VIEWPORT_MARGIN)
+        x2 = min(self.display_width, vx2 + VIEWPORT_MARGIN)
+        y2 = min(self.display_height, vy2 + VIEWPORT_MARGIN)
+
+        wanted = set()
+        created = 0
+        for ty in range(y1 // TILE_SIZE, (y2 - 1) // TILE_SIZE + 1):
+            for tx in range(x1 // TILE_SIZE, (x2 - 1) // TILE_SIZE + 1):
+                key = (self.zoom_factor, tx, ty)
+                wanted.add(key)
+                if key in self.tile_items:
+                    continue
+                tile_x, tile_y = tx * TILE_SIZE, ty * TILE_SIZE
+                photo = self.tile_cache.get(key)
+                if photo is None:
+                    tile_box = (tile_x, tile_y,
+                                min(self.display_width, tile_x + TILE_SIZE),
+                                min(self.display_height, tile_y + TILE_SIZE))
+                    photo = ImageTk.PhotoImage(self.pyramid.render(self.zoom_factor, tile_box))
+                    self.tile_cache.put(key, photo, pinned=self.tile_items)
+                    created += 1
+                self.tile_items[key] = self.canvas.create_image(
+                    tile_x, tile_y, anchor=tk.NW, image=photo, tags="tile")
+
+        # Tiles that scrolled out of view leave the canvas but stay in the cache
+        for key in [k for k in self.tile_items if k not in wanted]:
+            self.canvas.delete(self.tile_items.pop(key))
+        self.canvas.tag_lower("tile")
+
+        # Debug: conferma del ridimensionamento
+        if created and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Rendered %s tiles at zoom %.2f (pyramid level %s)",
+                         created, self.zoom_factor, self.pyramid.level_for_zoom(self.zoom_factor))
+
     # ------------------ ZOOM ------------------
     def zoom_in(self):
         """Zoom in with improved performance"""
@@ -499,7 +1637,7 @@ class ImageViewer:
             self.zoom_factor = 5.0
             
         if old_zoom != self.zoom_factor:  # Only update if zoom actually changed
-            print(f"Zoom in. New zoom factor: {self.zoom_factor}")
+            logger.debug("Zoom in. New zoom factor: %s", self.zoom_factor)
             self.update_image()
 
     def zoom_out(self):
@@ -510,29 +1648,27 @@ class ImageViewer:
             self.zoom_factor = 0.2
             
         if old_zoom != self.zoom_factor:  # Only update if zoom actually changed
-            print(f"Zoom out. New zoom factor: {self.zoom_factor}")
+            logger.debug("Zoom out. New zoom factor: %s", self.zoom_factor)
             self.update_image()
 
     def reset_zoom(self):
         """Resetta lo zoom all'impostazione predefinita (1.0)."""
         self.zoom_factor = 1.0
-        print("Zoom reset to 1.0")
+        logger.debug("Zoom reset to 1.0")
         self.update_image()
 
     # ------------------ ANNOTAZIONI ------------------
     def load_annotations(self, label_file):
-        """Legge il file .txt YOLO e restituisce una lista di tuple (cls_id, x_center, y_center, w, h)."""
-        if not os.path.exists(label_file):
-            return []
-        with open(label_file, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        ann = []
-        for line in lines:
-            parts = line.strip().split()
-            if len(parts) == 5:
-                cls_id, x_center, y_center, w, h = parts
-                ann.append((int(cls_id), float(x_center), float(y_center), float(w), float(h)))
-        return ann
+        """Legge il file .txt YOLO e restituisce un contenitore YoloAnnotations."""
+        return YoloAnnotations.load(label_file)
+
+    @timed()
+    def set_annotations(self, annotations):
+        """Imposta le annotazioni correnti e ricalcola box in pixel e indice spaziale."""
+        self.current_annotations = annotations
+        w, h = self.image_size
+        self.annotation_boxes = annotations.to_pixels(w, h)
+        self.rebuild_annotation_index()
 
     def save_annotation(self, label_file, cls_id, x_center, y_center, width, height):
         """Aggiunge una nuova annotazione YOLO alla fine del file .txt."""
@@ -548,8 +1684,9 @@ class ImageViewer:
             lines = f.readlines()
         if 0 <= index_to_remove < len(lines):
             del lines[index_to_remove]
-            with open(label_file, 'w', encoding='utf-8') as fw:
-                fw.writelines(lines)
+            with self.journal_recording(f"Delete annotation {index_to_remove + 1}", label_path=label_file):
+                with open(label_file, 'w', encoding='utf-8') as fw:
+                    fw.writelines(lines)
             messagebox.showinfo("Success", f"Annotation {index_to_remove + 1} deleted.")
         else:
             messagebox.showerror("Error", f"Invalid annotation index: {index_to_remove}")
@@ -562,155 +1699,167 @@ class ImageViewer:
         if os.path.exists(label_file):
             resp = messagebox.askyesno("Confirmation", f"Do you want to delete annotations for  {base_name}?")
             if resp:
-                os.remove(label_file)
-                self.current_annotations = []
-                self.current_annotations_pix = []
-                print(f"Annotations for {base_name} deleted.")
+                with self.journal_recording(f"Delete annotations of {base_name}", label_path=label_file):
+                    os.remove(label_file)
+                self.set_annotations(YoloAnnotations())
+                logger.info("Annotations for %s deleted.", base_name)
                 messagebox.showinfo("Deleted", f"Annotations for {base_name} deleted.")
                 self.update_image()
         else:
             messagebox.showinfo("Info", f"There are no annotations for {base_name}.")
-            print(f"No annotations found for {base_name}.")
-
-    def draw_boxes_on_image(self, image, annotations, names_dict):
-        """Disegna le bounding boxes sulle immagini utilizzando PIL."""
-        draw = ImageDraw.Draw(image)
-        w, h = image.size
-
-        try:
-            font = ImageFont.truetype("arial.ttf", 24)
-        except IOError:
-            font = ImageFont.load_default()
-
-        for ann in annotations:
-            cls_id, x_center, y_center, box_w, box_h = ann
-            x1 = int((x_center - box_w/2) * w)
-            y1 = int((y_center - box_h/2) * h)
-            x2 = int((x_center + box_w/2) * w)
-            y2 = int((y_center + box_h/2) * h)
-
-            outline_color = (0, 255, 0)  # Verde
-            draw.rectangle([x1, y1, x2, y2], outline=outline_color, width=3)
-
-            cls_name = names_dict.get(cls_id, str(cls_id))
-            bbox = draw.textbbox((0, 0), cls_name, font=font)
-            text_w = bbox[2] - bbox[0]
-            text_h = bbox[3] - bbox[1]
-
-            pad = 4
-            draw.rectangle([x1, y1 - text_h - pad, x1 + text_w + pad, y1],
-                           fill="black")
-            draw.text((x1 + pad/2, y1 - text_h - pad/2),
-                      cls_name, fill="white", font=font)
-
-        return image
+            logger.info("No annotations found for %s.", base_name)
+
+    @timed()
+    def update_annotation_items(self):
+        """Disegna le annotazioni come rettangoli/testi del canvas, o li riposiziona sullo zoom."""
+        key = (self.image_path, self.annotation_boxes.tobytes(), self.current_annotations.data['cls'].tobytes())
+        shown = self.show_annotations.get()
+        # Hidden items have no bbox, so their labels can only be rebuilt, not rescaled
+        zoom_changed = self.annotation_items_zoom != self.zoom_factor
+        if key != self.annotation_items_key or (zoom_changed and not shown):
+            self.canvas.delete("ann")
+            z = self.zoom_factor
+            classes = self.current_annotations.data['cls'].tolist()
+            for i, (x1, y1, x2, y2) in enumerate(self.annotation_boxes.tolist()):
+                cls_id = classes[i]
+                tags = ("ann", f"ann{i}")
+                self.canvas.create_rectangle(x1 * z, y1 * z, x2 * z, y2 * z,
+                                             outline=ANNOTATION_COLOR, width=3,
+                                             tags=tags + ("ann_box",))
+                cls_name = self.names.get(cls_id, str(cls_id))
+                text_id = self.canvas.create_text(x1 * z, y1 * z, anchor=tk.SW, text=cls_name,
+                                                  fill="white", font=ANNOTATION_FONT,
+                                                  tags=tags + ("ann_text",))
+                bg_id = self.canvas.create_rectangle(self.canvas.bbox(text_id), fill="black",
+                                                     outline="", tags=tags + ("ann_bg",))
+                self.canvas.tag_lower(bg_id, text_id)
+            self.annotation_items_key = key
+            self.annotation_items_zoom = z
+        elif zoom_changed:
+            # Boxes and label anchors scale with the image, label sizes stay constant
+            factor = self.zoom_factor / self.annotation_items_zoom
+            self.canvas.scale("ann_box", 0, 0, factor, factor)
+            self.canvas.scale("ann_text", 0, 0, factor, factor)
+            for i in range(len(self.annotation_boxes)):
+                tag = f"ann{i}"
+                text_box = self.canvas.bbox(f"ann_text&&{tag}")
+                if text_box:
+                    self.canvas.coords(f"ann_bg&&{tag}", *text_box)
+            self.annotation_items_zoom = self.zoom_factor
+        self.canvas.itemconfigure("ann", state=tk.NORMAL if shown else tk.HIDDEN)
+        self.canvas.tag_raise("ann")
+
+    def toggle_annotations(self):
+        """Mostra/nasconde le annotazioni senza toccare i pixel dell'immagine."""
+        self.canvas.itemconfigure("ann", state=tk.NORMAL if self.show_annotations.get() else tk.HIDDEN)
 
     # ------------------ ROTAZIONI / FLIP ------------------
     def rotate_image_clockwise(self):
         """Ruota l'immagine di +90 gradi utilizzando Pillow."""
-        if not self.current_image:
-            return
-        self.disable_rotation_buttons()
-        threading.Thread(target=self._rotate_image, args=(90,), daemon=True).start()
+        self.transform_current_image(90)
 
     def rotate_image_counterclockwise(self):
         """Ruota l'immagine di -90 gradi utilizzando Pillow."""
-        if not self.current_image:
-            return
-        self.disable_rotation_buttons()
-        threading.Thread(target=self._rotate_image, args=(-90,), daemon=True).start()
-
-    def _rotate_image(self, angle):
-        try:
-            if angle == 90:
-                rotated_img = self.current_image.transpose(Image.ROTATE_270)  # +90°
-            elif angle == -90:
-                rotated_img = self.current_image.transpose(Image.ROTATE_90)   # -90°
-            else:
-                rotated_img = self.current_image.rotate(angle, expand=True)
-
-            self.current_image = rotated_img
-            print(f"Image rotated by {angle} degrees.")
-
-            # Aggiorna le annotazioni
-            if self.current_annotations:
-                new_anns = self.rotate_bboxes_yolo(
-                    self.current_annotations,
-                    angle=angle
-                )
-                self.current_annotations = new_anns
-
-                # Salva le annotazioni nel file
-                base_name = os.path.splitext(os.path.basename(self.image_path))[0]
-                label_file = os.path.join(label_dir, base_name + ".txt")
-                self.save_annotations_to_file(label_file, new_anns)
-                print(f"Annotations rotated and saved in: {label_file}")
-
-                # Ricalcola le annotazioni in pixel
-                self.current_annotations_pix = []
-                w, h = self.current_image.size
-                for ann in self.current_annotations:
-                    cls_id, x_c, y_c, w_a, h_a = ann
-                    x1 = int((x_c - w_a / 2) * w)
-                    y1 = int((y_c - h_a / 2) * h)
-                    x2 = int((x_c + w_a / 2) * w)
-                    y2 = int((y_c + h_a / 2) * h)
-                    self.current_annotations_pix.append((cls_id, x1, y1, x2, y2))
-                print(f"Annotations in pixels updated: {self.current_annotations_pix}")
-
-            # Aggiorna l'immagine nella UI
-            self.master.after(0, self.update_image)
-
-        except Exception as e:
-            self.master.after(0, lambda: messagebox.showerror("Error", "Error in rotating the image:\n{e}"))
-            print(f"Error in rotating the image: {e}")
-        finally:
-            self.master.after(0, self.enable_rotation_buttons)
+        self.transform_current_image(-90)
 
     def flip_image_horizontally(self):
         """Flip orizzontale dell'immagine utilizzando Pillow."""
+        self.transform_current_image("flip")
+
+    def transform_current_image(self, transform):
+        """Rotate (90/-90) o flip ("flip") dell'immagine corrente come job in background.
+
+        Il job lavora su immagine e annotazioni passate come argomenti, tiene il lock
+        dell'immagine e salva su disco; current_image viene sostituita solo dalla
+        callback sul thread di Tk, se l'utente è ancora sulla stessa immagine.
+        """
         if not self.current_image:
             return
+        self.ensure_full_resolution(lambda: self._submit_transform(transform))
+
+    def _submit_transform(self, transform):
         self.disable_rotation_buttons()
-        threading.Thread(target=self._flip_image, daemon=True).start()
+        img_path = self.image_path
+
+        def on_error(e):
+            self.enable_rotation_buttons()
+            action = "flipping" if transform == "flip" else "rotating"
+            messagebox.showerror("Error", f"Error {action} the image:\n{e}")
+
+        description = "Flip" if transform == "flip" else f"Rotate {transform:+d}°"
+        self.jobs.submit(self._transform_image, img_path, self.current_image, self.current_annotations.copy(),
+                         transform, self.encoder_profile.get(), paths=(img_path,),
+                         record=self.journal_recording(f"{description} {os.path.basename(img_path)}", img_path,
+                                                       self.get_label_path(img_path), transform),
+                         on_done=lambda result: self._on_image_transformed(img_path, transform, result),
+                         on_error=on_error)
+
+    def _transform_image(self, img_path, image, annotations, transform, profile=None):
+        """Gira in un thread del JobScheduler: nessun accesso a Tk o allo stato del viewer."""
+        new_image = transpose_image(image, transform)
+        if transform == "flip":
+            new_anns = self.flip_bboxes_yolo(annotations)
+        else:
+            new_anns = self.rotate_bboxes_yolo(annotations, angle=transform)
+        atomic_save(new_image, img_path, profile=profile)
+        if len(annotations):
+            label_file = self.get_label_path(img_path)
+            self.save_annotations_to_file(label_file, new_anns)
+            logger.info("Annotations transformed (%s) and saved in: %s", transform, label_file)
+        return new_image, new_anns
+
+    def _on_image_transformed(self, img_path, transform, result):
+        self.enable_rotation_buttons()
+        new_image, new_anns = result
+        if transform == "flip":
+            logger.info("Horizontally flipped image.")
+        else:
+            logger.info("Image rotated by %s degrees.", transform)
+        if self.image_path != img_path:
+            return  # l'utente ha cambiato immagine: il file su disco è già aggiornato
+        self.current_image = new_image
+        self.set_annotations(new_anns)
+        logger.debug("Annotations in pixels updated: %s", self.annotation_boxes)
+        self.update_image()
 
-    def _flip_image(self):
-        try:
-            flipped_img = self.current_image.transpose(Image.FLIP_LEFT_RIGHT)
-            self.current_image = flipped_img
-            print("Horizontally flipped image.")
+    # ------------------ UNDO / REDO ------------------
+    def journal_recording(self, description, image_path=None, label_path=None, transform=None):
+        """Context manager che registra una modifica nel journal (nessuno se il dataset non è aperto)."""
+        if self.journal is None:
+            return contextlib.nullcontext()
+        return self.journal.recording(description, image_path, label_path, transform)
 
-            # Aggiorna le annotazioni
-            if self.current_annotations:
-                new_anns = self.flip_bboxes_yolo(self.current_annotations)
-                self.current_annotations = new_anns
+    def undo_edit(self):
+        """Annulla l'ultima modifica a immagini o label."""
+        self._revert_edit(undo=True)
 
-                # Salva le annotazioni nel file
-                base_name = os.path.splitext(os.path.basename(self.image_path))[0]
-                label_file = os.path.join(label_dir, base_name + ".txt")
-                self.save_annotations_to_file(label_file, new_anns)
-                print(f"Flipped annotations saved in: {label_file}")
-
-                # Ricalcola le annotazioni in pixel
-                self.current_annotations_pix = []
-                w, h = self.current_image.size
-                for ann in self.current_annotations:
-                    cls_id, x_c, y_c, w_a, h_a = ann
-                    x1 = int((x_c - w_a / 2) * w)
-                    y1 = int((y_c - h_a / 2) * h)
-                    x2 = int((x_c + w_a / 2) * w)
-                    y2 = int((y_c + h_a / 2) * h)
-                    self.current_annotations_pix.append((cls_id, x1, y1, x2, y2))
-                print(f"Updated pixel annotations after flip: {self.current_annotations_pix}")
-
-            # Aggiorna l'immagine nella UI
-            self.master.after(0, self.update_image)
+    def redo_edit(self):
+        """Ripete l'ultima modifica annullata."""
+        self._revert_edit(undo=False)
 
-        except Exception as e:
-            self.master.after(0, lambda: messagebox.showerror("Error", f"Error flipping the image:\n{e}"))
-            print(f"Error flipping the image: {e}")
-        finally:
-            self.master.after(0, self.enable_rotation_buttons)
+    def _revert_edit(self, undo):
+        """Esegue undo/redo come job, con i lock dei file coinvolti."""
+        if self.journal is None:
+            return
+        entry = self.journal.peek_undo() if undo else self.journal.peek_redo()
+        action = "Undo" if undo else "Redo"
+        if entry is None:
+            logger.info("Nothing to %s.", action.lower())
+            return
+
+        def on_done(done_entry):
+            if done_entry is None:
+                return
+            logger.info("%s: %s", action, done_entry.description)
+            current = self.image_path
+            if current and (done_entry.image_path == current or
+                            done_entry.label_path == self.get_label_path(current)):
+                self.image_path = None  # forza il ricaricamento dal disco
+                self.load_current_image()
+
+        self.jobs.submit(self.journal.undo if undo else self.journal.redo, entry,
+                         paths=EditJournal.paths(entry), on_done=on_done,
+                         on_error=lambda e: messagebox.showerror(action, f"{action} failed:\n{e}"))
 
     def disable_rotation_buttons(self):
         """Disabilita i pulsanti di rotazione e flip per prevenire operazioni multiple simultanee."""
@@ -723,7 +1872,7 @@ class ImageViewer:
                         for widget in frame.winfo_children():
                             if isinstance(widget, tk.Button) and widget['text'] in ["Rotate -90°", "Rotate +90°", "Horizontal Flip"]:
                                 widget.config(state=tk.DISABLED)
-                                print(f"Button disabled: {widget['text']}")
+                                logger.debug("Button disabled: %s", widget['text'])
 
     def enable_rotation_buttons(self):
         """Riabilita i pulsanti di rotazione e flip dopo l'elaborazione."""
@@ -736,7 +1885,7 @@ class ImageViewer:
                         for widget in frame.winfo_children():
                             if isinstance(widget, tk.Button) and widget['text'] in ["Rotate -90°", "Rotate +90°", "Horizontal Flip"]:
                                 widget.config(state=tk.NORMAL)
-                                print(f"Button re-enabled: {widget['text']}")
+                                logger.debug("Button re-enabled: %s", widget['text'])
 
     # ------------------ EVENTI MOUSE ------------------
     def on_mouse_down(self, event):
@@ -747,8 +1896,9 @@ class ImageViewer:
             self.rect_id = None
         # Reset rectangle size label
         self.rect_size_label.config(text="Rect Size: N/A")
-        print(f"Mouse down at ({self.start_x_canvas}, {self.start_y_canvas})")
+        logger.debug("Mouse down at (%s, %s)", self.start_x_canvas, self.start_y_canvas)
 
+    @timed()
     def on_mouse_drag(self, event):
         cur_x_canvas = self.canvas.canvasx(event.x)
         cur_y_canvas = self.canvas.canvasy(event.y)
@@ -764,7 +1914,7 @@ class ImageViewer:
             rect_width = abs(cur_x_canvas - self.start_x_canvas) / self.zoom_factor
             rect_height = abs(cur_y_canvas - self.start_y_canvas) / self.zoom_factor
             self.rect_size_label.config(text=f"Rect Size: {int(rect_width)} x {int(rect_height)}")
-            print(f"Mouse drag to ({cur_x_canvas}, {cur_y_canvas}) - Size: {int(rect_width)}x{int(rect_height)}")
+            logger.debug("Mouse drag to (%s, %s) - Size: %sx%s", cur_x_canvas, cur_y_canvas, int(rect_width), int(rect_height))
 
     def on_mouse_up(self, event):
         end_x_canvas = self.canvas.canvasx(event.x)
@@ -774,7 +1924,7 @@ class ImageViewer:
             dy = abs(end_y_canvas - self.start_y_canvas)
 
             if dx < 5 and dy < 5:
-                print(f"Mouse click at ({end_x_canvas}, {end_y_canvas}) - Potential annotation deletion")
+                logger.debug("Mouse click at (%s, %s) - Potential annotation deletion", end_x_canvas, end_y_canvas)
                 self.select_annotation_at(end_x_canvas, end_y_canvas)
             else:
                 rx1 = min(self.start_x_canvas, end_x_canvas) / self.zoom_factor
@@ -783,10 +1933,13 @@ class ImageViewer:
                 ry2 = max(self.start_y_canvas, end_y_canvas) / self.zoom_factor
 
                 if self.is_cropping:
-                    print(f"Initiating crop with box ({rx1}, {ry1}, {rx2}, {ry2})")
+                    logger.debug("Initiating crop with box (%s, %s, %s, %s)", rx1, ry1, rx2, ry2)
                     self.do_crop(rx1, ry1, rx2, ry2)
+                elif event.state & 0x1:  # Shift: selezione multipla
+                    logger.debug("Selecting annotations in box (%s, %s, %s, %s)", rx1, ry1, rx2, ry2)
+                    self.select_annotations_in(rx1, ry1, rx2, ry2)
                 else:
-                    print(f"Creating new annotation with box ({rx1}, {ry1}, {rx2}, {ry2})")
+                    logger.debug("Creating new annotation with box (%s, %s, %s, %s)", rx1, ry1, rx2, ry2)
                     self.create_new_annotation(rx1, ry1, rx2, ry2)
 
             # Reset rectangle size label
@@ -797,35 +1950,56 @@ class ImageViewer:
         if self.rect_id:
             self.canvas.delete(self.rect_id)
             self.rect_id = None
-        print(f"Mouse up at ({end_x_canvas}, {end_y_canvas})")
+        logger.debug("Mouse up at (%s, %s)", end_x_canvas, end_y_canvas)
 
+    @timed()
     def select_annotation_at(self, x_canvas, y_canvas):
+        if not self.show_annotations.get():
+            return
         rx = x_canvas / self.zoom_factor
         ry = y_canvas / self.zoom_factor
-        print(f"Selecting annotation at ({rx}, {ry})")
-        for i, (cls_id, x1, y1, x2, y2) in enumerate(self.current_annotations_pix):
-            if x1 <= rx <= x2 and y1 <= ry <= y2:
-                cls_name = self.names.get(cls_id, str(cls_id))
-                resp = messagebox.askyesno("Delete Annotation",
-                                           f"Do you want to delete  '{cls_name}'?")
-                if resp:
-                    label_file = os.path.join(label_dir, os.path.splitext(os.path.basename(self.image_path))[0] + ".txt")
-                    self.delete_annotation_at_index(label_file, i)
-                    # Aggiorna l'elenco delle annotazioni
-                    self.current_annotations = self.load_annotations(label_file)
-                    self.current_annotations_pix = []
-                    w, h = self.current_image.size
-                    for ann in self.current_annotations:
-                        cls_id, x_c, y_c, w_a, h_a = ann
-                        x1 = int((x_c - w_a / 2) * w)
-                        y1 = int((y_c - h_a / 2) * h)
-                        x2 = int((x_c + w_a / 2) * w)
-                        y2 = int((y_c + h_a / 2) * h)
-                        self.current_annotations_pix.append((cls_id, x1, y1, x2, y2))
-                    print(f"Annotation {i + 1} deleted.")
-                    self.update_image()
-                return
-        print("No annotation found at that position.")
+        logger.debug("Selecting annotation at (%s, %s)", rx, ry)
+        i = self.annotation_grid.query_point(rx, ry)
+        if i is None:
+            logger.debug("No annotation found at that position.")
+            return
+        cls_id = int(self.current_annotations.data['cls'][i])
+        cls_name = self.names.get(cls_id, str(cls_id))
+        resp = messagebox.askyesno("Delete Annotation",
+                                   f"Do you want to delete  '{cls_name}'?")
+        if resp:
+            label_file = self.get_label_path(self.image_path)
+            self.delete_annotation_at_index(label_file, i)
+            # Aggiorna l'elenco delle annotazioni e l'indice spaziale
+            self.current_annotations.delete([i])
+            self.annotation_boxes = np.delete(self.annotation_boxes, i, axis=0)
+            self.annotation_grid.remove(i)
+            logger.info("Annotation %s deleted.", i + 1)
+            self.update_image()
+
+    def select_annotations_in(self, rx1, ry1, rx2, ry2):
+        """Selezione multipla (Shift + trascinamento): elimina le annotazioni interne al rettangolo."""
+        if not self.show_annotations.get() or not self.image_path:
+            return
+        indices = self.annotation_grid.query_rect(rx1, ry1, rx2, ry2)
+        if not indices:
+            logger.info("No annotations inside the selection.")
+            return
+        resp = messagebox.askyesno("Delete Annotations",
+                                   f"Do you want to delete the {len(indices)} selected annotations?")
+        if not resp:
+            return
+        self.current_annotations.delete(indices)
+        label_file = self.get_label_path(self.image_path)
+        with self.journal_recording(f"Delete {len(indices)} annotations", label_path=label_file):
+            self.save_annotations_to_file(label_file, self.current_annotations)
+        self.set_annotations(self.current_annotations)
+        logger.info("%s annotations deleted.", len(indices))
+        self.update_image()
+
+    def rebuild_annotation_index(self):
+        """Ricostruisce l'indice spaziale dopo modifiche che toccano tutte le box."""
+        self.annotation_grid = SpatialGrid(self.annotation_boxes.tolist())
 
     def create_new_annotation(self, rx1, ry1, rx2, ry2):
         cls_name = simpledialog.askstring("Class", "Enter the class name:")
@@ -844,22 +2018,32 @@ class ImageViewer:
             if class_id is None:
                 messagebox.showinfo("Error",
                                     f"The class '{cls_name}' does not exist in the names file.")
-                print(f"Class '{cls_name}' not found in the file names.")
+                logger.warning("Class '%s' not found in the file names.", cls_name)
             else:
-                w, h = self.current_image.size
+                w, h = self.image_size
                 x_center = ((rx1 + rx2)/2.0) / w
                 y_center = ((ry1 + ry2)/2.0) / h
                 box_w = (rx2 - rx1) / w
                 box_h = (ry2 - ry1) / h
 
+                # Keep only the part of the rectangle that lies on the image
+                new_ann = YoloAnnotations.from_tuples([(class_id, x_center, y_center, box_w, box_h)]).clipped()
+                if not len(new_ann):
+                    messagebox.showinfo("Error", "The selected area is outside the image.")
+                    return
+                class_id, x_center, y_center, box_w, box_h = new_ann[0]
+
                 base_name = os.path.splitext(os.path.basename(self.image_path))[0]
                 label_file = os.path.join(label_dir, base_name + ".txt")
-                self.save_annotation(label_file, class_id, x_center, y_center, box_w, box_h)
-                print(f"New annotation saved: Class ID {class_id}, Center ({x_center}, {y_center}), Size ({box_w}, {box_h})")
+                with self.journal_recording(f"New annotation in {base_name}", label_path=label_file):
+                    self.save_annotation(label_file, class_id, x_center, y_center, box_w, box_h)
+                logger.info("New annotation saved: Class ID %s, Center (%s, %s), Size (%s, %s)", class_id, x_center, y_center, box_w, box_h)
 
                 # Aggiungi l'annotazione all'elenco corrente
-                self.current_annotations.append((class_id, x_center, y_center, box_w, box_h))
-                self.current_annotations_pix.append((class_id, int(rx1), int(ry1), int(rx2), int(ry2)))  # Corretto
+                self.current_annotations.append(class_id, x_center, y_center, box_w, box_h)
+                new_box = new_ann.to_pixels(w, h)
+                self.annotation_boxes = np.vstack([self.annotation_boxes, new_box])
+                self.annotation_grid.insert(new_box[0].tolist())
 
                 self.update_image()
 
@@ -868,11 +2052,14 @@ class ImageViewer:
         messagebox.showinfo("Crop Mode",
                             "Select the area to crop with the mouse.\n"
                             "Upon release, a new file with suffix _XXX will be created and automatically loaded.")
-        print("Crop mode activated.")
+        logger.debug("Crop mode activated.")
 
     def do_crop(self, rx1, ry1, rx2, ry2):
         if self.current_image is None:
             return
+        self.ensure_full_resolution(lambda: self._save_crop(rx1, ry1, rx2, ry2))
+
+    def _save_crop(self, rx1, ry1, rx2, ry2):
         rx1 = max(0, rx1)
         ry1 = max(0, ry1)
         rx2 = min(self.current_image.width, rx2)
@@ -880,12 +2067,12 @@ class ImageViewer:
 
         if rx2 - rx1 < 5 or ry2 - ry1 < 5:
             messagebox.showinfo("Error", "Crop area too small.")
-            print("Attempt to crop with too small an area.")
+            logger.info("Attempt to crop with too small an area.")
             return
 
         crop_box = (int(rx1), int(ry1), int(rx2), int(ry2))
         cropped_img = self.current_image.crop(crop_box)
-        print(f"Selected crop area: {crop_box}")
+        logger.debug("Selected crop area: %s", crop_box)
 
         current_path = self.image_path
         if not current_path:
@@ -903,119 +2090,115 @@ class ImageViewer:
             new_base_name = f"{base_name}_{counter:03d}"
             new_path = os.path.join(dir_name, f"{new_base_name}{ext}")
 
-        # Determina il formato basato sull'estensione
-        format_map = {
-            '.jpg': 'JPEG',
-            '.jpeg': 'JPEG',
-            '.png': 'PNG',
-            # aggiungi altri formati se necessario
-        }
-        img_format = format_map.get(ext.lower(), 'PNG')  # default a PNG se sconosciuto
+        # Determina il formato basato sull'estensione (default a PNG se sconosciuto)
+        img_format = TILE_FORMATS.get(ext.lower(), 'PNG')
 
         try:
-            cropped_img.save(new_path, format=img_format)
-            print(f"Crop saved: {new_path} with format {img_format}")
+            atomic_save(cropped_img, new_path, format=img_format, profile=self.encoder_profile.get())
+            logger.info("Crop saved: %s with format %s", new_path, img_format)
             messagebox.showinfo("Crop", f"Crop saved in:\n{new_path}\nOpening the new image.")
         except Exception as e:
             messagebox.showerror("Error", f"Error saving the crop:\n{e}")
-            print(f"Error saving the crop: {e}")
+            logger.error("Error saving the crop: %s", e)
             return
 
         self.is_cropping = False
 
         # Ricarica la lista dei file per includere la nuova immagine
-        self.refresh_file_list()
+        self.refresh_file_list(added=[new_path])
 
-        try:
+        position = self.dir_index.position(os.path.abspath(new_path))
+        if position is not None:
             # Imposta l'indice alla nuova immagine
-            self.index = self.image_files.index(os.path.abspath(new_path))
-            print(f"New index set for the crop: {self.index} ({new_path})")
+            self.index = position
+            logger.debug("New index set for the crop: %s (%s)", self.index, new_path)
             self.load_current_image()
-        except ValueError:
+        else:
             messagebox.showerror("Error", f"Cropped image not found in the list: {new_path}")
-            print(f"Cropped image not found in the list: {new_path}")
+            logger.warning("Cropped image not found in the list: %s", new_path)
 
     def halve_resolution(self):
         img_path = self.get_current_image_path()
         if not img_path:
             return
-        try:
-            img = Image.open(img_path).convert("RGB")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error loading the image:\n{e}")
-            print(f"Error loading the image: {e}")
-            return
 
-        w, h = img.size
-        if w < 2 or h < 2:
-            messagebox.showinfo("Error", "Unable to reduce further.")
-            print("Unable to reduce the image further.")
-            return
-        new_w = w // 2
-        new_h = h // 2
-        resized = img.resize((new_w, new_h), Image.LANCZOS)
-        try:
-            resized.save(img_path)
-            print(f"Image reduced to: {img_path} with dimensions {new_w}x{new_h}")
+        def on_done(new_size):
+            new_w, new_h = new_size
+            logger.info("Image reduced to: %s with dimensions %sx%s", img_path, new_w, new_h)
             messagebox.showinfo("Half Resolution",
                                 f"Image reduced to {new_w}x{new_h}.\nReloading the photo...")
-            self.load_current_image()
-        except Exception as e:
-            messagebox.showerror("Error", f"Error saving the reduced image:\n{e}")
-            print(f"Error saving the reduced image: {e}")
+            if self.image_path == img_path:
+                self.image_path = None  # forza il ricaricamento dal disco
+                self.load_current_image()
+
+        def on_error(e):
+            if isinstance(e, ValueError):
+                messagebox.showinfo("Error", "Unable to reduce further.")
+                logger.info("Unable to reduce the image further.")
+            else:
+                messagebox.showerror("Error", f"Error reducing the image:\n{e}")
+
+        self.jobs.submit(halve_image_file, img_path, self.encoder_profile.get(), paths=(img_path,),
+                         on_done=on_done, on_error=on_error,
+                         record=self.journal_recording(f"Half Resolution {os.path.basename(img_path)}", img_path))
 
     # ------------------ NUOVO METODO: MEZZA RISOLUZIONE SELECTED ------------------
     def halve_resolution_selected(self):
+        """Riduce i file selezionati in background, con avanzamento e Cancel."""
         selected_indices = self.file_listbox.curselection()
         if not selected_indices:
             messagebox.showinfo("Info", "No files selected for half resolution.")
-            print("No files selected for half resolution.")
+            logger.info("No files selected for half resolution.")
             return
 
         selected_files = [self.image_files[i] for i in selected_indices]
-        print(f"Half resolution selected for {len(selected_files)} files.")
+        logger.info("Half resolution selected for %s files.", len(selected_files))
 
         resp = messagebox.askyesno(
             "Confirm Half Resolution",
             f"Do you want to reduce the {len(selected_files)} selected files to half resolution?"
         )
         if not resp:
-            print("Half resolution canceled by the user.")
+            logger.info("Half resolution canceled by the user.")
             return
 
         errors = []
-        for file_path in selected_files:
-            try:
-                img = Image.open(file_path).convert("RGB")
-                w, h = img.size
-                if w < 2 or h < 2:
-                    errors.append(f"'{os.path.basename(file_path)}': unable to reduce further.")
-                    print(f"Unable to reduce further: {file_path}")
-                    continue
-                new_w = w // 2
-                new_h = h // 2
-                resized = img.resize((new_w, new_h), Image.LANCZOS)
-                resized.save(file_path)
-                print(f"Image reduced to: {file_path} with dimensions {new_w}x{new_h}")
-            except Exception as e:
-                errors.append(f"Error during the reduction of '{os.path.basename(file_path)}': {e}")
-                print(f"Error during the reduction of '{file_path}': {e}")
 
-        if errors:
-            error_message = "\n".join(errors)
-            messagebox.showerror("Errors During Half Resolution", error_message)
-            print("Errors during half resolution:")
-            for error in errors:
-                print(error)
-        else:
-            messagebox.showinfo("Success", "All selected files have been reduced to half resolution.")
-            print("All selected files have been reduced to half resolution.")
+        def on_item(file_path, new_size, error):
+            if error is None:
+                logger.debug("Image reduced to: %s with dimensions %sx%s", file_path, new_size[0], new_size[1])
+            elif isinstance(error, ValueError):
+                errors.append(f"'{os.path.basename(file_path)}': unable to reduce further.")
+                logger.warning("Unable to reduce further: %s", file_path)
+            else:
+                errors.append(f"Error during the reduction of '{os.path.basename(file_path)}': {error}")
+                logger.error("Error during the reduction of '%s': %s", file_path, error)
+
+        def on_finish(dialog):
+            if dialog.cancelled:
+                messagebox.showinfo("Half Resolution", f"Half resolution canceled after {dialog.done} files.")
+            elif errors:
+                messagebox.showerror("Errors During Half Resolution", "\n".join(errors[:20]))
+                logger.error("Errors during half resolution:")
+                for error in errors:
+                    logger.error("%s", error)
+            else:
+                messagebox.showinfo("Success", "All selected files have been reduced to half resolution.")
+                logger.info("All selected files have been reduced to half resolution.")
 
-        self.refresh_file_list()
+            # Nessun file aggiunto o rimosso: riallinea solo la selezione
+            self.refresh_file_list(added=(), removed=())
 
-        # Se l'immagine attuale è stata ridotta, ricarichiamola
-        if self.image_path in selected_files:
-            self.load_current_image()
+            # Se l'immagine attuale è stata ridotta, ricarichiamola
+            if self.image_path in selected_files:
+                self.image_path = None
+                self.load_current_image()
+
+        profile = self.encoder_profile.get()
+        self.jobs.run_batch("Half Resolution", halve_image_file, selected_files,
+                            args_for=lambda path: (path, profile), on_item=on_item, on_finish=on_finish,
+                            record_for=lambda path: self.journal_recording(
+                                f"Half Resolution {os.path.basename(path)}", path))
     # ------------------------------------------------------------------------------
 
     # ------------------ DELETE SELECTED FILES ------------------
@@ -1023,101 +2206,98 @@ class ImageViewer:
         selected_indices = self.file_listbox.curselection()
         if not selected_indices:
             messagebox.showinfo("Info", "No files selected for deletion.")
-            print("No files selected for deletion.")
+            logger.info("No files selected for deletion.")
             return
 
         selected_files = [self.image_files[i] for i in selected_indices]
-        print(f"Deleting {len(selected_files)} selected files.")
+        logger.info("Deleting %s selected files.", len(selected_files))
 
         resp = messagebox.askyesno(
             "Confirm Deletion",
             f"Do you want to delete {len(selected_files)} selected files and their annotations?"
         )
         if not resp:
-            print("Deletion canceled by the user.")
+            logger.info("Deletion canceled by the user.")
             return
 
         errors = []
-        for file_path in selected_files:
-            try:
-                # Elimina il file immagine
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    print(f"File deleted: {file_path}")
-                
-                # Elimina il file di annotazione corrispondente
-                base_name = os.path.splitext(os.path.basename(file_path))[0]
-                label_file = os.path.join(label_dir, base_name + ".txt")
-                if os.path.exists(label_file):
-                    os.remove(label_file)
-                    print(f"Annotation deleted: {label_file}")
-            except Exception as e:
-                errors.append(f"Error deleting {file_path}: {e}")
-                print(f"Error deleting {file_path}: {e}")
 
-        if errors:
-            error_message = "\n".join(errors)
-            messagebox.showerror("Errors During Deletion", error_message)
-            print("Errors during deletion:")
-            for error in errors:
-                print(error)
-        else:
-            messagebox.showinfo("Success", "Selected files and their annotations have been successfully deleted.")
-            print("Deletion successfully completed.")
-
-        # Aggiorna la lista dei file
-        self.refresh_file_list()
-
-        # Se l'immagine attuale è stata eliminata, carica la prossima immagine disponibile
-        if self.image_path in selected_files:
-            if self.image_files:
-                self.index = min(self.index, len(self.image_files) - 1)
-                print(f"Current image deleted. New index: {self.index}")
-                self.load_current_image()
+        def on_item(file_path, deleted, error):
+            if error is not None:
+                errors.append(f"Error deleting {file_path}: {error}")
+                logger.error("Error deleting %s: %s", file_path, error)
             else:
-                self.canvas.delete("all")
-                self.image_size_label.config(text="Image Size: N/A")
-                self.rect_size_label.config(text="Rect Size: N/A")
-                self.current_image = None
-                self.image_path = None
-                self.current_annotations = []
-                self.master.title("Visual Editor - No Image Loaded")
-                print("No images available after deletion.")
+                for path in deleted:
+                    logger.debug("File deleted: %s", path)
+
+        def on_finish(dialog):
+            if errors:
+                error_message = "\n".join(errors[:20])
+                messagebox.showerror("Errors During Deletion", error_message)
+                logger.error("Errors during deletion:")
+                for error in errors:
+                    logger.error("%s", error)
+            elif dialog.cancelled:
+                messagebox.showinfo("Deletion", "Deletion canceled.")
+            else:
+                messagebox.showinfo("Success", "Selected files and their annotations have been successfully deleted.")
+                logger.info("Deletion successfully completed.")
+
+            # Aggiorna la lista dei file
+            self.refresh_file_list(removed=[f for f in selected_files if not os.path.exists(f)])
+
+            # Se l'immagine attuale è stata eliminata, carica la prossima immagine disponibile
+            if self.image_path in selected_files and not os.path.exists(self.image_path):
+                if self.image_files:
+                    self.index = min(self.index, len(self.image_files) - 1)
+                    logger.debug("Current image deleted. New index: %s", self.index)
+                    self.load_current_image()
+                else:
+                    self.canvas.delete("all")
+                    self.image_size_label.config(text="Image Size: N/A")
+                    self.rect_size_label.config(text="Rect Size: N/A")
+                    self.current_image = None
+                    self.full_decode_job = None
+                    self.annotation_items_key = None
+                    self.image_path = None
+                    self.current_annotations = YoloAnnotations()
+                    self.master.title("Visual Editor - No Image Loaded")
+                    logger.info("No images available after deletion.")
+
+        self.jobs.run_batch("Deleting", delete_image_files, selected_files,
+                            args_for=lambda path: (path, label_dir), process=False,
+                            on_item=on_item, on_finish=on_finish)
 
     # ------------------ NUOVA FUNZIONE: Trasf Grigio ------------------
     def apply_transformation_grigio(self):
         """Applica una trasformazione in scala di grigi all'immagine corrente."""
         if not self.current_image:
             messagebox.showinfo("Info", "No image loaded.")
-            print("Attempt to apply transformation without an image loaded.")
+            logger.info("Attempt to apply transformation without an image loaded.")
             return
 
-        try:
-            # Converti l'immagine in scala di grigi
-            gray_image = self.current_image.convert('L').convert('RGB')  # Converti in 'L' (grayscale) e poi in 'RGB'
-            print(f"Gray scale transformation applied: {gray_image.size}")
-
-            # Sovrascrivi l'immagine corrente con quella trasformata
-            self.current_image = gray_image
-            self.current_image.save(self.image_path)
-            print(f"Image saved with gray transformation: {self.image_path}")
-
-            # Aggiorna la visualizzazione dell'immagine
-            self.update_image()
+        img_path = self.image_path
 
-            # Notifica all'utente
-            messagebox.showinfo("Gray Transformation", f"Transformation applied and saved at:\n{self.image_path}")
+        def on_done(_):
+            logger.info("Image saved with gray transformation: %s", img_path)
+            if self.image_path == img_path:
+                self.image_path = None  # forza il ricaricamento dal disco
+                self.load_current_image()
+            messagebox.showinfo("Gray Transformation", f"Transformation applied and saved at:\n{img_path}")
 
-        except Exception as e:
+        def on_error(e):
             messagebox.showerror("Error", f"Error applying gray transformation:\n{e}")
-            print(f"Error applying gray transformation: {e}")
+
+        self.jobs.submit(grayscale_image_file, img_path, self.encoder_profile.get(), paths=(img_path,),
+                         on_done=on_done, on_error=on_error,
+                         record=self.journal_recording(f"Gray {os.path.basename(img_path)}", img_path))
 
     # ------------------ NUOVE FUNZIONI: RINOMINA ------------------
     def rename_current_image(self):
         """Rinomina l'immagine attualmente aperta e il suo file di annotazione."""
         if not self.image_path:
             messagebox.showinfo("Info", "No image loaded to rename.")
-            print("Attempt to rename without an image loaded.")
+            logger.info("Attempt to rename without an image loaded.")
             return
 
         current_name = os.path.basename(self.image_path)
@@ -1126,7 +2306,7 @@ class ImageViewer:
         if new_name:
             # Verifica se l'estensione è presente, altrimenti aggiungila
             base, ext = os.path.splitext(new_name)
-            if ext.lower() not in ['.jpg', '.jpeg', '.png']:
+            if ext.lower() not in IMAGE_EXTENSIONS:
                 ext = os.path.splitext(self.image_path)[1]  # Mantiene l'estensione originale
                 new_name = base + ext
 
@@ -1136,138 +2316,175 @@ class ImageViewer:
 
             try:
                 os.rename(self.image_path, new_path)
-                print(f"Image renamed from {self.image_path} to {new_path}")
+                logger.info("Image renamed from %s to %s", self.image_path, new_path)
 
                 # Rinomina anche il file di annotazione, se esiste
                 if os.path.exists(label_file_old):
                     os.rename(label_file_old, label_file_new)
-                    print(f"Annotation renamed from {label_file_old} to {label_file_new}")
+                    logger.info("Annotation renamed from %s to %s", label_file_old, label_file_new)
 
                 messagebox.showinfo("Success", f"Image renamed to:\n{new_name}")
 
                 # Aggiorna l'elenco dei file
-                self.refresh_file_list()
+                self.refresh_file_list(added=[new_path], removed=[self.image_path])
 
                 # Trova il nuovo indice dell'immagine rinominata
-                self.index = self.image_files.index(os.path.abspath(new_path))
+                self.index = self.dir_index.position(os.path.abspath(new_path))
                 self.load_current_image()
 
             except Exception as e:
                 messagebox.showerror("Error", f"Error in renaming:\n{e}")
-                print(f"Error renaming: {e}")
+                logger.error("Error renaming: %s", e)
 
     def rename_selected_images(self):
         """Rinomina le immagini selezionate aggiungendo un suffisso specificato."""
         selected_indices = self.file_listbox.curselection()
         if not selected_indices:
             messagebox.showinfo("Info", "No file selected for renaming.")
-            print("Attempt to rename without selection.")
+            logger.info("Attempt to rename without selection.")
             return
 
         suffix = simpledialog.askstring("Rename Selected", "Enter the suffix to add:")
         if not suffix:
-            print("Rename selected canceled by the user.")
+            logger.info("Rename selected canceled by the user.")
             return
 
-        errors = []
-        renamed_files = []
+        renames = []
         for i in selected_indices:
             original_path = self.image_files[i]
-            original_name = os.path.basename(original_path)
-            base, ext = os.path.splitext(original_name)
-            new_name = f"{base}_{suffix}{ext}"
-            new_path = os.path.join(image_dir, new_name)
-
-            # Controlla se il nuovo nome esiste già
-            if os.path.exists(new_path):
-                errors.append(f"'{new_name}' already exists. Skipped.")
-                print(f"Existing file: {new_path}")
-                continue
+            renames.append((original_path, suffixed_path(original_path, suffix)))
 
-            label_file_old = os.path.join(label_dir, f"{base}.txt")
-            label_file_new = os.path.join(label_dir, f"{base}_{suffix}.txt")
-
-            try:
-                os.rename(original_path, new_path)
-                print(f"Image renamed from {original_path} to {new_path}")
+        errors = []
+        renamed_files = []
 
-                # Rinomina anche il file di annotazione, se esiste
-                if os.path.exists(label_file_old):
-                    os.rename(label_file_old, label_file_new)
-                    print(f"Annotation renamed from {label_file_old} to {label_file_new}")
+        def on_item(rename, new_path, error):
+            original_path = rename[0]
+            if error is not None:
+                message = str(error) if isinstance(error, FileExistsError) else \
+                    f"Error renaming '{os.path.basename(original_path)}': {error}"
+                errors.append(message)
+                logger.error("%s", message)
+            else:
+                logger.debug("Image renamed from %s to %s", original_path, new_path)
+                renamed_files.append((original_path, new_path))
+
+        def on_finish(dialog):
+            if renamed_files:
+                messagebox.showinfo("Success", f"Renamed {len(renamed_files)} files.")
+                logger.info("Renamed %s files.", len(renamed_files))
+            if errors:
+                error_message = "\n".join(errors[:20])
+                messagebox.showerror("Errors During Renaming", error_message)
+                logger.error("Errors During Renaming:")
+                for error in errors:
+                    logger.error("%s", error)
+
+            # Aggiorna l'elenco dei file
+            self.refresh_file_list(added=[new for _, new in renamed_files],
+                                   removed=[old for old, _ in renamed_files])
+
+            # Ricarica l'immagine corrente se è stata rinominata
+            renamed_from = {os.path.abspath(old): new for old, new in renamed_files}
+            if self.image_path in renamed_from:
+                # Trova il nuovo indice dell'immagine rinominata
+                new_path = renamed_from[self.image_path]
+                self.index = self.dir_index.position(os.path.abspath(new_path))
+                self.load_current_image()
 
-                renamed_files.append(new_path)
+        journal = self.journal
 
-            except Exception as e:
-                errors.append(f"Error renaming '{original_name}': {e}")
-                print(f"Error renaming '{original_name}': {e}")
+        def rename_tracked(original_path, new_path, labels_dir):
+            # Nello stesso job (e con gli stessi lock) della rinomina: undo/redo seguono i file
+            result = rename_image_files(original_path, new_path, labels_dir)
+            if journal is not None:
+                journal.rename_paths({original_path: new_path,
+                                      label_path_for(original_path, labels_dir): label_path_for(new_path, labels_dir)})
+            return result
 
-        if renamed_files:
-            messagebox.showinfo("Success", f"Renamed {len(renamed_files)} files.")
-            print(f"Renamed {len(renamed_files)} files.")
-        if errors:
-            error_message = "\n".join(errors)
-            messagebox.showerror("Errors During Renaming", error_message)
-            print("Errors During Renaming:")
-            for error in errors:
-                print(error)
-
-        # Aggiorna l'elenco dei file
-        self.refresh_file_list()
-
-        # Ricarica l'immagine corrente se è stata rinominata
-        selected_files = [os.path.abspath(f) for f in renamed_files]
-        if self.image_path in selected_files:
-            # Trova il nuovo indice dell'immagine rinominata
-            new_path = renamed_files[selected_files.index(self.image_path)]
-            self.index = self.image_files.index(os.path.abspath(new_path))
-            self.load_current_image()
+        self.jobs.run_batch("Renaming", rename_tracked, renames,
+                            args_for=lambda rename: rename + (label_dir,),
+                            paths_for=lambda rename: rename + tuple(label_path_for(p, label_dir) for p in rename),
+                            process=False, on_item=on_item, on_finish=on_finish)
 
     # ------------------ ROTAZIONI E FLIP BBOX ------------------
     def rotate_bboxes_yolo(self, annotations, angle=90):
         """Ruota le bounding boxes in base all'angolo specificato (+90 o -90 gradi)."""
-        if angle not in [90, -90]:
-            raise ValueError("Only rotations of +90 or -90 degrees are supported.")
-
-        new_annotations = []
-        for (cls_id, x_c, y_c, w_bb, h_bb) in annotations:
-            if angle == 90:
-                new_x_c = 1.0 - y_c
-                new_y_c = x_c
-                new_w_bb = h_bb
-                new_h_bb = w_bb
-            elif angle == -90:
-                new_x_c = y_c
-                new_y_c = 1.0 - x_c
-                new_w_bb = h_bb
-                new_h_bb = w_bb
-            new_annotations.append((cls_id, new_x_c, new_y_c, new_w_bb, new_h_bb))
-        return new_annotations
+        return annotations.rotated(angle)
 
     def flip_bboxes_yolo(self, annotations):
         """Flip orizzontale delle bounding boxes."""
-        new_annotations = []
-        for (cls_id, x_c, y_c, w_bb, h_bb) in annotations:
-            x_new = 1.0 - x_c
-            y_new = y_c
-            new_annotations.append((cls_id, x_new, y_new, w_bb, h_bb))
-        return new_annotations
+        return annotations.flipped()
 
     # ------------------ TILING ------------------
+    def ask_tiling_options(self, tile_size):
+        """Finestra con le opzioni di tiling; restituisce un dict o None se annullata."""
+        dialog = tk.Toplevel(self.master)
+        dialog.title(f"Tiling {tile_size}x{tile_size}")
+        dialog.transient(self.master)
+        dialog.grab_set()
+
+        options_frame = ttk.LabelFrame(dialog, text="Tiling Options", padding=10)
+        options_frame.pack(fill=tk.X, padx=5, pady=5)
+
+        overlap_var = tk.StringVar(value="0")
+        visibility_var = tk.StringVar(value="25")
+        skip_empty_var = tk.BooleanVar(value=False)
+        for label_text, var in (("Overlap (px):", overlap_var),
+                                ("Min visible box area (%):", visibility_var)):
+            frame = ttk.Frame(options_frame)
+            frame.pack(fill=tk.X, pady=2)
+            ttk.Label(frame, text=label_text).pack(side=tk.LEFT)
+            ttk.Entry(frame, textvariable=var, width=10).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(options_frame, text="Skip tiles without annotations",
+                        variable=skip_empty_var).pack(anchor=tk.W, pady=2)
+
+        result = {}
+
+        def confirm():
+            try:
+                overlap = int(overlap_var.get())
+                visibility = float(visibility_var.get())
+            except ValueError:
+                messagebox.showerror("Error", "Invalid overlap or visible area", parent=dialog)
+                return
+            if not 0 <= overlap < tile_size or not 0 <= visibility <= 100:
+                messagebox.showerror("Error", f"Overlap must be in [0, {tile_size - 1}] "
+                                              "and visible area in [0, 100]", parent=dialog)
+                return
+            result.update(overlap=overlap, min_visibility=visibility / 100,
+                          skip_empty=skip_empty_var.get())
+            dialog.destroy()
+
+        ttk.Button(dialog, text="Start Tiling", command=confirm).pack(pady=10)
+        self.master.wait_window(dialog)
+        return result or None
+
     def tile_current_image(self, tile_size):
         img_path = self.get_current_image_path()
         if not img_path:
             return
-        print(f"Tiling current image: {img_path} with tile_size={tile_size}")
-        self.tile_image_and_save(img_path, tile_size=tile_size)
-        # RICHIAMA L'AGGIORNAMENTO LISTA
-        self.refresh_file_list()
-        messagebox.showinfo(
-            "Tiling",
-            f"Image '{os.path.basename(img_path)}' split into tiles {tile_size}x{tile_size}.\nFile list updated."
-        )
+        options = self.ask_tiling_options(tile_size)
+        if options is None:
+            return
+        logger.info("Tiling current image: %s with tile_size=%s, options=%s", img_path, tile_size, options)
+
+        def on_done(result):
+            created, labels_written = result
+            logger.info("Tiles saved: %s, label files written: %s", len(created), labels_written)
+            # RICHIAMA L'AGGIORNAMENTO LISTA
+            self.refresh_file_list(added=created)
+            messagebox.showinfo(
+                "Tiling",
+                f"Image '{os.path.basename(img_path)}' split into tiles {tile_size}x{tile_size}.\nFile list updated."
+            )
+
+        self.jobs.submit(tile_image_file, *self.tiling_args(img_path, tile_size, options), paths=(img_path,),
+                         on_done=on_done,
+                         on_error=lambda e: messagebox.showerror("Error", f"Error tiling the image:\n{e}"))
 
     def tile_all_images(self, tile_size):
+        """Tiling di tutte le immagini in un pool di processi; i tile creati vengono
+        aggiunti all'elenco man mano che ogni immagine termina."""
         if not self.image_files:
             return
         resp = messagebox.askyesno(
@@ -1275,55 +2492,43 @@ class ImageViewer:
             f"Do you want to create {tile_size}x{tile_size} tiles for all images in the list?"
         )
         if not resp:
-            print("Tiling of all images canceled by the user.")
+            logger.info("Tiling of all images canceled by the user.")
             return
-        for path in self.image_files.copy():  # Usa copy per evitare problemi durante la modifica
-            print(f"Tiling image: {path} with tile_size={tile_size}")
-            self.tile_image_and_save(path, tile_size=tile_size)
-        # RICHIAMA L'AGGIORNAMENTO LISTA
-        self.refresh_file_list()
-        messagebox.showinfo(
-            "Tiling",
-            f"Operation completed.\nCreated {tile_size}x{tile_size} tiles for all photos.\nFile list updated."
-        )
-
-    def tile_image_and_save(self, img_path, tile_size=512):
-        """
-        Esegue un tiling dell'immagine in quadrati tile_size x tile_size.
-        Salva i tile con suffisso _T{tile_size}_{num:03d}.ext
-        """
-        try:
-            img = Image.open(img_path).convert("RGB")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error loading the image for tiling:\n{e}")
+        options = self.ask_tiling_options(tile_size)
+        if options is None:
             return
 
-        w, h = img.size
-        dir_name, base = os.path.split(img_path)
-        base_name, ext = os.path.splitext(base)
+        stats = {'tiles': 0, 'labels': 0, 'errors': []}
 
-        tile_num = 1
-        for y in range(0, h, tile_size):
-            for x in range(0, w, tile_size):
-                box = (x, y, min(x + tile_size, w), min(y + tile_size, h))
-                tile = img.crop(box)
-                # Costruisci il nuovo nome in modo sicuro, preservando eventuali suffix esistenti
-                new_tile_path = os.path.join(dir_name, f"{base_name}_T{tile_size}_{tile_num:03d}{ext}")
-                try:
-                    # Determina il formato basato sull'estensione
-                    format_map = {
-                        '.jpg': 'JPEG',
-                        '.jpeg': 'JPEG',
-                        '.png': 'PNG',
-                        # aggiungi altri formati se necessario
-                    }
-                    img_format = format_map.get(ext.lower(), 'PNG')  # default a PNG se sconosciuto
-                    tile.save(new_tile_path, format=img_format)
-                    print(f"Tile saved: {new_tile_path} with format {img_format}")
-                    tile_num += 1
-                except Exception as e:
-                    messagebox.showerror("Error", f"Error saving the tile:\n{e}")
-                    return
+        def on_item(path, result, error):
+            if error is not None:
+                logger.error("Error tiling %s: %s", path, error)
+                stats['errors'].append(os.path.basename(path))
+                return
+            created, labels_written = result
+            logger.debug("Tiled image: %s -> %s tiles", path, len(created))
+            stats['tiles'] += len(created)
+            stats['labels'] += labels_written
+            # Streaming: i nuovi tile compaiono subito nell'elenco
+            self.refresh_file_list(added=created)
+
+        def on_finish(dialog):
+            summary = (f"Created {stats['tiles']} tiles {tile_size}x{tile_size} "
+                       f"and {stats['labels']} label files.")
+            if dialog.cancelled:
+                summary = "Tiling canceled.\n" + summary
+            if stats['errors']:
+                summary += f"\nFailed images ({len(stats['errors'])}): " + ", ".join(stats['errors'][:10])
+            messagebox.showinfo("Tiling", summary + "\nFile list updated.")
+
+        self.jobs.run_batch(f"Tiling {tile_size}x{tile_size}", tile_image_file, list(self.image_files),
+                            args_for=lambda path: self.tiling_args(path, tile_size, options),
+                            on_item=on_item, on_finish=on_finish)
+
+    def tiling_args(self, img_path, tile_size, options):
+        """Argomenti di tile_image_file per un'immagine, con le opzioni scelte nel dialogo."""
+        return (img_path, tile_size, options['overlap'], self.get_label_path(img_path), label_dir,
+                options['min_visibility'], options['skip_empty'], self.encoder_profile.get())
 
     # ------------------ CONVERT LABEL ------------------
     def open_label_converter(self):
@@ -1382,25 +2587,179 @@ class ImageViewer:
             string_var.set(directory)
 
     def convert_labels(self, path_vars, output_format):
-        """Handles the label conversion process."""
+        """Handles the label conversion process.
+
+        Il formato d'ingresso (YOLO, COCO o JSON) viene riconosciuto dalla Input Label Path;
+        il riconoscimento, plan() e la conversione girano in LabelConverter su un thread di
+        background. L'Output Image Path è facoltativo: se indicato, le immagini vi vengono copiate.
+        """
         # Validate paths
-        for key, var in path_vars.items():
-            if not var.get():
+        for key in ("input_img", "input_lbl", "output_lbl"):
+            if not path_vars[key].get():
                 messagebox.showerror("Error", f"Please select {key.replace('_', ' ')} directory")
                 return
 
-        # Here you would implement the actual conversion logic
+        converter = LabelConverter(path_vars["input_img"].get(), path_vars["input_lbl"].get(),
+                                   path_vars["output_lbl"].get(), output_format, self.names,
+                                   output_image_dir=path_vars["output_img"].get() or None,
+                                   metadata=self.metadata)
+        dialog = ProgressDialog(self.master, f"Label Converter -> {output_format}", None,
+                                on_cancel=converter.cancel)
+        errors = []
+
+        def on_planned(total):
+            if not dialog.finished:
+                dialog.window.title(f"{converter.input_format} -> {output_format}")
+            dialog.set_total(total)
+
+        def on_item(item):
+            file_name, error = item
+            if error is not None:
+                logger.error("Error converting %s: %s", file_name, error)
+                errors.append(file_name)
+
+        def on_finish():
+            if dialog.error is not None:
+                messagebox.showerror("Error", f"Error during conversion: {dialog.error}")
+            elif dialog.cancelled:
+                messagebox.showinfo("Label Converter", "Conversion canceled.")
+            elif dialog.total == 0:
+                messagebox.showinfo("Label Converter", "No images or labels found to convert.")
+            elif errors:
+                messagebox.showwarning("Label Converter",
+                                       f"Converted {dialog.total - len(errors)} of {dialog.total} images to {output_format}.\n"
+                                       f"Failed ({len(errors)}): " + ", ".join(errors[:10]))
+            else:
+                messagebox.showinfo("Success", f"Labels converted to {output_format} format successfully!")
+
+        def work():
+            try:
+                jobs = converter.plan()
+                self.jobs.call_in_ui(on_planned, len(jobs))
+                if jobs and not converter.cancelled.is_set():
+                    converter.run(jobs, lambda *item: dialog.report(item))
+            except Exception as e:
+                logger.error("Error during conversion: %s", e)
+                dialog.fail(e)
+
+        self.jobs.submit(work, batch=True)
+        dialog.poll(on_item, on_finish)
+
+    # ------------------ IMPORT IMMAGINI ------------------
+    def open_image_import(self):
+        """Dialogo per importare (convertire) le immagini di una cartella in image_dir."""
+        import_window = tk.Toplevel(self.master)
+        import_window.title("Import Images")
+        import_window.transient(self.master)
+        import_window.grab_set()
+
+        path_frame = ttk.LabelFrame(import_window, text="Source", padding=10)
+        path_frame.pack(fill=tk.X, padx=5, pady=5)
+        source_var = tk.StringVar()
+        frame = ttk.Frame(path_frame)
+        frame.pack(fill=tk.X, pady=2)
+        ttk.Label(frame, text="Source Folder (HEIC, JPG, PNG, WebP...):").pack(side=tk.LEFT)
+        ttk.Entry(frame, textvariable=source_var, width=40).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        ttk.Button(frame, text="Browse", command=lambda: self.browse_directory(source_var)).pack(side=tk.RIGHT)
+        ttk.Label(path_frame, text=f"Destination: {image_dir}").pack(anchor=tk.W, pady=2)
+
+        options_frame = ttk.LabelFrame(import_window, text="Output", padding=10)
+        options_frame.pack(fill=tk.X, padx=5, pady=5)
+        codec_var = tk.StringVar(value="PNG")
+        # Vuoti: valori del profilo di codifica scelto nella barra
+        quality_var = tk.StringVar(value="")
+        compress_var = tk.StringVar(value="")
+        max_side_var = tk.StringVar(value="")
+        frame = ttk.Frame(options_frame)
+        frame.pack(fill=tk.X, pady=2)
+        ttk.Label(frame, text="Format:").pack(side=tk.LEFT)
+        ttk.Combobox(frame, textvariable=codec_var, values=list(INGEST_CODECS), state="readonly",
+                     width=8).pack(side=tk.LEFT, padx=5)
+        for label_text, var in (("JPEG/WebP quality (empty = profile):", quality_var),
+                                ("PNG compress level (0-9, empty = profile):", compress_var),
+                                ("Max side (px, empty = original):", max_side_var)):
+            frame = ttk.Frame(options_frame)
+            frame.pack(fill=tk.X, pady=2)
+            ttk.Label(frame, text=label_text).pack(side=tk.LEFT)
+            ttk.Entry(frame, textvariable=var, width=8).pack(side=tk.LEFT, padx=5)
+
+        def start():
+            try:
+                quality = int(quality_var.get()) if quality_var.get().strip() else None
+                compress_level = int(compress_var.get()) if compress_var.get().strip() else None
+                max_side = int(max_side_var.get()) if max_side_var.get().strip() else None
+            except ValueError:
+                messagebox.showerror("Error", "Invalid quality, compress level or max side", parent=import_window)
+                return
+            if not source_var.get():
+                messagebox.showerror("Error", "Please select the source directory", parent=import_window)
+                return
+            import_window.destroy()
+            self.import_images(source_var.get(), codec_var.get(), quality, compress_level, max_side)
+
+        ttk.Button(import_window, text="Import", command=start).pack(pady=10)
+
+    def import_images(self, source_dir, codec, quality, compress_level, max_side=None):
+        """Converte le immagini di source_dir in image_dir con ImageIngestor, in background.
+
+        Gli output già aggiornati vengono saltati; i file creati entrano nell'elenco in modo
+        incrementale (refresh_file_list(added=...)), senza riscansionare la cartella.
+        Anche plan() (stat di tutti i file d'ingresso e d'uscita) gira nel job di background.
+        """
         try:
-            # Placeholder for conversion logic
-            messagebox.showinfo("Success", f"Labels converted to {output_format} format successfully!")
+            ingestor = ImageIngestor(source_dir, image_dir, codec, quality, compress_level, max_side,
+                                     profile=self.encoder_profile.get())
         except Exception as e:
-            messagebox.showerror("Error", f"Error during conversion: {str(e)}")
+            messagebox.showerror("Error", f"Error during import: {e}")
+            return
+
+        dialog = ProgressDialog(self.master, "Import Images", None, on_cancel=ingestor.cancel)
+        created = []
+        errors = []
+
+        def on_item(item):
+            input_file, output_file, error = item
+            if error is not None:
+                logger.error("Error importing %s: %s", input_file, error)
+                errors.append(os.path.basename(input_file))
+            else:
+                created.append(output_file)
+
+        def on_finish():
+            self.refresh_file_list(added=created)
+            if self.metadata is not None and created:
+                self.jobs.submit(self.metadata.update, created, batch=True)
+            summary = f"Imported {len(created)} images ({ingestor.skipped} already up to date)."
+            logger.info("Image import finished: %s", summary)
+            if dialog.error is not None:
+                messagebox.showerror("Error", f"Error during import: {dialog.error}")
+            elif dialog.total == 0:
+                messagebox.showinfo("Import Images", f"Nothing to import ({ingestor.skipped} images already up to date).")
+            elif dialog.cancelled:
+                messagebox.showinfo("Import Images", "Import canceled.\n" + summary)
+            elif errors:
+                messagebox.showwarning("Import Images", summary + f"\nFailed ({len(errors)}): " + ", ".join(errors[:10]))
+            else:
+                messagebox.showinfo("Success", summary)
+
+        def work():
+            try:
+                tasks = ingestor.plan()
+                self.jobs.call_in_ui(dialog.set_total, len(tasks))
+                if tasks and not ingestor.cancelled.is_set():
+                    ingestor.run(tasks, lambda *item: dialog.report(item))
+            except Exception as e:
+                logger.error("Error during import: %s", e)
+                dialog.fail(e)
+
+        self.jobs.submit(work, batch=True)
+        dialog.poll(on_item, on_finish)
 
     def open_smart_crop(self):
         """Opens the smart crop dialog with enhanced functionality."""
         crop_window = tk.Toplevel(self.master)
         crop_window.title("Smart Crop")
-        crop_window.geometry("600x500")
+        crop_window.geometry("600x560")
         crop_window.transient(self.master)
         crop_window.grab_set()
 
@@ -1457,14 +2816,32 @@ class ImageViewer:
         res_entry = ttk.Entry(res_frame, textvariable=res_var, width=15)
         res_entry.pack(side=tk.LEFT, padx=5)
 
+        # Other objects inside each crop
+        visibility_frame = ttk.Frame(options_frame)
+        visibility_frame.pack(fill=tk.X, pady=2)
+        ttk.Label(visibility_frame, text="Min visible area of other boxes (%):").pack(side=tk.LEFT)
+        visibility_var = tk.StringVar(value=str(int(SMART_CROP_MIN_VISIBILITY * 100)))
+        ttk.Entry(visibility_frame, textvariable=visibility_var, width=10).pack(side=tk.LEFT, padx=5)
+
+        # Redundant crops
+        merge_frame = ttk.Frame(options_frame)
+        merge_frame.pack(fill=tk.X, pady=2)
+        merge_enabled_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(merge_frame, text="Merge crops sharing boxes, overlap (%):",
+                        variable=merge_enabled_var).pack(side=tk.LEFT)
+        merge_var = tk.StringVar(value="80")
+        ttk.Entry(merge_frame, textvariable=merge_var, width=10).pack(side=tk.LEFT, padx=5)
+
         # Start button
         ttk.Button(crop_window, text="Start Crop", 
                   command=lambda: [
-                      self.start_smart_crop(path_vars, mode_var.get(), margin_var.get(), res_var.get()),
+                      self.start_smart_crop(path_vars, mode_var.get(), margin_var.get(), res_var.get(),
+                                            visibility_var.get(),
+                                            merge_var.get() if merge_enabled_var.get() else None),
                       crop_window.destroy()
                   ]).pack(pady=10)
 
-    def start_smart_crop(self, path_vars, mode, margin, resolution):
+    def start_smart_crop(self, path_vars, mode, margin, resolution, min_visibility="25", merge_threshold=None):
         """Handles the smart crop process."""
         # Validate paths
         for key, var in path_vars.items():
@@ -1475,12 +2852,13 @@ class ImageViewer:
         try:
             margin = int(margin)
             width, height = map(int, resolution.split('x'))
+            min_visibility = float(min_visibility) / 100
+            merge_threshold = float(merge_threshold) / 100 if merge_threshold is not None else None
         except ValueError:
-            messagebox.showerror("Error", "Invalid margin or resolution format")
+            messagebox.showerror("Error", "Invalid margin, resolution or percentage format")
             return
 
         try:
-            # Call the existing crop_images_with_labels function with the new parameters
             self.crop_images_with_labels(
                 path_vars["input_img"].get(),
                 path_vars["input_lbl"].get(),
@@ -1488,7 +2866,9 @@ class ImageViewer:
                 path_vars["output_lbl"].get(),
                 mode,
                 margin,
-                resolution
+                resolution,
+                min_visibility,
+                merge_threshold
             )
         except Exception as e:
             messagebox.showerror("Error", f"Error during smart crop: {str(e)}")
@@ -1500,17 +2880,14 @@ class ImageViewer:
     # ------------------ METODI PER SALVATAGGIO ANNOTAZIONI ------------------
     def save_annotations_to_file(self, label_file, annotations):
         """Salva tutte le annotazioni nel file di annotazione."""
-        with open(label_file, 'w', encoding='utf-8') as f:
-            for ann in annotations:
-                cls_id, x_center, y_center, w, h = ann
-                f.write(f"{cls_id} {x_center:.6f} {y_center:.6f} {w:.6f} {h:.6f}\n")
+        annotations.save(label_file)
 
     # ------------------ NUOVO METODO: DELETE IMAGE AND ANNOTATIONS ------------------
     def delete_image_and_annotations(self):
         """Elimina l'immagine attualmente aperta e il suo file di annotazione."""
         if not self.image_path:
             messagebox.showinfo("Info", "No image loaded to delete.")
-            print("Attempt to delete without a loaded image.")
+            logger.info("Attempt to delete without a loaded image.")
             return
 
         resp = messagebox.askyesno(
@@ -1518,122 +2895,97 @@ class ImageViewer:
             f"Do you want to delete the image and annotations for {os.path.basename(self.image_path)}?"
         )
         if not resp:
-            print("Deletion canceled by the user.")
+            logger.info("Deletion canceled by the user.")
             return
 
         errors = []
         try:
             if os.path.exists(self.image_path):
                 os.remove(self.image_path)
-                print(f"Image file deleted: {self.image_path}")
+                logger.info("Image file deleted: %s", self.image_path)
             
             base_name = os.path.splitext(os.path.basename(self.image_path))[0]
             label_file = os.path.join(label_dir, base_name + ".txt")
             if os.path.exists(label_file):
                 os.remove(label_file)
-                print(f"Annotation file deleted: {label_file}")
+                logger.info("Annotation file deleted: %s", label_file)
         except Exception as e:
             errors.append(f"Error deleting {self.image_path}: {e}")
-            print(f"Error deleting {self.image_path}: {e}")
+            logger.error("Error deleting %s: %s", self.image_path, e)
 
         if errors:
             error_message = "\n".join(errors)
             messagebox.showerror("Errors During Deletion", error_message)
         else:
             messagebox.showinfo("Success", "Image and related annotations successfully deleted.")
-            print("Image and annotations successfully deleted.")
+            logger.info("Image and annotations successfully deleted.")
 
         # Aggiorna la lista dei file
-        self.refresh_file_list()
+        if not os.path.exists(self.image_path):
+            self.refresh_file_list(removed=[self.image_path])
 
         # Se l'immagine attuale è stata eliminata, carica la prossima immagine disponibile
-        if self.image_path in self.image_files:
+        if self.image_path not in self.image_files:
             if self.image_files:
                 self.index = min(self.index, len(self.image_files) - 1)
-                print(f"New index after deletion: {self.index}")
+                logger.debug("New index after deletion: %s", self.index)
                 self.load_current_image()
             else:
                 self.canvas.delete("all")
                 self.image_size_label.config(text="Image Size: N/A")
                 self.rect_size_label.config(text="Rect Size: N/A")
                 self.current_image = None
+                self.full_decode_job = None
+                self.annotation_items_key = None
                 self.image_path = None
-                self.current_annotations = []
+                self.current_annotations = YoloAnnotations()
                 self.master.title("Visual Editor - No Image Loaded")
-                print("No image available after deletion.")
+                logger.info("No image available after deletion.")
 
-    def crop_images_with_labels(self, image_dir, label_dir, output_image_dir, output_label_dir, crop_mode, margin, resolution):
-        """Process images and labels for smart cropping."""
-        width, height = map(int, resolution.lower().split("x"))
-        os.makedirs(output_image_dir, exist_ok=True)
-        os.makedirs(output_label_dir, exist_ok=True)
-        
-        for label_file in os.listdir(label_dir):
-            if label_file.endswith(".txt"):
-                image_file = label_file.replace(".txt", ".jpg")
-                image_path = os.path.join(image_dir, image_file)
-                label_path = os.path.join(label_dir, label_file)
-                
-                if not os.path.exists(image_path):
-                    print(f"Warning: Image {image_file} not found for label {label_file}")
-                    continue
-                
-                image = cv2.imread(image_path)
-                if image is None:
-                    print(f"Warning: Could not read image {image_file}")
-                    continue
+    def crop_images_with_labels(self, image_dir, label_dir, output_image_dir, output_label_dir, crop_mode, margin, resolution,
+                                min_visibility=SMART_CROP_MIN_VISIBILITY, merge_threshold=None):
+        """Process images and labels for smart cropping.
 
-                img_height, img_width, _ = image.shape
-                
-                with open(label_path, "r") as f:
-                    labels = [line.strip().split() for line in f.readlines()]
-                
-                for idx, label in enumerate(labels):
-                    class_id, x_center, y_center, box_width, box_height = map(float, label)
-                    x_center_pixel = int(x_center * img_width)
-                    y_center_pixel = int(y_center * img_height)
-                    box_width_pixel = int(box_width * img_width)
-                    box_height_pixel = int(box_height * img_height)
-                    
-                    if crop_mode == "Centered":
-                        crop_x1 = max(margin, x_center_pixel - width // 2)
-                        crop_y1 = max(margin, y_center_pixel - height // 2)
-                    else:  # Random
-                        max_x = img_width - width - margin
-                        max_y = img_height - height - margin
-                        crop_x1 = random.randint(margin, max(margin, max_x))
-                        crop_y1 = random.randint(margin, max(margin, max_y))
-
-                    crop_x2 = min(img_width - margin, crop_x1 + width)
-                    crop_y2 = min(img_height - margin, crop_y1 + height)
-                    
-                    # Adjust crop coordinates if they exceed image boundaries
-                    if crop_x2 - crop_x1 < width:
-                        crop_x1 = max(margin, crop_x2 - width)
-                    if crop_y2 - crop_y1 < height:
-                        crop_y1 = max(margin, crop_y2 - height)
-                    
-                    cropped_image = image[crop_y1:crop_y2, crop_x1:crop_x2]
-                    cropped_image_name = f"{os.path.splitext(image_file)[0]}_crop_{idx}.jpg"
-                    cv2.imwrite(os.path.join(output_image_dir, cropped_image_name), cropped_image)
-                    
-                    # Calculate new annotation coordinates
-                    new_x_center = (x_center_pixel - crop_x1) / width
-                    new_y_center = (y_center_pixel - crop_y1) / height
-                    new_box_width = box_width_pixel / width
-                    new_box_height = box_height_pixel / height
-                    
-                    # Ensure the coordinates are within [0, 1]
-                    new_x_center = max(0, min(1, new_x_center))
-                    new_y_center = max(0, min(1, new_y_center))
-                    new_box_width = max(0, min(1, new_box_width))
-                    new_box_height = max(0, min(1, new_box_height))
-                    
-                    cropped_label_name = f"{os.path.splitext(label_file)[0]}_crop_{idx}.txt"
-                    with open(os.path.join(output_label_dir, cropped_label_name), "w") as label_outfile:
-                        label_outfile.write(f"{int(class_id)} {new_x_center:.6f} {new_y_center:.6f} {new_box_width:.6f} {new_box_height:.6f}\n")
-        
-        messagebox.showinfo("Success", "Smart crop completed successfully!")
+        Il lavoro (anche plan(): lettura delle label e delle intestazioni delle immagini)
+        gira in SmartCropPipeline su un thread di background; la finestra di avanzamento
+        mostra il throughput di ogni stadio e permette di annullare.
+        """
+        pipeline = SmartCropPipeline(image_dir, label_dir, output_image_dir, output_label_dir,
+                                     crop_mode, margin, resolution, min_visibility, merge_threshold,
+                                     metadata=self.metadata, profile=self.encoder_profile.get())
+        dialog = ProgressDialog(self.master, "Smart Crop", None,
+                                on_cancel=pipeline.cancel, describe=pipeline.describe)
+        stats = {'crops': 0, 'errors': []}
+
+        def on_item(item):
+            label_name, crops_written, error = item
+            if error is not None:
+                stats['errors'].append(label_name)
+            stats['crops'] += crops_written
+
+        def on_finish():
+            summary = f"Created {stats['crops']} crops from {dialog.total or 0} images.\n{pipeline.describe()}"
+            logger.info("Smart crop finished: %s", summary)
+            if dialog.error is not None:
+                messagebox.showerror("Error", f"Error during smart crop: {dialog.error}")
+            elif dialog.total == 0:
+                messagebox.showinfo("Smart Crop", "No images with labels found.")
+            elif dialog.cancelled:
+                messagebox.showinfo("Smart Crop", "Smart crop canceled.\n" + summary)
+            elif stats['errors']:
+                messagebox.showwarning("Smart Crop", summary + f"\nFailed images ({len(stats['errors'])}): "
+                                       + ", ".join(stats['errors'][:10]))
+            else:
+                messagebox.showinfo("Success", "Smart crop completed successfully!\n" + summary)
+
+        def plan_and_run():
+            jobs = pipeline.plan()
+            self.jobs.call_in_ui(dialog.set_total, len(jobs))
+            if jobs and not pipeline.cancelled.is_set():
+                pipeline.run(jobs, lambda *item: dialog.report(item))
+
+        self.jobs.submit(plan_and_run, batch=True, on_error=dialog.fail)
+        dialog.poll(on_item, on_finish)
 
     # ------------------ BINDING MOUSEWHEEL ------------------
     
@@ -1672,7 +3024,11 @@ class ImageViewer:
 # Esegui il programma
 # ------------------------------------------------------------------------------
 if __name__ == "__main__":
+    setup_logging()
+    enable_timings_export()
+    startup = StartupReport()
+    startup.mark("imports")
     root = tk.Tk()
     root.geometry("1200x900")
-    viewer = ImageViewer(root)
+    viewer = ImageViewer(root, startup=startup)
     viewer.run()
@@ -0,0 +1,301 @@
+"""Visual Editor dalla riga di comando: le operazioni batch senza interfaccia grafica.
+
+Ogni comando usa lo stesso pool parallelo (run_parallel, --jobs worker) e scrive
+l'avanzamento su stdout come JSON lines, un oggetto per riga:
+
+    {"event": "start", "command": "halve", "total": 120}
+    {"event": "item", "done": 1, "total": 120, "item": "...", "ok": true, "result": [640, 480]}
+    {"event": "finish", "command": "halve", "done": 120, "total": 120, "failed": 0, ...}
+
+I log vanno su stderr. Il codice di uscita è 0 se tutti gli elementi sono riusciti,
+1 se qualcuno è fallito e 130 se l'esecuzione è stata interrotta: il primo Ctrl+C
+smette di avviare nuovi elementi e attende quelli in corso, il secondo interrompe subito.
+Il modulo non importa tkinter.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import signal
+import sys
+import threading
+import time
+
+from visualedit_engine import (
+    logger, setup_logging, IMAGE_EXTENSIONS, DirectoryIndex, run_parallel,
+    tile_image_file, halve_image_file, grayscale_image_file, delete_image_files,
+    rename_image_files, suffixed_path, label_path_for,
+    SmartCropPipeline, SMART_CROP_MIN_VISIBILITY, ImageIngestor, INGEST_CODECS,
+    ENCODER_PROFILES, benchmark_encoder_profiles,
+)
+
+
+def emit(event, **fields):
+    """Scrive un evento di avanzamento come riga JSON su stdout."""
+    sys.stdout.write(json.dumps(dict(event=event, **fields), default=str) + "\n")
+    sys.stdout.flush()
+
+
+def collect_images(paths):
+    """Espande file e cartelle in un elenco ordinato di immagini (percorsi assoluti)."""
+    images = set()
+    for path in paths:
+        if os.path.isdir(path):
+            index = DirectoryIndex(path)
+            index.scan(force=True)
+            images.update(index.paths)
+        elif path.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path):
+            images.add(os.path.abspath(path))
+        else:
+            logger.warning("Skipping %s: not an image or a folder", path)
+    return sorted(images)
+
+
+@contextlib.contextmanager
+def cancel_on_sigint(cancel):
+    """Il primo Ctrl+C chiama cancel() (dall'handler del segnale, mentre il lavoro continua
+    in modo ordinato); il secondo solleva KeyboardInterrupt come di consueto."""
+    def handler(signum, frame):
+        signal.signal(signal.SIGINT, previous)
+        logger.warning("Cancelling: waiting for the running items (Ctrl+C again to stop now)")
+        cancel()
+
+    previous = signal.signal(signal.SIGINT, handler)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGINT, previous)
+
+
+def run_batch(command, func, items, args_for, jobs, process=True):
+    """Esegue func su tutti gli elementi con run_parallel ed emette gli eventi di avanzamento."""
+    total = len(items)
+    emit("start", command=command, total=total)
+    started = time.perf_counter()
+    done = failed = 0
+    cancelled = threading.Event()
+    try:
+        # Il flag viene impostato dall'handler di SIGINT, prima che il generatore venga
+        # chiuso: run_parallel smette di sottomettere e consegna i job già in volo
+        with cancel_on_sigint(cancelled.set):
+            for item, result, error in run_parallel(func, items, args_for, workers=jobs, process=process,
+                                                    cancelled=cancelled):
+                done += 1
+                if error is not None:
+                    failed += 1
+                    logger.error("%s failed on %s: %s", command, item, error)
+                    emit("item", done=done, total=total, item=item, ok=False, error=str(error))
+                else:
+                    emit("item", done=done, total=total, item=item, ok=True, result=result)
+    except KeyboardInterrupt:
+        cancelled.set()
+    emit("finish", command=command, done=done, total=total, failed=failed,
+         cancelled=cancelled.is_set(), seconds=round(time.perf_counter() - started, 3))
+    if cancelled.is_set():
+        return 130
+    return 1 if failed else 0
+
+
+def cmd_tile(args):
+    images = collect_images(args.paths)
+
+    def args_for(path):
+        return (path, args.size, args.overlap, label_path_for(path, args.labels) if args.labels else None,
+                args.labels, args.min_visibility / 100, args.skip_empty, args.profile)
+
+    return run_batch("tile", tile_image_file, images, args_for, args.jobs)
+
+
+def cmd_halve(args):
+    return run_batch("halve", halve_image_file, collect_images(args.paths), lambda path: (path, args.profile),
+                     args.jobs)
+
+
+def cmd_gray(args):
+    return run_batch("gray", grayscale_image_file, collect_images(args.paths), lambda path: (path, args.profile),
+                     args.jobs)
+
+
+def cmd_delete(args):
+    # Solo I/O sul filesystem: bastano i thread
+    return run_batch("delete", delete_image_files, collect_images(args.paths),
+                     lambda path: (path, args.labels), args.jobs, process=False)
+
+
+def cmd_rename(args):
+    return run_batch("rename", rename_image_files, collect_images(args.paths),
+                     lambda path: (path, suffixed_path(path, args.suffix), args.labels), args.jobs, process=False)
+
+
+def cmd_smartcrop(args):
+    # Smart Crop ha già una propria pipeline a stadi (thread + code limitate):
+    # --jobs imposta il numero di thread degli stadi di lettura e scrittura.
+    workers = {'read': args.jobs, 'write': args.jobs} if args.jobs else None
+    pipeline = SmartCropPipeline(args.images, args.labels, args.output_images, args.output_labels,
+                                 "Centered" if args.mode == "centered" else "Random", args.margin,
+                                 args.resolution, args.min_visibility / 100,
+                                 args.merge / 100 if args.merge is not None else None, workers=workers,
+                                 profile=args.profile)
+    jobs = pipeline.plan()
+    total = len(jobs)
+    emit("start", command="smartcrop", total=total)
+    progress = {'done': 0, 'failed': 0, 'crops': 0}
+    lock = threading.Lock()
+
+    def on_done(label_name, crops_written, error):
+        with lock:
+            progress['done'] += 1
+            progress['crops'] += crops_written
+            if error is not None:
+                progress['failed'] += 1
+                emit("item", done=progress['done'], total=total, item=label_name, ok=False, error=str(error))
+            else:
+                emit("item", done=progress['done'], total=total, item=label_name, ok=True, result=crops_written)
+
+    started = time.perf_counter()
+    runner = threading.Thread(target=pipeline.run, args=(jobs, on_done), daemon=True)
+    runner.start()
+    try:
+        with cancel_on_sigint(pipeline.cancel):
+            while runner.is_alive():
+                runner.join(0.2)
+    except KeyboardInterrupt:
+        pipeline.cancel()
+        runner.join()
+    cancelled = pipeline.cancelled.is_set()
+    emit("finish", command="smartcrop", done=progress['done'], total=total, failed=progress['failed'],
+         crops=progress['crops'], cancelled=cancelled, seconds=round(time.perf_counter() - started, 3),
+         stages=pipeline.describe())
+    if cancelled:
+        return 130
+    return 1 if progress['failed'] else 0
+
+
+def cmd_ingest(args):
+    # imap_unordered a blocchi nel pool di ImageIngestor, con --jobs processi
+    ingestor = ImageIngestor(args.source, args.output, args.format.upper(), args.quality, args.compress_level,
+                             args.max_side, workers=args.jobs, profile=args.profile)
+    tasks = ingestor.plan()
+    total = len(tasks)
+    emit("start", command="ingest", total=total, skipped=ingestor.skipped)
+    progress = {'done': 0, 'failed': 0}
+
+    def on_done(input_file, output_file, error):
+        progress['done'] += 1
+        if error is not None:
+            progress['failed'] += 1
+            logger.error("ingest failed on %s: %s", input_file, error)
+            emit("item", done=progress['done'], total=total, item=input_file, ok=False, error=error)
+        else:
+            emit("item", done=progress['done'], total=total, item=input_file, ok=True, result=output_file)
+
+    started = time.perf_counter()
+    try:
+        with cancel_on_sigint(ingestor.cancel):
+            ingestor.run(tasks, on_done)
+    except KeyboardInterrupt:
+        ingestor.cancel()
+    cancelled = ingestor.cancelled.is_set()
+    emit("finish", command="ingest", done=progress['done'], total=total, failed=progress['failed'],
+         skipped=ingestor.skipped, cancelled=cancelled, seconds=round(time.perf_counter() - started, 3))
+    if cancelled:
+        return 130
+    return 1 if progress['failed'] else 0
+
+
+def cmd_benchmark(args):
+    """Velocità e dimensione della codifica per profilo e formato su un campione di immagini."""
+    images = collect_images(args.paths)
+    if args.sample and len(images) > args.sample:
+        images = sorted(random.Random(0).sample(images, args.sample))
+    emit("start", command="benchmark", total=len(images))
+    for row in benchmark_encoder_profiles(images, args.profiles, [f.upper() for f in args.formats]):
+        emit("result", **row)
+    emit("finish", command="benchmark", total=len(images))
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="visualedit_cli",
+                                     description="Batch image and label operations of Visual Editor, without a GUI.")
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="number of parallel workers (default: one per CPU core)")
+    parser.add_argument("--log-level", default=None,
+                        help="log level for stderr (default: $VISUALEDIT_LOG_LEVEL or INFO)")
+    parser.add_argument("--profile", choices=list(ENCODER_PROFILES), default=None,
+                        help="encoder profile of written images (default: $VISUALEDIT_ENCODER_PROFILE or balanced)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("tile", help="split images into tiles, with their labels")
+    p.add_argument("paths", nargs="+", help="images or folders of images")
+    p.add_argument("--size", type=int, default=512, help="tile side in pixels")
+    p.add_argument("--overlap", type=int, default=0, help="overlap between tiles in pixels")
+    p.add_argument("--labels", help="YOLO labels folder (tile labels are written there too)")
+    p.add_argument("--min-visibility", type=float, default=0.0,
+                   help="minimum visible area (%%) of a box to keep it in a tile")
+    p.add_argument("--skip-empty", action="store_true", help="do not save tiles without boxes")
+    p.set_defaults(func=cmd_tile)
+
+    p = sub.add_parser("halve", help="halve the resolution of images in place")
+    p.add_argument("paths", nargs="+", help="images or folders of images")
+    p.set_defaults(func=cmd_halve)
+
+    p = sub.add_parser("gray", help="convert images to grayscale in place")
+    p.add_argument("paths", nargs="+", help="images or folders of images")
+    p.set_defaults(func=cmd_gray)
+
+    p = sub.add_parser("delete", help="delete images and their labels")
+    p.add_argument("paths", nargs="+", help="images or folders of images")
+    p.add_argument("--labels", required=True, help="YOLO labels folder")
+    p.set_defaults(func=cmd_delete)
+
+    p = sub.add_parser("rename", help="append a suffix to images and their labels")
+    p.add_argument("paths", nargs="+", help="images or folders of images")
+    p.add_argument("--suffix", required=True, help="suffix added as name_suffix.ext")
+    p.add_argument("--labels", required=True, help="YOLO labels folder")
+    p.set_defaults(func=cmd_rename)
+
+    p = sub.add_parser("smartcrop", help="crop a window around every labelled object")
+    p.add_argument("--images", required=True, help="input images folder")
+    p.add_argument("--labels", required=True, help="input YOLO labels folder")
+    p.add_argument("--output-images", required=True, help="output images folder")
+    p.add_argument("--output-labels", required=True, help="output labels folder")
+    p.add_argument("--mode", choices=("centered", "random"), default="centered")
+    p.add_argument("--margin", type=int, default=0, help="margin from the image border in pixels")
+    p.add_argument("--resolution", default="640x640", help="crop size as WIDTHxHEIGHT")
+    p.add_argument("--min-visibility", type=float, default=SMART_CROP_MIN_VISIBILITY * 100,
+                   help="minimum visible area (%%) of the other boxes kept in a crop")
+    p.add_argument("--merge", type=float, default=None,
+                   help="drop crops whose boxes overlap a previous crop by at least this %%")
+    p.set_defaults(func=cmd_smartcrop)
+
+    p = sub.add_parser("ingest", help="convert a folder of images (HEIC, JPG, PNG, WebP...) into a dataset folder")
+    p.add_argument("source", help="folder with the images to import")
+    p.add_argument("output", help="destination folder (e.g. the dataset images folder)")
+    p.add_argument("--format", choices=[c.lower() for c in INGEST_CODECS], default="png", help="output codec")
+    p.add_argument("--quality", type=int, default=None, help="JPEG/WebP quality")
+    p.add_argument("--compress-level", type=int, default=None, help="PNG compress level (0-9)")
+    p.add_argument("--max-side", type=int, default=None, help="downscale so that the longest side fits")
+    p.set_defaults(func=cmd_ingest)
+
+    p = sub.add_parser("benchmark", help="compare encoder profiles: throughput and size on a sample of images")
+    p.add_argument("paths", nargs="+", help="images or folders of images")
+    p.add_argument("--sample", type=int, default=20, help="number of images sampled (0 = all)")
+    p.add_argument("--profiles", nargs="+", choices=list(ENCODER_PROFILES), default=None)
+    p.add_argument("--formats", nargs="+", choices=["png", "jpeg", "webp"], default=["png", "jpeg", "webp"])
+    p.set_defaults(func=cmd_benchmark)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "tile" and (args.size <= 0 or not 0 <= args.overlap < args.size):
+        parser.error("tile: --size must be positive and --overlap must be >= 0 and smaller than --size")
+    setup_logging(args.log_level)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2069 @@
+"""Motore di Visual Editor: tutte le operazioni su immagini e label senza interfaccia.
+
+Il modulo non importa tkinter, così può essere usato sia dall'ImageViewer
+(visualedit.py) sia dalla riga di comando (visualedit_cli.py) e dai processi
+worker dei pool, che non devono caricare Tk.
+"""
+import os
+import io
+import bisect
+import difflib
+import shutil
+from PIL import Image, ImageOps
+import threading
+import contextlib
+import logging
+import logging.handlers
+import atexit
+import csv
+import queue
+import time
+import multiprocessing
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+# cv2 e yaml vengono importati solo dove servono (decode_bgr_rows,
+# SmartCropPipeline._write, load_class_names): l'avvio dell'ImageViewer non li carica.
+import random
+import signal
+import numpy as np
+import json
+import hashlib
+import socket
+import tempfile
+import sqlite3
+import zlib
+
+
+# ============================================================
+# Logging e misure dei tempi
+# ============================================================
+logger = logging.getLogger("visualedit")
+
+# Variabili d'ambiente: livello di log (DEBUG, INFO, ...) e CSV in cui esportare i tempi
+LOG_LEVEL_ENV = "VISUALEDIT_LOG_LEVEL"
+TIMINGS_ENV = "VISUALEDIT_TIMINGS"
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(threadName)s: %(message)s"
+
+
+def setup_logging(level=None, log_file=None):
+    """Configura il logger "visualedit" con una coda non bloccante.
+
+    Chi logga mette solo il record in una coda (QueueHandler); formattazione e
+    scrittura su console/file avvengono nel thread del QueueListener. I messaggi
+    sotto il livello scelto non vengono nemmeno formattati.
+    """
+    level = level or os.environ.get(LOG_LEVEL_ENV, "INFO")
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    formatter = logging.Formatter(LOG_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, *handlers)
+    logger.handlers[:] = [logging.handlers.QueueHandler(records)]
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+class OperationTimings:
+    """Durate per operazione (numero di chiamate, totale, massimo) per il profiling.
+
+    Disattivata per default: in quel caso @timed chiama direttamente la funzione.
+    export() scrive un CSV con una riga per operazione.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._stats = {}  # nome -> [count, total_s, max_s]
+
+    def record(self, name, seconds):
+        with self._lock:
+            stats = self._stats.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+        logger.debug("%s took %.2f ms", name, seconds * 1000)
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timed(self, name=None):
+        """Decoratore che misura ogni chiamata della funzione quando le misure sono attive."""
+        def decorator(func):
+            label = name or func.__qualname__
+
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(label, time.perf_counter() - start)
+
+            wrapper.__name__ = func.__name__
+            wrapper.__qualname__ = func.__qualname__
+            wrapper.__doc__ = func.__doc__
+            return wrapper
+        return decorator
+
+    def rows(self):
+        """[(operazione, chiamate, totale ms, media ms, massimo ms)] ordinate per tempo totale."""
+        with self._lock:
+            items = list(self._stats.items())
+        return sorted(((name, count, total * 1000, total * 1000 / count, peak * 1000)
+                       for name, (count, total, peak) in items), key=lambda row: -row[2])
+
+    def export(self, path):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(["operation", "count", "total_ms", "mean_ms", "max_ms"])
+            for name, count, total, mean, peak in self.rows():
+                writer.writerow([name, count, f"{total:.3f}", f"{mean:.3f}", f"{peak:.3f}"])
+
+
+TIMINGS = OperationTimings()
+timed = TIMINGS.timed
+
+
+def enable_timings_export(path=None):
+    """Attiva le misure e ne esporta il CSV all'uscita (percorso da argomento o da VISUALEDIT_TIMINGS)."""
+    path = path or os.environ.get(TIMINGS_ENV)
+    if not path:
+        return
+    TIMINGS.enabled = True
+    atexit.register(TIMINGS.export, path)
+
+
+def parse_yolo_text(text):
+    """Converte il testo di un file YOLO in un array (N, 5) di float.
+
+    Nel caso comune (tutte le righe con 5 valori) il testo viene convertito con
+    un'unica chiamata NumPy; altrimenti le righe malformate vengono saltate come prima.
+    Il numero di valori è verificato riga per riga: un totale multiplo di 5 non basta
+    (righe da 4 e da 6 valori darebbero box sbagliate).
+    """
+    lines = [parts for parts in (line.split() for line in text.splitlines()) if parts]
+    if not lines:
+        return np.zeros((0, 5), dtype=np.float64)
+    if all(len(parts) == 5 for parts in lines):
+        try:
+            return np.array(text.split(), dtype=np.float64).reshape(-1, 5)
+        except ValueError:
+            pass
+    rows = [parts for parts in lines if len(parts) == 5]
+    return np.array(rows, dtype=np.float64).reshape(-1, 5)
+
+
+def read_yolo_file(label_file):
+    """Legge un file di label YOLO; un file mancante equivale a nessuna annotazione."""
+    if not os.path.exists(label_file):
+        return np.zeros((0, 5), dtype=np.float64)
+    with open(label_file, 'r', encoding='utf-8') as f:
+        return parse_yolo_text(f.read())
+
+
+# Nome (senza estensione) della cache delle label. La cache non sta nella cartella delle
+# label (è un dataset dell'utente) ma in una cartella di cache per utente, una
+# sottocartella per ogni cartella di label: $VISUALEDIT_CACHE_DIR o ~/.cache/visualedit
+LABEL_CACHE_NAME = "labels.cache"
+LABEL_CACHE_VERSION = 1
+CACHE_DIR_ENV = "VISUALEDIT_CACHE_DIR"
+
+
+def cache_dir():
+    """Cartella delle cache di Visual Editor ($VISUALEDIT_CACHE_DIR, poi $XDG_CACHE_HOME/visualedit)."""
+    return os.environ.get(CACHE_DIR_ENV) or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "visualedit")
+
+
+def label_cache_dir(label_dir):
+    """Cartella della cache di una cartella di label: nome leggibile più hash del percorso assoluto."""
+    label_dir = os.path.abspath(label_dir)
+    digest = hashlib.sha1(label_dir.encode('utf-8', 'surrogateescape')).hexdigest()[:16]
+    return os.path.join(cache_dir(), "labels", f"{os.path.basename(label_dir) or 'root'}-{digest}")
+
+
+class LabelCache:
+    """Cache su disco di tutte le label YOLO di una cartella, come i file .cache dei trainer YOLO.
+
+    Tutte le box stanno in un unico array (N, 5) salvato in `labels.cache.npy` e aperto
+    in memory-map; `labels.cache.json` contiene per ogni file mtime, dimensione, offset e
+    numero di righe. update() riusa le voci invariate e rilegge solo i file modificati.
+    I due file stanno in `cache_path` (default: label_cache_dir(label_dir)), mai fra le label.
+    """
+
+    def __init__(self, label_dir, cache_path=None):
+        self.label_dir = label_dir
+        self.cache_path = cache_path or label_cache_dir(label_dir)
+        self.boxes_path = os.path.join(self.cache_path, LABEL_CACHE_NAME + ".npy")
+        self.index_path = os.path.join(self.cache_path, LABEL_CACHE_NAME + ".json")
+        self.boxes = np.zeros((0, 5), dtype=np.float64)
+        self.entries = {}  # nome file -> (mtime_ns, size, offset, count)
+
+    def load(self):
+        """Carica la cache esistente; una cache assente o corrotta equivale a vuota."""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') != LABEL_CACHE_VERSION:
+                return self
+            boxes = np.load(self.boxes_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return self
+        self.boxes = boxes
+        self.entries = {name: tuple(entry) for name, entry in index['entries'].items()}
+        return self
+
+    def update(self):
+        """Rescans the folder, re-parses only new or changed files and rewrites the cache."""
+        if not self.entries:
+            self.load()
+        try:
+            scan = [(e.name, e.path, e.stat()) for e in os.scandir(self.label_dir)
+                    if e.name.endswith(".txt") and e.is_file()]
+        except OSError:
+            scan = []
+        unchanged = len(scan) == len(self.entries) and all(
+            name in self.entries and self.entries[name][:2] == (st.st_mtime_ns, st.st_size)
+            for name, _, st in scan)
+        if unchanged:
+            # Keep the memory-mapped array as it is
+            return self
+
+        chunks = []
+        entries = {}
+        offset = 0
+        for name, path, st in scan:
+            cached = self.entries.get(name)
+            if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+                rows = self.boxes[cached[2]:cached[2] + cached[3]]
+            else:
+                try:
+                    rows = read_yolo_file(path)
+                except (OSError, ValueError) as e:
+                    # Cached as empty so it is not re-parsed until it changes
+                    logger.warning("could not parse labels %s: %s", path, e)
+                    rows = np.zeros((0, 5), dtype=np.float64)
+            chunks.append(rows)
+            entries[name] = (st.st_mtime_ns, st.st_size, offset, len(rows))
+            offset += len(rows)
+        # Copy out of the old memory map before it can be replaced on disk
+        self.boxes = np.concatenate(chunks) if chunks else np.zeros((0, 5), dtype=np.float64)
+        self.entries = entries
+        chunks = rows = None
+        self.save()
+        return self
+
+    def save(self):
+        """Scrive la cache in modo atomico; una cartella in sola lettura non è un errore."""
+        try:
+            os.makedirs(self.cache_path, exist_ok=True)
+            tmp_boxes = self.boxes_path + ".tmp"
+            with open(tmp_boxes, 'wb') as f:
+                np.save(f, np.ascontiguousarray(self.boxes, dtype=np.float64))
+            tmp_index = self.index_path + ".tmp"
+            with open(tmp_index, 'w', encoding='utf-8') as f:
+                json.dump({'version': LABEL_CACHE_VERSION, 'entries': self.entries}, f)
+            os.replace(tmp_boxes, self.boxes_path)
+            os.replace(tmp_index, self.index_path)
+        except OSError as e:
+            logger.warning("could not write label cache in %s: %s", self.cache_path, e)
+
+    def names(self):
+        return list(self.entries)
+
+    def get_rows(self, label_name):
+        """(N, 5) rows of a label file by name; stale or unknown files are read from disk."""
+        label_file = os.path.join(self.label_dir, label_name)
+        cached = self.entries.get(label_name)
+        if cached is not None:
+            try:
+                st = os.stat(label_file)
+            except OSError:
+                return np.zeros((0, 5), dtype=np.float64)
+            if cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                return np.asarray(self.boxes[cached[2]:cached[2] + cached[3]])
+        return read_yolo_file(label_file)
+
+
+# Una riga per bounding box YOLO: classe e coordinate normalizzate (centro e dimensioni)
+ANNOTATION_DTYPE = np.dtype([('cls', np.int32), ('xc', np.float64), ('yc', np.float64),
+                             ('w', np.float64), ('h', np.float64)])
+
+
+class YoloAnnotations:
+    """Annotazioni YOLO di un'immagine in un array NumPy strutturato (colonne cls, xc, yc, w, h).
+
+    Conversione in pixel, rotazione, flip, clipping e salvataggio lavorano su intere
+    colonne; iterando si ottengono le tuple (cls_id, x_center, y_center, w, h).
+    """
+
+    def __init__(self, data=None):
+        if data is None:
+            data = np.zeros(0, dtype=ANNOTATION_DTYPE)
+        self.data = np.asarray(data, dtype=ANNOTATION_DTYPE)
+
+    @classmethod
+    def from_tuples(cls, annotations):
+        return cls(np.array([tuple(ann) for ann in annotations], dtype=ANNOTATION_DTYPE))
+
+    @classmethod
+    def from_array(cls, rows):
+        """Builds the container from an (N, 5) float array of YOLO rows."""
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, 5)
+        data = np.empty(len(rows), dtype=ANNOTATION_DTYPE)
+        data['cls'] = rows[:, 0]
+        for i, name in enumerate(('xc', 'yc', 'w', 'h'), start=1):
+            data[name] = rows[:, i]
+        return cls(data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data.tolist())
+
+    def __getitem__(self, index):
+        return self.data[index].tolist()
+
+    def __repr__(self):
+        return f"YoloAnnotations({self.data.tolist()})"
+
+    @classmethod
+    def load(cls, label_file):
+        return cls.from_array(read_yolo_file(label_file))
+
+    def copy(self):
+        return YoloAnnotations(self.data.copy())
+
+    def append(self, cls_id, x_center, y_center, width, height):
+        row = np.array([(cls_id, x_center, y_center, width, height)], dtype=ANNOTATION_DTYPE)
+        self.data = np.concatenate([self.data, row])
+
+    def delete(self, indices):
+        """Elimina le righe alle posizioni indicate."""
+        self.data = np.delete(self.data, list(indices))
+
+    def to_pixels(self, width, height):
+        """Returns an (N, 4) int array of x1, y1, x2, y2 pixel corners (truncated like int())."""
+        d = self.data
+        corners = np.stack([(d['xc'] - d['w'] / 2) * width,
+                            (d['yc'] - d['h'] / 2) * height,
+                            (d['xc'] + d['w'] / 2) * width,
+                            (d['yc'] + d['h'] / 2) * height], axis=1)
+        return corners.astype(np.int64).reshape(-1, 4)
+
+    def rotated(self, angle=90):
+        """Annotazioni ruotate di +90 o -90 gradi insieme all'immagine."""
+        if angle not in [90, -90]:
+            raise ValueError("Only rotations of +90 or -90 degrees are supported.")
+        d = self.data
+        out = d.copy()
+        if angle == 90:
+            out['xc'] = 1.0 - d['yc']
+            out['yc'] = d['xc']
+        else:
+            out['xc'] = d['yc']
+            out['yc'] = 1.0 - d['xc']
+        out['w'] = d['h']
+        out['h'] = d['w']
+        return YoloAnnotations(out)
+
+    def flipped(self):
+        """Annotazioni dopo un flip orizzontale dell'immagine."""
+        out = self.data.copy()
+        out['xc'] = 1.0 - out['xc']
+        return YoloAnnotations(out)
+
+    def clipped(self):
+        """Clips every box to the image and drops the ones left with no area."""
+        d = self.data
+        x1 = np.clip(d['xc'] - d['w'] / 2, 0.0, 1.0)
+        y1 = np.clip(d['yc'] - d['h'] / 2, 0.0, 1.0)
+        x2 = np.clip(d['xc'] + d['w'] / 2, 0.0, 1.0)
+        y2 = np.clip(d['yc'] + d['h'] / 2, 0.0, 1.0)
+        out = d.copy()
+        out['xc'], out['yc'] = (x1 + x2) / 2, (y1 + y2) / 2
+        out['w'], out['h'] = x2 - x1, y2 - y1
+        return YoloAnnotations(out[(out['w'] > 0) & (out['h'] > 0)])
+
+    def to_text(self):
+        """Serializza le annotazioni nel formato di testo YOLO (una riga per box)."""
+        if not len(self.data):
+            return ""
+        d = self.data
+        columns = np.column_stack([d['cls'], d['xc'], d['yc'], d['w'], d['h']])
+        lines = ["%d %.6f %.6f %.6f %.6f" % tuple(row) for row in columns.tolist()]
+        return "\n".join(lines) + "\n"
+
+    def save(self, label_file):
+        with open(label_file, 'w', encoding='utf-8') as f:
+            f.write(self.to_text())
+
+
+# Estensioni (case-insensitive) delle immagini mostrate nell'elenco file
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+class DirectoryIndex:
+    """Elenco ordinato (percorsi assoluti) delle immagini di una cartella.
+
+    Le modifiche vengono applicate in modo incrementale e restituite come operazioni
+    ('remove', pos) / ('insert', pos, path), così la Listbox può aggiornare solo le
+    righe coinvolte. Un controllo sull'mtime della cartella evita la scansione quando
+    nulla è stato aggiunto, rimosso o rinominato.
+    """
+
+    def __init__(self, directory, extensions=IMAGE_EXTENSIONS):
+        self.directory = os.path.abspath(directory)
+        self.extensions = extensions
+        self.paths = []
+        self._dir_mtime = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    def _list_dir(self):
+        try:
+            with os.scandir(self.directory) as entries:
+                return {os.path.join(self.directory, e.name) for e in entries
+                        if e.name.lower().endswith(self.extensions) and e.is_file()}
+        except OSError:
+            return set()
+
+    def scan(self, force=False):
+        """Diffs the folder against the index; skipped if the folder mtime is unchanged."""
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            mtime = None
+        if not force and mtime is not None and mtime == self._dir_mtime:
+            return []
+        self._dir_mtime = mtime
+        current = self._list_dir()
+        known = set(self.paths)
+        return self.apply(added=current - known, removed=known - current)
+
+    def position(self, path):
+        """Posizione di `path` nell'elenco (ricerca binaria), None se assente."""
+        i = bisect.bisect_left(self.paths, path)
+        if i < len(self.paths) and self.paths[i] == path:
+            return i
+        return None
+
+    def apply(self, added=(), removed=()):
+        """Applica aggiunte/rimozioni e restituisce le operazioni da ripetere sulla Listbox."""
+        ops = []
+        positions = [self.position(os.path.abspath(p)) for p in removed]
+        # Removing from the end keeps the earlier positions valid
+        for pos in sorted((p for p in positions if p is not None), reverse=True):
+            del self.paths[pos]
+            ops.append(('remove', pos))
+        for path in sorted(os.path.abspath(p) for p in added):
+            if not path.lower().endswith(self.extensions) or self.position(path) is not None:
+                continue
+            pos = bisect.bisect_left(self.paths, path)
+            self.paths.insert(pos, path)
+            ops.append(('insert', pos, path))
+        return ops
+
+
+# Indice dei metadati delle immagini, salvato accanto a data.yaml
+IMAGE_METADATA_NAME = "image_metadata.sqlite"
+IMAGE_METADATA_THREADS = 8
+
+ImageInfo = namedtuple('ImageInfo', 'width height mode orientation')
+
+
+def read_image_info(image_path):
+    """Dimensioni, modo ed orientamento EXIF letti dalla sola intestazione dell'immagine."""
+    with Image.open(image_path) as img:
+        try:
+            orientation = int(img.getexif().get(0x0112, 1))
+        except Exception:
+            orientation = 1
+        return ImageInfo(img.width, img.height, img.mode, orientation)
+
+
+class ImageMetadataIndex:
+    """Indice persistente (SQLite) di dimensioni, modo e orientamento EXIF delle immagini.
+
+    Ogni riga è valida finché mtime e dimensione del file coincidono con quelli su disco;
+    le intestazioni vengono rilette solo per i file nuovi o modificati. Tutte le righe
+    restano anche in un dict, per cui una ricerca costa una stat() e un accesso al dict.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        try:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._create_table()
+        except sqlite3.Error as e:
+            logger.warning("image metadata index not persisted (%s): %s", db_path, e)
+            self._db = sqlite3.connect(":memory:", check_same_thread=False)
+            self._create_table()
+        self._rows = {
+            path: (mtime_ns, size, ImageInfo(width, height, mode, orientation))
+            for path, mtime_ns, size, width, height, mode, orientation
+            in self._db.execute("SELECT path, mtime_ns, size, width, height, mode, orientation FROM images")
+        }
+
+    @staticmethod
+    def path_for(yaml_file):
+        """Percorso dell'indice di un dataset, nella cartella di data.yaml."""
+        return os.path.join(os.path.dirname(os.path.abspath(yaml_file)), IMAGE_METADATA_NAME)
+
+    @classmethod
+    def for_dataset(cls, yaml_file):
+        return cls(cls.path_for(yaml_file))
+
+    def close(self):
+        """Chiude il database; le ricerche restano servite dal dict, senza più salvare."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _create_table(self):
+        self._db.execute("CREATE TABLE IF NOT EXISTS images (path TEXT PRIMARY KEY, mtime_ns INTEGER, "
+                         "size INTEGER, width INTEGER, height INTEGER, mode TEXT, orientation INTEGER)")
+        self._db.commit()
+
+    def get(self, path):
+        """ImageInfo dell'immagine (rileggendo l'intestazione se è cambiata); None se illeggibile."""
+        return self.update([path]).get(os.path.abspath(path))
+
+    def size(self, path):
+        """(width, height) dell'immagine, oppure None."""
+        info = self.get(path)
+        return (info.width, info.height) if info else None
+
+    def update(self, paths):
+        """Aggiorna l'indice per `paths` e restituisce {percorso assoluto: ImageInfo}.
+
+        Le intestazioni dei file cambiati vengono lette in parallelo su pochi thread
+        (è lavoro di I/O); le nuove righe vengono scritte in un'unica transazione.
+        """
+        result = {}
+        stale = []
+        for path in map(os.path.abspath, paths):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            with self._lock:
+                row = self._rows.get(path)
+            if row is not None and row[:2] == (st.st_mtime_ns, st.st_size):
+                result[path] = row[2]
+            else:
+                stale.append((path, st.st_mtime_ns, st.st_size))
+        if not stale:
+            return result
+
+        def read(item):
+            try:
+                return item, read_image_info(item[0])
+            except Exception as e:
+                logger.warning("could not read image header %s: %s", item[0], e)
+                return item, None
+
+        if len(stale) == 1:
+            read_results = [read(stale[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=IMAGE_METADATA_THREADS) as executor:
+                read_results = list(executor.map(read, stale))
+        new_rows = []
+        with self._lock:
+            for (path, mtime_ns, size), info in read_results:
+                if info is None:
+                    continue
+                self._rows[path] = (mtime_ns, size, info)
+                result[path] = info
+                new_rows.append((path, mtime_ns, size) + tuple(info))
+            if self._db is None:
+                return result
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?)", new_rows)
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning("could not update image metadata index: %s", e)
+        return result
+
+    def forget(self, paths):
+        """Rimuove dall'indice le immagini cancellate o rinominate."""
+        paths = [os.path.abspath(p) for p in paths]
+        with self._lock:
+            for path in paths:
+                self._rows.pop(path, None)
+            if self._db is None:
+                return
+            try:
+                self._db.executemany("DELETE FROM images WHERE path = ?", [(p,) for p in paths])
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning("could not update image metadata index: %s", e)
+
+
+# ============================================================
+# Profili di codifica, usati da tutte le scritture di immagini
+# ============================================================
+# Parametri di Image.save per formato. compress_type è la strategia zlib dei PNG
+# (Pillow non permette di scegliere il filtro delle righe): Z_RLE è la più veloce.
+ENCODER_PROFILES = {
+    'fast': {
+        'PNG': {'compress_level': 1, 'compress_type': zlib.Z_RLE},
+        'JPEG': {'quality': 85, 'subsampling': 2, 'optimize': False},
+        'WEBP': {'quality': 80, 'method': 0},
+    },
+    'balanced': {
+        'PNG': {'compress_level': 3, 'compress_type': zlib.Z_FILTERED},
+        'JPEG': {'quality': 92, 'subsampling': 2, 'optimize': False},
+        'WEBP': {'quality': 90, 'method': 4},
+    },
+    'archival': {
+        'PNG': {'compress_level': 9, 'optimize': True},
+        'JPEG': {'quality': 95, 'subsampling': 0, 'optimize': True},
+        'WEBP': {'lossless': True, 'quality': 50, 'method': 4},
+    },
+}
+ENCODER_PROFILE_ENV = "VISUALEDIT_ENCODER_PROFILE"
+DEFAULT_ENCODER_PROFILE = "balanced"
+
+
+def encoder_profile(profile=None):
+    """Nome del profilo da usare: `profile`, altrimenti VISUALEDIT_ENCODER_PROFILE o "balanced"."""
+    profile = profile or os.environ.get(ENCODER_PROFILE_ENV) or DEFAULT_ENCODER_PROFILE
+    if profile not in ENCODER_PROFILES:
+        raise ValueError(f"Unknown encoder profile: {profile}")
+    return profile
+
+
+def save_params(image_format, profile=None):
+    """Parametri di Image.save per `image_format` ("PNG", "JPEG", "WEBP") nel profilo scelto."""
+    return dict(ENCODER_PROFILES[encoder_profile(profile)].get(image_format, {}))
+
+
+def cv2_write_params(ext, profile=None):
+    """Gli stessi parametri del profilo tradotti per cv2.imwrite, in base all'estensione."""
+    import cv2
+    image_format = TILE_FORMATS.get(ext.lower())
+    params = save_params(image_format, profile)
+    if image_format == 'PNG':
+        level = 9 if params.get('optimize') else params.get('compress_level', 6)
+        # Le costanti IMWRITE_PNG_STRATEGY_* coincidono con quelle di zlib
+        return [cv2.IMWRITE_PNG_COMPRESSION, level,
+                cv2.IMWRITE_PNG_STRATEGY, max(params.get('compress_type', 0), 0)]
+    if image_format == 'JPEG':
+        flags = [cv2.IMWRITE_JPEG_QUALITY, params.get('quality', 75),
+                 cv2.IMWRITE_JPEG_OPTIMIZE, int(params.get('optimize', False))]
+        if hasattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR'):  # OpenCV >= 4.5.5
+            factors = {0: cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444, 1: cv2.IMWRITE_JPEG_SAMPLING_FACTOR_422,
+                       2: cv2.IMWRITE_JPEG_SAMPLING_FACTOR_420}
+            flags += [cv2.IMWRITE_JPEG_SAMPLING_FACTOR, factors[params.get('subsampling', 2)]]
+        return flags
+    if image_format == 'WEBP':
+        return [cv2.IMWRITE_WEBP_QUALITY, 101 if params.get('lossless') else params.get('quality', 80)]
+    return []
+
+
+def encode_image(image, f, image_format, params):
+    """image.save su un file aperto con i parametri di un profilo.
+
+    Con optimize Pillow codifica un JPEG in un buffer di dimensione fissa, che le immagini
+    molto rumorose possono superare: in quel caso il file viene riscritto senza optimize.
+    """
+    try:
+        image.save(f, format=image_format, **params)
+    except OSError:
+        if image_format != 'JPEG' or not params.get('optimize'):
+            raise
+        f.seek(0)
+        f.truncate()
+        image.save(f, format=image_format, **dict(params, optimize=False))
+
+
+def benchmark_encoder_profiles(image_paths, profiles=None, formats=('PNG', 'JPEG', 'WEBP')):
+    """Misura, per ogni profilo e formato, velocità e dimensione della codifica in memoria.
+
+    Le immagini vengono decodificate una volta sola prima delle misure. Restituisce un
+    dizionario per combinazione: profile, format, images, seconds, mpix_per_s,
+    mean_kb e ratio (byte scritti / byte RGB non compressi).
+    """
+    images = []
+    for path in image_paths:
+        with Image.open(path) as img:
+            images.append(img.convert("RGB"))
+    if not images:
+        return []
+    raw_bytes = sum(img.width * img.height * 3 for img in images)
+    results = []
+    for profile in profiles or ENCODER_PROFILES:
+        for image_format in formats:
+            params = save_params(image_format, profile)
+            written = 0
+            start = time.perf_counter()
+            for img in images:
+                buffer = io.BytesIO()
+                encode_image(img, buffer, image_format, params)
+                written += buffer.tell()
+            seconds = time.perf_counter() - start
+            results.append({'profile': profile, 'format': image_format, 'images': len(images),
+                            'seconds': round(seconds, 4),
+                            'mpix_per_s': round(raw_bytes / 3 / 1e6 / max(seconds, 1e-9), 2),
+                            'mean_kb': round(written / len(images) / 1024, 1),
+                            'ratio': round(written / raw_bytes, 4)})
+    return results
+
+
+# Formato di salvataggio dei tile in base all'estensione (default PNG)
+TILE_FORMATS = {
+    '.jpg': 'JPEG',
+    '.jpeg': 'JPEG',
+    '.png': 'PNG',
+    '.webp': 'WEBP',
+}
+
+def tile_grid(width, height, tile_size, overlap=0):
+    """Restituisce i box (x1, y1, x2, y2) dei tile, con passo tile_size - overlap.
+
+    Una nuova riga/colonna viene aggiunta solo se contiene pixel non coperti dalla
+    precedente; con overlap=0 la griglia è quella classica range(0, w, tile_size).
+    Solleva ValueError se tile_size <= 0 o overlap non è in [0, tile_size).
+    """
+    if tile_size <= 0:
+        raise ValueError(f"tile size must be positive, got {tile_size}")
+    if not 0 <= overlap < tile_size:
+        raise ValueError(f"overlap must be >= 0 and smaller than the tile size ({tile_size}), got {overlap}")
+    stride = tile_size - overlap
+    xs = range(0, max(width - overlap, 1), stride)
+    ys = range(0, max(height - overlap, 1), stride)
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height)) for y in ys for x in xs]
+
+
+def _box_tile_edges(annotations, image_size, tiles):
+    """Bordi (left, top, right, bottom) di ogni box ritagliata su ogni tile, come matrici
+    (tile x box), più le coordinate dei tile come colonne e l'area di ogni box."""
+    w, h = image_size
+    data = annotations.data
+    bx1 = (data['xc'] - data['w'] / 2) * w
+    bx2 = (data['xc'] + data['w'] / 2) * w
+    by1 = (data['yc'] - data['h'] / 2) * h
+    by2 = (data['yc'] + data['h'] / 2) * h
+    tx1, ty1, tx2, ty2 = (tiles[:, i:i + 1] for i in range(4))
+    edges = (np.maximum(bx1, tx1), np.maximum(by1, ty1), np.minimum(bx2, tx2), np.minimum(by2, ty2))
+    return edges, (tx1, ty1, tx2, ty2), (bx2 - bx1) * (by2 - by1)
+
+
+def box_visibility(annotations, image_size, tiles):
+    """Frazione dell'area di ogni box che cade in ogni tile, come matrice (tile x box)."""
+    tiles = np.asarray(tiles, dtype=np.float64).reshape(-1, 4)
+    if not len(annotations):
+        return np.zeros((len(tiles), 0))
+    (left, top, right, bottom), _, area = _box_tile_edges(annotations, image_size, tiles)
+    visible = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    return visible / np.maximum(area, 1e-12)
+
+
+def split_annotations(annotations, image_size, tiles, min_visibility=0.0, keep=None):
+    """Distribuisce le annotazioni YOLO dell'immagine intera sui tile.
+
+    L'intersezione box/tile è calcolata per tutte le coppie in un'unica operazione
+    NumPy (matrice tile x box). Una box viene assegnata a un tile se la parte visibile
+    è almeno `min_visibility` della sua area (oppure secondo la matrice booleana `keep`,
+    se fornita); viene poi ritagliata e rinormalizzata rispetto al tile.
+    Restituisce una YoloAnnotations per ogni tile.
+    """
+    tiles = np.asarray(tiles, dtype=np.float64).reshape(-1, 4)
+    if not len(annotations):
+        return [YoloAnnotations() for _ in range(len(tiles))]
+    (left, top, right, bottom), (tx1, ty1, tx2, ty2), area = _box_tile_edges(annotations, image_size, tiles)
+    if keep is None:
+        visible = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+        keep = (visible > 0) & (visible >= min_visibility * area)
+
+    tile_idx, box_idx = np.nonzero(keep)  # ordinati per tile
+    tile_w = (tx2 - tx1)[tile_idx, 0]
+    tile_h = (ty2 - ty1)[tile_idx, 0]
+    l, r = left[tile_idx, box_idx], right[tile_idx, box_idx]
+    t, b = top[tile_idx, box_idx], bottom[tile_idx, box_idx]
+    out = np.empty(len(tile_idx), dtype=ANNOTATION_DTYPE)
+    out['cls'] = annotations.data['cls'][box_idx]
+    out['xc'] = ((l + r) / 2 - tx1[tile_idx, 0]) / tile_w
+    out['yc'] = ((t + b) / 2 - ty1[tile_idx, 0]) / tile_h
+    out['w'] = (r - l) / tile_w
+    out['h'] = (b - t) / tile_h
+
+    bounds = np.cumsum(np.bincount(tile_idx, minlength=len(tiles)))[:-1]
+    return [YoloAnnotations(part) for part in np.split(out, bounds)]
+
+
+def merge_redundant_windows(keep, threshold):
+    """Indici delle finestre da tenere: una finestra viene scartata se il suo insieme di
+    box coincide per almeno `threshold` (indice di Jaccard) con quello di una già tenuta."""
+    sizes = keep.sum(axis=1)
+    kept = []
+    for i in range(len(keep)):
+        if kept:
+            inter = (keep[kept] & keep[i]).sum(axis=1)
+            union = sizes[kept] + sizes[i] - inter
+            if np.any((union > 0) & (inter >= threshold * union)):
+                continue
+        kept.append(i)
+    return kept
+
+
+def tile_image_file(img_path, tile_size=512, overlap=0, label_file=None, output_label_dir=None,
+                    min_visibility=0.0, skip_empty=False, profile=None):
+    """Divide un'immagine in tile e li salva come _T{tile_size}_{num:03d}.ext.
+
+    Se label_file esiste, le sue box vengono ritagliate su ogni tile e scritte in
+    output_label_dir con lo stesso nome del tile (vedi split_annotations). Con
+    skip_empty i tile senza box non vengono salvati; la numerazione resta quella
+    della griglia. I tile vengono codificati con il profilo `profile` (vedi save_params).
+    È una funzione di modulo (e non un metodo) così da poter girare
+    nei processi di ProcessPoolExecutor.
+    Restituisce (percorsi dei tile creati, numero di file di label scritti).
+    """
+    img = Image.open(img_path)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    annotations = YoloAnnotations.load(label_file) if label_file else YoloAnnotations()
+
+    dir_name, base = os.path.split(img_path)
+    base_name, ext = os.path.splitext(base)
+    img_format = TILE_FORMATS.get(ext.lower(), 'PNG')
+
+    if len(annotations) and output_label_dir:
+        os.makedirs(output_label_dir, exist_ok=True)
+
+    boxes = tile_grid(img.width, img.height, tile_size, overlap)
+    per_tile = split_annotations(annotations, img.size, boxes, min_visibility)
+
+    created = []
+    labels_written = 0
+    for tile_num, (box, tile_annotations) in enumerate(zip(boxes, per_tile), start=1):
+        if skip_empty and not len(tile_annotations):
+            continue
+        tile_name = f"{base_name}_T{tile_size}_{tile_num:03d}"
+        new_tile_path = os.path.join(dir_name, f"{tile_name}{ext}")
+        atomic_save(img.crop(box), new_tile_path, format=img_format, profile=profile)
+        created.append(new_tile_path)
+        if len(tile_annotations) and output_label_dir:
+            tile_annotations.save(os.path.join(output_label_dir, tile_name + ".txt"))
+            labels_written += 1
+    return created, labels_written
+
+
+def find_image_for_label(label_name, images_by_stem):
+    """Percorso dell'immagine con lo stesso nome base della label (qualsiasi estensione supportata)."""
+    return images_by_stem.get(os.path.splitext(label_name)[0])
+
+
+def plan_crop(x_center, y_center, img_width, img_height, width, height, crop_mode, margin):
+    """Finestra (x1, y1, x2, y2) di Smart Crop per un oggetto centrato in (x_center, y_center)."""
+    if crop_mode == "Centered":
+        crop_x1 = max(margin, x_center - width // 2)
+        crop_y1 = max(margin, y_center - height // 2)
+    else:  # Random
+        max_x = img_width - width - margin
+        max_y = img_height - height - margin
+        crop_x1 = random.randint(margin, max(margin, max_x))
+        crop_y1 = random.randint(margin, max(margin, max_y))
+
+    crop_x2 = min(img_width - margin, crop_x1 + width)
+    crop_y2 = min(img_height - margin, crop_y1 + height)
+
+    # Adjust crop coordinates if they exceed image boundaries
+    if crop_x2 - crop_x1 < width:
+        crop_x1 = max(margin, crop_x2 - width)
+    if crop_y2 - crop_y1 < height:
+        crop_y1 = max(margin, crop_y2 - height)
+    return crop_x1, crop_y1, crop_x2, crop_y2
+
+
+def _decode_png_rows(img, bottom):
+    """Righe [0, bottom) di un PNG RGB non interlacciato aperto con Pillow, in ordine BGR;
+    None se il file non è di questo tipo.
+
+    Usa lo stato interno di ImageFile (_size e tile): va verificata con
+    _partial_png_decode_supported() sulla versione di Pillow installata.
+    """
+    width, height = img.size
+    tile = img.tile
+    if not (img.format == "PNG" and img.mode == "RGB" and not img.info.get("interlace")
+            and len(tile) == 1 and tile[0][0] == "zip" and tile[0][3] == "RGB"):
+        return None
+    img._size = (width, bottom)
+    img.tile = [("zip", (0, 0, width, bottom), tile[0][2], "BGR")]
+    img.load()
+    rows = np.asarray(img)
+    if rows.shape != (bottom, width, 3):
+        raise ValueError(f"unexpected partial decode shape {rows.shape}")
+    return rows
+
+
+_PARTIAL_PNG_DECODE = None  # Esito di _partial_png_decode_supported(), calcolato una volta
+
+
+def _partial_png_decode_supported():
+    """Verifica (una volta per processo) che _decode_png_rows funzioni con questo Pillow,
+    confrontandola con una decodifica completa di un piccolo PNG."""
+    global _PARTIAL_PNG_DECODE
+    if _PARTIAL_PNG_DECODE is None:
+        try:
+            source = Image.fromarray(np.arange(4 * 3 * 3, dtype=np.uint8).reshape(4, 3, 3), "RGB")
+            buffer = io.BytesIO()
+            source.save(buffer, format="PNG")
+            with Image.open(buffer) as img:
+                rows = _decode_png_rows(img, 2)
+            _PARTIAL_PNG_DECODE = rows is not None and np.array_equal(rows, np.asarray(source)[:2, :, ::-1])
+        except Exception as e:
+            logger.debug("Partial PNG decode not available: %s", e)
+            _PARTIAL_PNG_DECODE = False
+    return _PARTIAL_PNG_DECODE
+
+
+def decode_bgr_rows(image_path, bottom=None):
+    """Decodifica le righe [0, bottom) di un'immagine in un array BGR (come cv2.imread).
+
+    I PNG RGB non interlacciati sono un unico flusso zlib letto riga per riga: Pillow
+    viene fermato a `bottom` e scrive direttamente in ordine BGR, senza decodificare né
+    allocare le righe sottostanti. Gli altri formati, o un Pillow su cui la decodifica
+    parziale non funziona, passano per la decodifica completa di OpenCV. Restituisce
+    None se l'immagine non è leggibile.
+    """
+    if bottom is not None and _partial_png_decode_supported():
+        try:
+            with Image.open(image_path) as img:
+                if bottom < img.height:
+                    rows = _decode_png_rows(img, bottom)
+                    if rows is not None:
+                        return rows
+        except Exception as e:
+            logger.warning("Partial decode failed for %s, reading the whole image: %s", image_path, e)
+    import cv2
+    return cv2.imread(image_path)
+
+
+# Thread per stadio della pipeline di Smart Crop e capienza delle code tra gli stadi
+SMART_CROP_WORKERS = {'read': max(2, (os.cpu_count() or 2) // 2),
+                      'crop': 2,
+                      'write': max(2, (os.cpu_count() or 2) // 2)}
+SMART_CROP_QUEUE_SIZE = 8
+
+# Frazione minima dell'area di una box (diversa da quella centrata) che deve cadere
+# in un ritaglio perché venga scritta nella sua label
+SMART_CROP_MIN_VISIBILITY = 0.25
+
+_STAGE_DONE = object()
+
+
+class SmartCropPipeline:
+    """Smart Crop a tre stadi: lettura, ritaglio e scrittura.
+
+    Ogni stadio ha il proprio gruppo di thread (decodifica e codifica di OpenCV
+    rilasciano il GIL) e gli stadi comunicano tramite code limitate, per cui in memoria
+    restano al massimo poche immagini decodificate. Per ogni stadio vengono misurati
+    elementi elaborati e tempo di lavoro; cancel() interrompe la pipeline svuotando le code.
+
+    Lo stadio di lettura pianifica le finestre dalla sola intestazione dell'immagine,
+    poi la decodifica una volta sola fino all'ultima riga usata (vedi decode_bgr_rows);
+    tutti i ritagli sono viste sullo stesso buffer, senza copie.
+
+    Ogni ritaglio riceve tutte le box che contiene (almeno min_visibility della loro area,
+    sempre quella su cui è centrato). Con merge_threshold le finestre il cui insieme di
+    box coincide quasi del tutto con quello di una finestra precedente vengono scartate.
+    """
+
+    STAGES = ('read', 'crop', 'write')
+
+    def __init__(self, image_dir, label_dir, output_image_dir, output_label_dir,
+                 crop_mode, margin, resolution, min_visibility=SMART_CROP_MIN_VISIBILITY,
+                 merge_threshold=None, workers=None, queue_size=SMART_CROP_QUEUE_SIZE, metadata=None,
+                 profile=None):
+        self.image_dir = image_dir
+        self.label_dir = label_dir
+        self.output_image_dir = output_image_dir
+        self.output_label_dir = output_label_dir
+        self.crop_mode = crop_mode
+        self.margin = margin
+        self.width, self.height = map(int, resolution.lower().split("x"))
+        self.min_visibility = min_visibility
+        self.merge_threshold = merge_threshold
+        self.workers = dict(SMART_CROP_WORKERS, **(workers or {}))
+        self.queue_size = queue_size
+        self.label_cache = None
+        self.metadata = metadata
+        self.profile = encoder_profile(profile)
+        self._write_params = {}  # estensione -> parametri di cv2.imwrite del profilo
+        self.cancelled = threading.Event()
+        self.started = None
+        self._stats_lock = threading.Lock()
+        self.stage_stats = {name: {'items': 0, 'busy': 0.0} for name in self.STAGES}
+
+    def plan(self):
+        """Restituisce l'elenco (nome label, percorso immagine, dimensioni o None) da elaborare."""
+        self.label_cache = LabelCache(self.label_dir).update()
+        images_by_stem = {}
+        for entry in os.scandir(self.image_dir):
+            stem, ext = os.path.splitext(entry.name)
+            if ext.lower() in IMAGE_EXTENSIONS and entry.is_file():
+                images_by_stem.setdefault(stem, entry.path)
+        jobs = []
+        for label_name in self.label_cache.names():
+            image_path = find_image_for_label(label_name, images_by_stem)
+            if image_path is None:
+                logger.warning("Image not found for label %s", label_name)
+                continue
+            jobs.append((label_name, image_path))
+        # Le dimensioni servono a pianificare le finestre: dall'indice, senza aprire le immagini
+        sizes = self.metadata.update(p for _, p in jobs) if self.metadata else {}
+        return [(label_name, image_path, sizes.get(os.path.abspath(image_path)))
+                for label_name, image_path in jobs]
+
+    def run(self, jobs, on_done=None):
+        """Elabora i job (bloccante, da chiamare fuori dal thread di Tk).
+
+        on_done(label_name, crops_written, error) viene chiamato dal thread di scrittura
+        per ogni immagine completata.
+        """
+        os.makedirs(self.output_image_dir, exist_ok=True)
+        os.makedirs(self.output_label_dir, exist_ok=True)
+        self.on_done = on_done
+        inbox = queue.Queue()
+        for job in jobs:
+            inbox.put(job)
+        queues = [inbox] + [queue.Queue(maxsize=self.queue_size) for _ in self.STAGES[1:]] + [None]
+        handlers = {'read': self._read, 'crop': self._crop, 'write': self._write}
+
+        self.started = time.perf_counter()
+        threads = []
+        for i, name in enumerate(self.STAGES):
+            stage = [threading.Thread(target=self._stage_worker,
+                                      args=(name, handlers[name], queues[i], queues[i + 1]), daemon=True)
+                     for _ in range(self.workers[name])]
+            for t in stage:
+                t.start()
+            threads.append(stage)
+        for _ in range(self.workers['read']):
+            inbox.put(_STAGE_DONE)
+        # Quando uno stadio termina, chiude quello successivo
+        for i, stage in enumerate(threads):
+            for t in stage:
+                t.join()
+            if queues[i + 1] is not None:
+                for _ in range(self.workers[self.STAGES[i + 1]]):
+                    queues[i + 1].put(_STAGE_DONE)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _stage_worker(self, name, handler, source, target):
+        while True:
+            item = source.get()
+            if item is _STAGE_DONE:
+                return
+            if self.cancelled.is_set():
+                continue  # keep draining so upstream stages never block on a full queue
+            start = time.perf_counter()
+            try:
+                result = handler(item)
+            except Exception as e:
+                logger.error("Smart crop %s error on %s: %s", name, item[0], e)
+                result = None
+                if self.on_done:
+                    self.on_done(item[0], 0, e)
+            with self._stats_lock:
+                stats = self.stage_stats[name]
+                stats['items'] += 1
+                stats['busy'] += time.perf_counter() - start
+            if result is not None and target is not None:
+                target.put(result)
+
+    def _read(self, job):
+        """Pianifica le finestre e decodifica solo la parte d'immagine che serve."""
+        label_name, image_path, info = job
+        if info is None:
+            with Image.open(image_path) as img:
+                img_size = img_width, img_height = img.size
+        else:
+            img_size = img_width, img_height = info.width, info.height
+        annotations = YoloAnnotations.from_array(self.label_cache.get_rows(label_name))
+        centers = np.column_stack([annotations.data['xc'] * img_width,
+                                   annotations.data['yc'] * img_height]).astype(np.int64)
+        windows = [(idx, plan_crop(x, y, img_width, img_height, self.width, self.height,
+                                   self.crop_mode, self.margin))
+                   for idx, (x, y) in enumerate(centers.tolist())]
+        windows = [(idx, w) for idx, w in windows if w[2] > w[0] and w[3] > w[1]]
+        if not windows:
+            return label_name, image_path, None, []
+
+        # Tutte le box di ogni finestra in un colpo solo (matrice finestre x box)
+        boxes = np.array([w for _, w in windows], dtype=np.float64)
+        visibility = box_visibility(annotations, img_size, boxes)
+        keep = (visibility > 0) & (visibility >= self.min_visibility)
+        rows = np.arange(len(windows))
+        primary = np.array([idx for idx, _ in windows])
+        keep[rows, primary] = visibility[rows, primary] > 0
+        if self.merge_threshold:
+            selected = merge_redundant_windows(keep, self.merge_threshold)
+            windows = [windows[i] for i in selected]
+            boxes, keep = boxes[selected], keep[selected]
+        per_window = split_annotations(annotations, img_size, boxes, keep=keep)
+
+        bottom = max(w[3] for _, w in windows)
+        image = decode_bgr_rows(image_path, bottom)
+        if image is None:
+            raise ValueError(f"Could not read image {os.path.basename(image_path)}")
+        return label_name, image_path, image, list(zip(windows, per_window))
+
+    def _crop(self, item):
+        """Ritaglia le finestre pianificate come viste sul buffer decodificato (nessuna copia)."""
+        label_name, image_path, image, windows = item
+        stem = os.path.splitext(label_name)[0]
+        ext = os.path.splitext(image_path)[1]
+        crops = []
+        for (idx, (crop_x1, crop_y1, crop_x2, crop_y2)), window_annotations in windows:
+            crops.append((f"{stem}_crop_{idx}", ext, image[crop_y1:crop_y2, crop_x1:crop_x2],
+                          window_annotations.to_text()))
+        return label_name, crops
+
+    def _write(self, item):
+        import cv2
+        label_name, crops = item
+        for name, ext, pixels, label_line in crops:
+            params = self._write_params.get(ext)
+            if params is None:
+                params = self._write_params[ext] = cv2_write_params(ext, self.profile)
+            if not cv2.imwrite(os.path.join(self.output_image_dir, name + ext), pixels, params):
+                raise ValueError(f"Could not write crop {name}{ext}")
+            with open(os.path.join(self.output_label_dir, name + ".txt"), "w") as label_outfile:
+                label_outfile.write(label_line)
+        if self.on_done:
+            self.on_done(label_name, len(crops), None)
+
+    def describe(self):
+        """Throughput per stadio: elementi, elementi/s sul tempo trascorso e tempo di lavoro."""
+        elapsed = max(time.perf_counter() - self.started, 1e-9) if self.started else 0.0
+        with self._stats_lock:
+            parts = [f"{name}: {s['items']} ({s['items'] / elapsed if elapsed else 0:.1f}/s, "
+                     f"busy {s['busy']:.1f}s)" for name, s in self.stage_stats.items()]
+        return " | ".join(parts)
+
+
+def _read_umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# Letta una volta all'import: os.umask() cambia la maschera di tutto il processo
+_UMASK = _read_umask()
+
+
+def _match_mode(tmp_path, path):
+    """Dà al file temporaneo i permessi di `path` (o quelli di un file nuovo, 0o666 & ~umask):
+    mkstemp lo crea 0o600 e os.replace li manterrebbe."""
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    os.chmod(tmp_path, mode)
+
+
+def atomic_save(image, path, format=None, profile=None, **params):
+    """Salva in un file temporaneo nella stessa cartella e poi lo sostituisce a `path`,
+    così un errore o un'interruzione non lasciano mai un file a metà.
+
+    La codifica usa il profilo `profile` (vedi save_params); `params` ne sovrascrive i valori.
+    """
+    format = format or Image.registered_extensions().get(os.path.splitext(path)[1].lower())
+    params = dict(save_params(format, profile), **params)
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix="." + name + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            encode_image(image, f, format, params)
+        _match_mode(tmp_path, path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def halve_image_file(img_path, profile=None):
+    """Riduce un'immagine a metà risoluzione sovrascrivendola in modo atomico.
+
+    Per i JPEG la riduzione 2x arriva direttamente dalla decodifica DCT (draft), senza
+    decodificare l'immagine intera; gli altri formati usano LANCZOS come prima.
+    Restituisce le nuove dimensioni; solleva ValueError se l'immagine è troppo piccola.
+    """
+    img = Image.open(img_path)
+    img_format = img.format
+    w, h = img.size
+    if w < 2 or h < 2:
+        raise ValueError("unable to reduce further")
+    new_size = (w // 2, h // 2)
+    if img_format == "JPEG":
+        img.draft("RGB", new_size)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    # Con draft le dimensioni sono già (quasi) quelle finali: il resize è solo un ritocco
+    resized = img if img.size == new_size else img.resize(new_size, Image.LANCZOS)
+    atomic_save(resized, img_path, format=img_format, profile=profile)
+    return new_size
+
+
+def grayscale_image_file(img_path, profile=None):
+    """Converte un'immagine in scala di grigi (salvata come RGB) sovrascrivendola in modo atomico."""
+    img = Image.open(img_path)
+    img_format = img.format
+    atomic_save(img.convert('L').convert('RGB'), img_path, format=img_format, profile=profile)
+
+
+def label_path_for(img_path, labels_dir):
+    """Percorso del file .txt YOLO associato a un'immagine in `labels_dir`."""
+    return os.path.join(labels_dir, os.path.splitext(os.path.basename(img_path))[0] + ".txt")
+
+
+def delete_image_files(img_path, labels_dir):
+    """Elimina un'immagine e il suo file di annotazione; restituisce i file eliminati."""
+    deleted = []
+    for path in (img_path, label_path_for(img_path, labels_dir)):
+        if os.path.exists(path):
+            os.remove(path)
+            deleted.append(path)
+    return deleted
+
+
+def rename_image_files(original_path, new_path, labels_dir):
+    """Rinomina un'immagine e il suo file di annotazione (se esiste)."""
+    if os.path.exists(new_path):
+        raise FileExistsError(f"'{os.path.basename(new_path)}' already exists. Skipped.")
+    os.rename(original_path, new_path)
+    label_file_old = label_path_for(original_path, labels_dir)
+    if os.path.exists(label_file_old):
+        os.rename(label_file_old, label_path_for(new_path, labels_dir))
+    return new_path
+
+
+def suffixed_path(path, suffix):
+    """Percorso di `path` con `_suffix` aggiunto al nome base (stessa cartella ed estensione)."""
+    base, ext = os.path.splitext(path)
+    return f"{base}_{suffix}{ext}"
+
+
+def load_class_names(yaml_file):
+    """Legge la mappa id -> nome classe da `names` in data.yaml (dict o lista)."""
+    import yaml
+    with open(yaml_file, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f) or {}
+    names = data.get('names', {})
+    if isinstance(names, list):
+        return dict(enumerate(names))
+    return {int(k): v for k, v in names.items()}
+
+
+def read_image_size(image_path):
+    """(width, height) letti dall'intestazione, senza decodificare i pixel."""
+    with Image.open(image_path) as img:
+        return img.size
+
+
+LABEL_FORMATS = ("YOLO", "COCO", "JSON")
+COCO_OUTPUT_NAME = "annotations.json"
+
+
+def detect_label_format(label_path):
+    """Riconosce il formato delle label in ingresso: YOLO (cartella di .txt), COCO
+    (un file JSON con 'images' e 'annotations') o JSON (un file per immagine)."""
+    if os.path.isfile(label_path):
+        return "COCO"
+    names = os.listdir(label_path)
+    if any(n.endswith(".txt") for n in names):
+        return "YOLO"
+    json_files = [n for n in names if n.endswith(".json")]
+    if len(json_files) == 1 and is_coco_file(os.path.join(label_path, json_files[0])):
+        return "COCO"
+    return "JSON"
+
+
+def is_coco_file(json_file):
+    """True se il file è un dataset COCO: un oggetto con le liste 'images' e 'annotations'
+    (i JSON per immagine scritti dal convertitore hanno solo 'annotations')."""
+    try:
+        with open(json_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (isinstance(data, dict) and isinstance(data.get('images'), list)
+            and isinstance(data.get('annotations'), list))
+
+
+def load_label_record(job):
+    """Legge un'immagine con le sue label come (file_name, width, height, righe YOLO (N, 5)).
+
+    job è ('YOLO', image_path, label_file, size), ('JSON', json_file, image_dir, None)
+    oppure ('RECORD', image_path, record, None) per i record già estratti da un file COCO.
+    Se size è None le dimensioni vengono lette dall'intestazione dell'immagine.
+    """
+    kind, path, extra, size = job
+    if kind == "YOLO":
+        width, height = size or read_image_size(path)
+        return os.path.basename(path), width, height, read_yolo_file(extra)
+    if kind == "JSON":
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        file_name = data['image']
+        if 'width' in data and 'height' in data:
+            width, height = data['width'], data['height']
+        else:
+            width, height = read_image_size(os.path.join(extra, file_name))
+        boxes = [(a['class_id'],) + tuple(a['bbox']) for a in data.get('annotations', [])]
+        return file_name, width, height, pixel_boxes_to_yolo(boxes, width, height)
+    return extra
+
+
+def pixel_boxes_to_yolo(boxes, width, height):
+    """Box (cls, x_min, y_min, w, h) in pixel -> righe YOLO normalizzate (N, 5)."""
+    rows = np.array(boxes, dtype=np.float64).reshape(-1, 5)
+    return np.column_stack([rows[:, 0],
+                            (rows[:, 1] + rows[:, 3] / 2) / width,
+                            (rows[:, 2] + rows[:, 4] / 2) / height,
+                            rows[:, 3] / width,
+                            rows[:, 4] / height])
+
+
+def yolo_to_pixel_boxes(rows, width, height):
+    """Righe YOLO (N, 5) -> array (N, 4) di box [x_min, y_min, w, h] in pixel."""
+    rows = np.asarray(rows, dtype=np.float64).reshape(-1, 5)
+    return np.column_stack([(rows[:, 1] - rows[:, 3] / 2) * width,
+                            (rows[:, 2] - rows[:, 4] / 2) * height,
+                            rows[:, 3] * width,
+                            rows[:, 4] * height])
+
+
+def convert_label_job(job, output_format, output_dir, names, output_image_dir=None, image_dir=None):
+    """Converte una singola immagine (gira nei processi del pool).
+
+    Per YOLO e JSON scrive direttamente il file di output; per COCO restituisce il record,
+    che il processo principale accoda al file unico. Se output_image_dir è indicato,
+    l'immagine originale vi viene copiata senza modifiche.
+    """
+    record = load_label_record(job)
+    file_name, width, height, rows = record
+    stem = os.path.splitext(file_name)[0]
+    if output_image_dir and image_dir:
+        source = os.path.join(image_dir, file_name)
+        target = os.path.join(output_image_dir, file_name)
+        if os.path.abspath(source) != os.path.abspath(target) and os.path.exists(source):
+            shutil.copy2(source, target)
+    if output_format == "YOLO":
+        YoloAnnotations.from_array(rows).save(os.path.join(output_dir, stem + ".txt"))
+    elif output_format == "JSON":
+        annotations = [{'class_id': int(cls), 'class_name': names.get(int(cls), str(int(cls))),
+                        'bbox': [round(v, 2) for v in box]}
+                       for cls, box in zip(rows[:, 0].tolist(), yolo_to_pixel_boxes(rows, width, height).tolist())]
+        with open(os.path.join(output_dir, stem + ".json"), 'w', encoding='utf-8') as f:
+            json.dump({'image': file_name, 'width': width, 'height': height, 'annotations': annotations}, f)
+    return record if output_format == "COCO" else (file_name, width, height, None)
+
+
+class CocoWriter:
+    """Scrive un file COCO in streaming: le immagini vanno direttamente nel file, le
+    annotazioni in un file temporaneo che viene accodato in close(), così nessuno dei
+    due array viene mai tenuto interamente in memoria."""
+
+    def __init__(self, path, names):
+        self.path = path
+        self.image_id = 0
+        self.annotation_id = 0
+        self._out = open(path + ".tmp", 'w', encoding='utf-8')
+        self._annotations = open(path + ".annotations.tmp", 'w+', encoding='utf-8')
+        categories = [{'id': int(k), 'name': v, 'supercategory': 'none'} for k, v in sorted(names.items())]
+        self._out.write('{"info": {"description": "Converted by Visual Editor"}, "categories": ')
+        self._out.write(json.dumps(categories))
+        self._out.write(', "images": [')
+
+    def add(self, file_name, width, height, rows):
+        self.image_id += 1
+        separator = ", " if self.image_id > 1 else ""
+        self._out.write(separator + json.dumps({'id': self.image_id, 'file_name': file_name,
+                                                'width': width, 'height': height}))
+        for cls, box in zip(rows[:, 0].tolist(), yolo_to_pixel_boxes(rows, width, height).tolist()):
+            self.annotation_id += 1
+            separator = ", " if self.annotation_id > 1 else ""
+            box = [round(v, 2) for v in box]
+            self._annotations.write(separator + json.dumps({
+                'id': self.annotation_id, 'image_id': self.image_id, 'category_id': int(cls),
+                'bbox': box, 'area': round(box[2] * box[3], 2), 'iscrowd': 0}))
+
+    def close(self):
+        self._out.write('], "annotations": [')
+        self._annotations.seek(0)
+        shutil.copyfileobj(self._annotations, self._out)
+        self._out.write(']}')
+        self._out.close()
+        self._annotations.close()
+        os.remove(self._annotations.name)
+        os.replace(self._out.name, self.path)
+
+    def abort(self):
+        for f in (self._out, self._annotations):
+            f.close()
+            os.remove(f.name)
+
+
+def read_coco_records(coco_file, names):
+    """Record (file_name, width, height, righe YOLO) di un file COCO; le categorie vengono
+    riportate agli id di data.yaml quando il nome corrisponde."""
+    with open(coco_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    ids_by_name = {v: k for k, v in names.items()}
+    category_map = {c['id']: ids_by_name.get(c['name'], c['id']) for c in data.get('categories', [])}
+    boxes = {}
+    for a in data.get('annotations', []):
+        boxes.setdefault(a['image_id'], []).append((category_map.get(a['category_id'], a['category_id']),)
+                                                   + tuple(a['bbox']))
+    return [(img['file_name'], img['width'], img['height'],
+             pixel_boxes_to_yolo(boxes.get(img['id'], []), img['width'], img['height']))
+            for img in data.get('images', [])]
+
+
+# Processi usati dalla conversione delle label (None = uno per core) e job per invio
+LABEL_CONVERTER_WORKERS = None
+LABEL_CONVERTER_CHUNK = 64
+
+
+class LabelConverter:
+    """Conversione di label tra YOLO, COCO e JSON (un file per immagine).
+
+    Le dimensioni delle immagini arrivano dall'indice dei metadati (se fornito) oppure
+    dalle sole intestazioni; ogni immagine è un job indipendente in un pool di processi. L'output COCO viene scritto in
+    streaming da CocoWriter mentre i risultati arrivano.
+    """
+
+    def __init__(self, image_dir, label_path, output_dir, output_format, names,
+                 output_image_dir=None, workers=LABEL_CONVERTER_WORKERS, metadata=None):
+        self.image_dir = image_dir
+        self.label_path = label_path
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.names = names
+        self.output_image_dir = output_image_dir
+        self.workers = workers
+        self.metadata = metadata
+        self.input_format = None
+        self.cancelled = threading.Event()
+
+    def plan(self):
+        """Restituisce i job da convertire, uno per immagine."""
+        self.input_format = detect_label_format(self.label_path)
+        if self.input_format == "COCO":
+            coco_file = self.label_path
+            if os.path.isdir(coco_file):
+                coco_file = os.path.join(coco_file, next(n for n in os.listdir(coco_file) if n.endswith(".json")))
+            return [("RECORD", record[0], record, None) for record in read_coco_records(coco_file, self.names)]
+        if self.input_format == "JSON":
+            return [("JSON", e.path, self.image_dir, None) for e in os.scandir(self.label_path)
+                    if e.name.endswith(".json") and e.is_file()]
+        images = [e.path for e in os.scandir(self.image_dir)
+                  if os.path.splitext(e.name)[1].lower() in IMAGE_EXTENSIONS and e.is_file()]
+        infos = self.metadata.update(images) if self.metadata else {}
+        jobs = []
+        for path in images:
+            stem = os.path.splitext(os.path.basename(path))[0]
+            info = infos.get(os.path.abspath(path))
+            jobs.append(("YOLO", path, os.path.join(self.label_path, stem + ".txt"),
+                         (info.width, info.height) if info else None))
+        return jobs
+
+    def run(self, jobs, on_done=None):
+        """Converte i job (bloccante); on_done(file_name, error) per ogni immagine."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.output_image_dir:
+            os.makedirs(self.output_image_dir, exist_ok=True)
+        writer = None
+        if self.output_format == "COCO":
+            writer = CocoWriter(os.path.join(self.output_dir, COCO_OUTPUT_NAME), self.names)
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        # Blocchi di job con al massimo due blocchi in volo per processo: i risultati
+        # vengono consumati in ordine mentre il pool continua a lavorare
+        max_in_flight = 2 * (self.workers or os.cpu_count() or 1)
+        pending = deque()
+        try:
+            for start in range(0, len(jobs), LABEL_CONVERTER_CHUNK):
+                if self.cancelled.is_set():
+                    break
+                pending.append(executor.submit(_convert_label_chunk, jobs[start:start + LABEL_CONVERTER_CHUNK],
+                                               self.output_format, self.output_dir, self.names,
+                                               self.output_image_dir, self.image_dir))
+                if len(pending) >= max_in_flight:
+                    self._collect(pending.popleft(), writer, on_done)
+            while pending and not self.cancelled.is_set():
+                self._collect(pending.popleft(), writer, on_done)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        if writer is not None:
+            if self.cancelled.is_set():
+                writer.abort()
+            else:
+                writer.close()
+
+    def _collect(self, future, writer, on_done):
+        for file_name, record, error in future.result():
+            if writer is not None and record is not None:
+                writer.add(*record)
+            if on_done:
+                on_done(file_name, error)
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+def _convert_label_chunk(jobs, output_format, output_dir, names, output_image_dir, image_dir):
+    """Converte un blocco di job; gli errori vengono restituiti per singola immagine."""
+    results = []
+    for job in jobs:
+        try:
+            record = convert_label_job(job, output_format, output_dir, names, output_image_dir, image_dir)
+            results.append((record[0], record if record[3] is not None else None, None))
+        except Exception as e:
+            results.append((os.path.basename(job[1]), None, str(e)))
+    return results
+
+
+# ============================================================
+# Ingestione di immagini (HEIC e altri formati) nella cartella del dataset
+# ============================================================
+INGEST_EXTENSIONS = ('.heic', '.heif', '.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+HEIF_EXTENSIONS = ('.heic', '.heif')
+# Codec di output: formato Pillow -> estensione dei file scritti
+INGEST_CODECS = {'PNG': '.png', 'JPEG': '.jpg', 'WEBP': '.webp'}
+INGEST_WORKERS = None
+# Immagini per blocco di imap_unordered
+INGEST_CHUNK = 4
+
+_heif_registered = None
+
+
+def register_heif_opener():
+    """Registra il decoder HEIF di pillow-heif (facoltativo); False se non è installato."""
+    global _heif_registered
+    if _heif_registered is None:
+        try:
+            import pillow_heif
+        except ImportError:
+            _heif_registered = False
+        else:
+            pillow_heif.register_heif_opener()
+            _heif_registered = True
+    return _heif_registered
+
+
+def is_up_to_date(input_file, output_file):
+    """True se output_file esiste ed è più recente (o coevo) di input_file."""
+    try:
+        return os.stat(output_file).st_mtime_ns >= os.stat(input_file).st_mtime_ns
+    except OSError:
+        return False
+
+
+def ingest_image_file(task):
+    """Converte un'immagine per ImageIngestor (un solo argomento, per imap_unordered).
+
+    task = (input, output, codec, profilo, parametri che sovrascrivono quelli del profilo,
+    lato massimo o None).
+    L'orientamento EXIF viene applicato ai pixel; con max_side i JPEG vengono ridotti già
+    in decodifica (draft) e poi portati al lato massimo con LANCZOS.
+    Restituisce (input, output, None) oppure (input, None, messaggio di errore).
+    """
+    input_file, output_file, codec, profile, params, max_side = task
+    try:
+        if input_file.lower().endswith(HEIF_EXTENSIONS) and not register_heif_opener():
+            raise ValueError("pillow-heif is not installed")
+        with Image.open(input_file) as img:
+            if max_side and max(img.size) > max_side:
+                scale = max_side / max(img.size)
+                img.draft("RGB", (max(1, int(img.width * scale)), max(1, int(img.height * scale))))
+            image = ImageOps.exif_transpose(img)
+        if max_side and max(image.size) > max_side:
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+        if image.mode not in ("RGB", "L") and (codec == 'JPEG' or image.mode not in ("RGBA", "LA")):
+            image = image.convert("RGB")
+        params = dict(params)
+        exif = image.info.get("exif")
+        if exif:
+            params['exif'] = exif
+        atomic_save(image, output_file, format=codec, profile=profile, **params)
+        return input_file, output_file, None
+    except Exception as e:
+        return input_file, None, str(e)
+
+
+class ImageIngestor:
+    """Importa le immagini di una cartella (HEIC, JPEG, PNG, WebP...) in quella del dataset.
+
+    Le immagini vengono convertite in un pool di processi con imap_unordered a blocchi;
+    quelle il cui output esiste già ed è più recente dell'originale vengono saltate,
+    così una nuova importazione della stessa cartella converte solo i file nuovi o
+    modificati. I file HEIC/HEIF richiedono pillow-heif.
+    """
+
+    def __init__(self, input_dir, output_dir, codec='PNG', quality=None, compress_level=None, max_side=None,
+                 workers=INGEST_WORKERS, chunk=INGEST_CHUNK, profile=None):
+        if codec not in INGEST_CODECS:
+            raise ValueError(f"Unsupported output codec: {codec}")
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.codec = codec
+        self.profile = encoder_profile(profile)
+        # quality e compress_level, se indicati, sostituiscono i valori del profilo
+        self.params = {}
+        if quality is not None and codec in ('JPEG', 'WEBP'):
+            self.params['quality'] = quality
+        if compress_level is not None and codec == 'PNG':
+            self.params['compress_level'] = compress_level
+        self.max_side = max_side
+        self.workers = workers
+        self.chunk = chunk
+        self.skipped = 0
+        self.cancelled = threading.Event()
+
+    def plan(self):
+        """Restituisce i task da convertire; self.skipped conta gli output già aggiornati."""
+        extensions = INGEST_EXTENSIONS
+        if not register_heif_opener():
+            logger.warning("pillow-heif is not installed: HEIC/HEIF files are skipped")
+            extensions = tuple(e for e in extensions if e not in HEIF_EXTENSIONS)
+        out_ext = INGEST_CODECS[self.codec]
+        tasks, outputs = [], set()
+        self.skipped = 0
+        for entry in sorted(os.scandir(self.input_dir), key=lambda e: e.name):
+            if not entry.name.lower().endswith(extensions) or not entry.is_file():
+                continue
+            output_file = os.path.join(self.output_dir, os.path.splitext(entry.name)[0] + out_ext)
+            if output_file in outputs:
+                logger.warning("Skipping %s: %s is already produced by another file", entry.name, output_file)
+                continue
+            outputs.add(output_file)
+            if is_up_to_date(entry.path, output_file):
+                self.skipped += 1
+                continue
+            tasks.append((entry.path, output_file, self.codec, self.profile, self.params, self.max_side))
+        return tasks
+
+    def run(self, tasks, on_done=None):
+        """Converte i task (bloccante); on_done(input, output, error) per ogni immagine."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        with multiprocessing.Pool(self.workers, initializer=register_heif_opener) as pool:
+            for input_file, output_file, error in pool.imap_unordered(ingest_image_file, tasks, self.chunk):
+                if on_done:
+                    on_done(input_file, output_file, error)
+                if self.cancelled.is_set():
+                    pool.terminate()
+                    break
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+# ============================================================
+# Journal delle modifiche (undo/redo)
+# ============================================================
+EDIT_JOURNAL_DIR_NAME = ".visualedit_undo"
+# Ogni journal ha una propria sottocartella session-<pid>@<host>-XXXX in EDIT_JOURNAL_DIR_NAME
+EDIT_JOURNAL_SESSION_PREFIX = "session-"
+# Spazio massimo delle copie delle immagini e numero massimo di operazioni annullabili
+EDIT_JOURNAL_MAX_BYTES = 1024 * 1024 * 1024
+EDIT_JOURNAL_MAX_ENTRIES = 200
+# Formati in cui una trasformazione si inverte senza perdita (la ricodifica è esatta)
+LOSSLESS_FORMATS = ('PNG',)
+TRANSFORM_INVERSES = {90: -90, -90: 90, "flip": "flip"}
+
+# image_op: None, ('transform', t) oppure ('snapshot', copia prima, copia dopo);
+# label_diff: None oppure (esisteva prima, esiste dopo, blocchi cambiati)
+JournalEntry = namedtuple('JournalEntry', 'description image_path label_path image_op label_diff size')
+
+
+def transpose_image(image, transform):
+    """Applica una rotazione (+90/-90, in senso orario) o "flip" orizzontale a un'immagine PIL."""
+    if transform == "flip":
+        return image.transpose(Image.FLIP_LEFT_RIGHT)
+    if transform == 90:
+        return image.transpose(Image.ROTATE_270)
+    if transform == -90:
+        return image.transpose(Image.ROTATE_90)
+    return image.rotate(transform, expand=True)
+
+
+def transform_image_file(img_path, transform, profile=None):
+    """Trasforma un'immagine su disco sovrascrivendola in modo atomico."""
+    with Image.open(img_path) as img:
+        img_format = img.format
+        new_image = transpose_image(img, transform)
+    atomic_save(new_image, img_path, format=img_format, profile=profile)
+
+
+def read_label_lines(label_path):
+    """Righe del file di label (con i fine riga), None se il file non esiste."""
+    try:
+        with open(label_path, 'r', encoding='utf-8') as f:
+            return f.read().splitlines(keepends=True)
+    except FileNotFoundError:
+        return None
+
+
+def label_diff(before, after):
+    """Diff tra due versioni di un file di label: solo i blocchi di righe cambiati,
+    come (i1, i2, j1, j2, righe prima, righe dopo)."""
+    before, after = before or [], after or []
+    matcher = difflib.SequenceMatcher(None, before, after, autojunk=False)
+    return [(i1, i2, j1, j2, before[i1:i2], after[j1:j2])
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+
+
+def apply_label_diff(lines, diff, reverse=False):
+    """Applica il diff (o lo annulla con reverse) e restituisce le nuove righe.
+
+    Solleva ValueError se le righe attuali non corrispondono a quelle attese, cioè se il
+    file è stato modificato dopo l'operazione registrata.
+    """
+    lines = list(lines or [])
+    # Dal fondo, così gli indici dei blocchi precedenti restano validi
+    for i1, i2, j1, j2, old, new in reversed(diff):
+        start, end, expected, replacement = (j1, j2, new, old) if reverse else (i1, i2, old, new)
+        if lines[start:end] != expected:
+            raise ValueError("the label file changed after this edit")
+        lines[start:end] = replacement
+    return lines
+
+
+def _write_label_lines(label_path, lines, exists):
+    if not exists:
+        if os.path.exists(label_path):
+            os.remove(label_path)
+        return
+    with open(label_path, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+
+
+class EditJournal:
+    """Undo/redo delle modifiche a immagini e label, con operazioni inverse economiche.
+
+    - rotazioni e flip di immagini in formato senza perdita: si annullano con la
+      trasformazione opposta, senza copie;
+    - le altre modifiche dei pixel (JPEG, scala di grigi, metà risoluzione): copia del file
+      prima e dopo l'operazione. Tutte le scritture sostituiscono il file con os.replace, per
+      cui la copia è un hard link al file originale (nessun byte copiato); se il filesystem
+      non li supporta viene fatta una copia vera. Lo spazio delle copie è limitato a
+      max_bytes: oltre, le operazioni più vecchie non sono più annullabili;
+    - le label: diff delle sole righe cambiate.
+
+    Il journal vale per la sessione: le copie stanno in una sottocartella propria di
+    journal_dir (più viewer o CLI sullo stesso dataset non si toccano), eliminata da
+    close(); all'apertura vengono rimosse solo le sottocartelle di processi terminati.
+    Thread-safe; le operazioni vanno eseguite con i lock delle immagini coinvolte
+    (JobScheduler).
+    """
+
+    def __init__(self, journal_dir, max_bytes=EDIT_JOURNAL_MAX_BYTES, max_entries=EDIT_JOURNAL_MAX_ENTRIES):
+        self.journal_dir = os.path.abspath(journal_dir)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.bytes_used = 0
+        self._undo = []
+        self._redo = []
+        self._counter = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self._remove_stale_sessions()
+        self.snapshot_dir = tempfile.mkdtemp(
+            prefix=f"{EDIT_JOURNAL_SESSION_PREFIX}{os.getpid()}@{socket.gethostname()}-", dir=self.journal_dir)
+        atexit.register(self.close)
+
+    @staticmethod
+    def dir_for(yaml_file):
+        """Cartella dei journal di un dataset: accanto a data.yaml (stesso filesystem delle immagini)."""
+        return os.path.join(os.path.dirname(os.path.abspath(yaml_file)), EDIT_JOURNAL_DIR_NAME)
+
+    @classmethod
+    def for_dataset(cls, yaml_file, **kwargs):
+        return cls(cls.dir_for(yaml_file), **kwargs)
+
+    def _remove_stale_sessions(self):
+        """Elimina le copie lasciate da processi di questo host non più in esecuzione
+        (ad es. dopo un crash) e quelle del vecchio formato, direttamente in journal_dir."""
+        host = socket.gethostname()
+        for entry in os.scandir(self.journal_dir):
+            if entry.is_file() and entry.name[:8].isdigit() and entry.name[8:9] == "_":
+                with contextlib.suppress(OSError):
+                    os.remove(entry.path)
+                continue
+            if not entry.name.startswith(EDIT_JOURNAL_SESSION_PREFIX) or os.name != 'posix':
+                continue  # os.kill(pid, 0) serve solo a verificare il processo su POSIX
+            owner = entry.name[len(EDIT_JOURNAL_SESSION_PREFIX):].rpartition("-")[0]
+            pid, _, session_host = owner.partition("@")
+            if session_host != host or not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError:
+                pass  # Processo esistente di un altro utente
+
+    def close(self):
+        """Elimina le copie di questa sessione; il journal non è più utilizzabile."""
+        with self._lock:
+            self._undo.clear()
+            self._redo.clear()
+            self.bytes_used = 0
+        shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+        with contextlib.suppress(OSError):
+            os.rmdir(self.journal_dir)  # Solo se non ci sono altre sessioni
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def peek_undo(self):
+        """Prossima operazione da annullare (None se non ce ne sono)."""
+        with self._lock:
+            return self._undo[-1] if self._undo else None
+
+    def peek_redo(self):
+        with self._lock:
+            return self._redo[-1] if self._redo else None
+
+    def rename_paths(self, renamed):
+        """Aggiorna le operazioni registrate dopo una rinomina: renamed = {vecchio percorso: nuovo}.
+
+        Va chiamata nello stesso job della rinomina (con i lock dei file coinvolti), così
+        undo/redo successivi agiscono sui file con il nuovo nome.
+        """
+        renamed = {os.path.abspath(old): new for old, new in renamed.items()}
+
+        def remap(entry):
+            image = renamed.get(os.path.abspath(entry.image_path)) if entry.image_path else None
+            label = renamed.get(os.path.abspath(entry.label_path)) if entry.label_path else None
+            if image is None and label is None:
+                return entry
+            return entry._replace(image_path=image or entry.image_path, label_path=label or entry.label_path)
+
+        with self._lock:
+            self._undo = [remap(e) for e in self._undo]
+            self._redo = [remap(e) for e in self._redo]
+
+    @staticmethod
+    def paths(entry):
+        """Immagini e label toccate da un'operazione (per i lock del JobScheduler)."""
+        return tuple(p for p in (entry.image_path, entry.label_path) if p)
+
+    def _snapshot(self, path):
+        with self._lock:
+            self._counter += 1
+            target = os.path.join(self.snapshot_dir, f"{self._counter:08d}_{os.path.basename(path)}")
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copy2(path, target)
+        return target
+
+    @staticmethod
+    def _restore(snapshot, path):
+        """Rimette `snapshot` al posto di `path` (anche qui con un link quando possibile)."""
+        directory, name = os.path.split(os.path.abspath(path))
+        tmp_path = os.path.join(directory, f".{name}.undo.tmp")
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        try:
+            os.link(snapshot, tmp_path)
+        except OSError:
+            shutil.copy2(snapshot, tmp_path)
+        try:
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _discard(entry):
+        if entry.image_op and entry.image_op[0] == 'snapshot':
+            for snapshot in entry.image_op[1:]:
+                with contextlib.suppress(OSError):
+                    os.remove(snapshot)
+
+    @contextlib.contextmanager
+    def recording(self, description, image_path=None, label_path=None, transform=None):
+        """Context manager attorno a un'operazione che modifica image_path e/o label_path.
+
+        Con `transform` (90, -90 o "flip") su un formato senza perdita viene registrata
+        solo la trasformazione inversa; altrimenti, se c'è un'immagine, ne viene copiato
+        lo stato prima e dopo. Se l'operazione solleva un'eccezione non viene registrato nulla.
+        """
+        lossless = (transform in TRANSFORM_INVERSES and image_path is not None
+                    and TILE_FORMATS.get(os.path.splitext(image_path)[1].lower()) in LOSSLESS_FORMATS)
+        before_labels = read_label_lines(label_path) if label_path else None
+        before = self._snapshot(image_path) if image_path and not lossless else None
+        try:
+            yield
+        except BaseException:
+            if before:
+                with contextlib.suppress(OSError):
+                    os.remove(before)
+            raise
+
+        image_op, size = None, 0
+        if lossless:
+            image_op = ('transform', transform)
+        elif before:
+            after = self._snapshot(image_path)
+            image_op = ('snapshot', before, after)
+            size = os.path.getsize(before) + os.path.getsize(after)
+        diff = None
+        if label_path:
+            after_labels = read_label_lines(label_path)
+            if after_labels != before_labels:
+                diff = (before_labels is not None, after_labels is not None,
+                        label_diff(before_labels, after_labels))
+        if image_op is None and diff is None:
+            return  # Nulla è cambiato
+        self._push(JournalEntry(description, image_path, label_path, image_op, diff, size))
+
+    def _push(self, entry):
+        with self._lock:
+            dropped = self._redo
+            self._redo = []
+            self._undo.append(entry)
+            self.bytes_used += entry.size - sum(e.size for e in dropped)
+            # Le operazioni più vecchie escono dal journal per restare nei limiti
+            while self._undo and (len(self._undo) > self.max_entries or self.bytes_used > self.max_bytes):
+                oldest = self._undo.pop(0)
+                self.bytes_used -= oldest.size
+                dropped.append(oldest)
+        for old in dropped:
+            self._discard(old)
+        logger.debug("Journal: %s recorded (%s undoable, %.1f MB of snapshots)",
+                     entry.description, len(self._undo), self.bytes_used / 1e6)
+
+    def _apply(self, entry, reverse):
+        """Annulla (reverse) o ripete un'operazione: tutto o niente.
+
+        Le nuove righe delle label vengono calcolate e verificate prima di toccare
+        l'immagine; se poi la scrittura delle label fallisce, l'immagine torna com'era.
+        """
+        lines = exists = None
+        if entry.label_diff:
+            existed_before, exists_after, diff = entry.label_diff
+            lines = apply_label_diff(read_label_lines(entry.label_path), diff, reverse=reverse)
+            exists = existed_before if reverse else exists_after
+        self._apply_image_op(entry, reverse)
+        if entry.label_diff:
+            try:
+                _write_label_lines(entry.label_path, lines, exists)
+            except BaseException:
+                self._apply_image_op(entry, not reverse)
+                raise
+
+    def _apply_image_op(self, entry, reverse):
+        op = entry.image_op
+        if op and op[0] == 'transform':
+            transform_image_file(entry.image_path, TRANSFORM_INVERSES[op[1]] if reverse else op[1])
+        elif op:
+            self._restore(op[1] if reverse else op[2], entry.image_path)
+
+    def undo(self, expected=None):
+        """Annulla l'ultima operazione e la restituisce (None se non ce ne sono).
+
+        Con `expected` (da peek_undo) solleva RuntimeError se nel frattempo l'ultima
+        operazione è cambiata, così i lock presi per `expected` restano validi.
+        """
+        return self._move(self._undo, self._redo, expected, reverse=True)
+
+    def redo(self, expected=None):
+        """Ripete l'ultima operazione annullata e la restituisce (None se non ce ne sono)."""
+        return self._move(self._redo, self._undo, expected, reverse=False)
+
+    def _move(self, source, target, expected, reverse):
+        with self._lock:
+            if not source:
+                return None
+            if expected is not None and source[-1] is not expected:
+                raise RuntimeError("the edit history changed, try again")
+            entry = source.pop()
+        try:
+            self._apply(entry, reverse)
+        except Exception:
+            with self._lock:
+                source.append(entry)
+            raise
+        with self._lock:
+            target.append(entry)
+        logger.info("%s: %s", "Undo" if reverse else "Redo", entry.description)
+        return entry
+
+
+# ============================================================
+# Esecuzione parallela dei batch (riga di comando)
+# ============================================================
+# Processi (o thread) per i batch; None = uno per core
+BATCH_WORKERS = None
+
+
+def _ignore_sigint():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def run_parallel(func, items, args_for=lambda item: (item,), workers=BATCH_WORKERS, process=True,
+                 cancelled=None):
+    """Esegue func(*args_for(item)) su ogni elemento in un pool di processi (o di thread
+    con process=False) e produce (item, risultato, errore) nell'ordine di completamento.
+
+    Restano in volo al massimo 2 job per worker, così anche elenchi molto lunghi non
+    vengono sottomessi tutti insieme. Se l'Event `cancelled` viene impostato non
+    vengono avviati altri job; quelli già in corso terminano normalmente. I processi
+    worker ignorano SIGINT: l'annullamento passa da `cancelled`.
+    """
+    workers = workers or os.cpu_count() or 1
+    pool_args = {'initializer': _ignore_sigint} if process else {}
+    executor_class = ProcessPoolExecutor if process else ThreadPoolExecutor
+    items = iter(items)
+    exhausted = object()
+    in_flight = {}
+    with executor_class(max_workers=workers, **pool_args) as executor:
+        while True:
+            while len(in_flight) < 2 * workers and not (cancelled and cancelled.is_set()):
+                item = next(items, exhausted)
+                if item is exhausted:
+                    break
+                in_flight[executor.submit(func, *args_for(item))] = item
+            if not in_flight:
+                return
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                error = future.exception()
+                yield item, None if error else future.result(), error